@@ -1,30 +1,342 @@
 import subprocess
 import os
 import shutil
+import threading
+import time
+import wave
+from collections import deque
 
 # --- Configuration ---
 AUDIO_DIR = "audio_files"
+NON_GESTURES = ["NO_HAND", "UNKNOWN", "CONNECTING"]
+CHUNK_SECONDS = 0.02  # PCM is written in chunks this long, so playback can be interrupted between them
 
-def speak_phrase(gesture_label: str):
-    """Plays a pre-recorded WAV file for the given gesture label using aplay."""
-    # Do not play sounds for non-gestures.
-    if gesture_label in ["NO_HAND", "UNKNOWN", "CONNECTING"]:
-        return
+# --- Output Sinks ---
+# A sink is opened once for a PCM format and then receives raw interleaved
+# frames for as long as the server runs, so no per-phrase process spawn or
+# device open sits between a gesture and its first sample.
 
-    try:
+class AlsaSink:
+    """Writes to the default ALSA device through pyalsaaudio, keeping the device open."""
+
+    def __init__(self, device="default"):
+        import alsaaudio
+        self._alsaaudio = alsaaudio
+        self.device = device
+        self.pcm = None
+
+    def open(self, rate, channels, sample_width):
+        alsaaudio = self._alsaaudio
+        formats = {1: alsaaudio.PCM_FORMAT_U8, 2: alsaaudio.PCM_FORMAT_S16_LE, 4: alsaaudio.PCM_FORMAT_S32_LE}
+        self.pcm = alsaaudio.PCM(alsaaudio.PCM_PLAYBACK, device=self.device, channels=channels,
+                                 rate=rate, format=formats[sample_width],
+                                 periodsize=int(rate * CHUNK_SECONDS))
+
+    def write(self, data):
+        self.pcm.write(data)
+
+    def close(self):
+        if self.pcm:
+            self.pcm.close()
+
+class AplayPipeSink:
+    """A single long-lived `aplay` reading raw PCM from stdin, for Pis without pyalsaaudio."""
+
+    def __init__(self):
+        self.process = None
+
+    def open(self, rate, channels, sample_width):
         if not shutil.which("aplay"):
-            print("Player (aplay) not found. This is unexpected on a Pi.")
-            return
-            
-        file_path = os.path.join(AUDIO_DIR, f"{gesture_label}.wav")
-
-        if os.path.exists(file_path):
-            # aplay will now use the system's default device, which we
-            # have configured to be the USB sound card.
-            subprocess.run(["aplay", file_path], check=True,
-                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            raise RuntimeError("Player (aplay) not found. This is unexpected on a Pi.")
+        formats = {1: "U8", 2: "S16_LE", 4: "S32_LE"}
+        # aplay will use the system's default device, which we
+        # have configured to be the USB sound card.
+        self.process = subprocess.Popen(
+            ["aplay", "-q", "-t", "raw", "-f", formats[sample_width], "-r", str(rate), "-c", str(channels), "-"],
+            stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, bufsize=0)
+
+    def write(self, data):
+        self.process.stdin.write(data)
+
+    def close(self):
+        if self.process:
+            self.process.stdin.close()
+            self.process.wait(timeout=2.0)
+
+class NullSink:
+    """Discards audio. With realtime=True it still takes as long as the audio would to play."""
+
+    def __init__(self, realtime=False):
+        self.realtime = realtime
+        self.bytes_per_second = 0
+
+    def open(self, rate, channels, sample_width):
+        self.bytes_per_second = rate * channels * sample_width
+
+    def write(self, data):
+        if self.realtime and self.bytes_per_second:
+            time.sleep(len(data) / self.bytes_per_second)
+
+    def close(self):
+        pass
+
+class FileSink:
+    """Appends raw PCM to a file or named pipe, for tests and for piping into other players."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def open(self, rate, channels, sample_width):
+        self.file = open(self.path, "ab")
+
+    def write(self, data):
+        self.file.write(data)
+        self.file.flush()
+
+    def close(self):
+        if self.file:
+            self.file.close()
+
+def default_sink():
+    """The lowest-latency sink available: pyalsaaudio if installed, otherwise an aplay pipe."""
+    try:
+        return AlsaSink()
+    except ImportError:
+        return AplayPipeSink()
+
+def make_sink(spec):
+    """Creates a sink from a command-line spec: default, alsa, aplay, null or file:PATH."""
+    if spec == "default":
+        return default_sink()
+    if spec == "alsa":
+        return AlsaSink()
+    if spec == "aplay":
+        return AplayPipeSink()
+    if spec == "null":
+        return NullSink(realtime=True)
+    if spec.startswith("file:"):
+        return FileSink(spec[len("file:"):])
+    raise ValueError(f"Unknown audio sink '{spec}'")
+
+# --- Audio Engine ---
+
+class AudioEngine:
+    """
+    Loads every WAV in the audio directory into memory once, or memory-maps a
+    phrase bundle built by audio_bundle.py, and plays them through a single
+    sink that stays open, measuring how long each trigger takes to hand its
+    first sample to the output.
+    """
+
+    def __init__(self, audio_dir=AUDIO_DIR, sink=None, bundle=None):
+        self.clips = {}
+        self.format = None  # (rate, channels, sample_width) shared by every clip
+        self.latencies = []  # trigger-to-first-sample, seconds
+        self._lock = threading.Lock()  # one phrase writes to the sink at a time
+        self._bundle = None
+        if bundle:
+            self._load_bundle(bundle)
         else:
-            print(f"Warning: Audio file not found for gesture '{gesture_label}' at {file_path}")
+            self._load(audio_dir)
+
+        self.sink = sink if sink is not None else default_sink()
+        if self.format:
+            self.sink.open(*self.format)
+
+    def _load(self, audio_dir):
+        if not os.path.isdir(audio_dir):
+            print(f"Warning: Audio directory not found at {audio_dir}")
+            return
+        for name in sorted(os.listdir(audio_dir)):
+            label, ext = os.path.splitext(name)
+            if ext.lower() != ".wav":
+                continue
+            with wave.open(os.path.join(audio_dir, name), "rb") as wav:
+                clip_format = (wav.getframerate(), wav.getnchannels(), wav.getsampwidth())
+                pcm = wav.readframes(wav.getnframes())
+            if self.format is None:
+                self.format = clip_format
+            elif clip_format != self.format:
+                print(f"Warning: Skipping '{name}': format {clip_format} differs from {self.format}")
+                continue
+            self.clips[label] = pcm
+        self._set_format("Loaded")
+
+    def _load_bundle(self, path):
+        from audio_bundle import AudioBundle
+        self._bundle = AudioBundle(path)
+        self.clips = dict(self._bundle.clips)  # zero-copy views into the mapping
+        self.format = self._bundle.format
+        self._set_format(f"Mapped {path}:")
+
+    def _set_format(self, verb):
+        if self.format:
+            rate, channels, sample_width = self.format
+            self.chunk_bytes = int(rate * CHUNK_SECONDS) * channels * sample_width
+            print(f"{verb} {len(self.clips)} phrases ({rate} Hz, {channels} ch, {8 * sample_width}-bit).")
+
+    def play(self, gesture_label, interrupt=None, trigger_time=None):
+        """
+        Plays a phrase, blocking until it has been written to the sink. Stops early
+        if the `interrupt` event gets set. Returns False if there is no such phrase.
+        """
+        pcm = self.clips.get(gesture_label)
+        if pcm is None:
+            print(f"Warning: Audio file not found for gesture '{gesture_label}'")
+            return False
+        trigger_time = time.perf_counter() if trigger_time is None else trigger_time
+
+        with self._lock:
+            view = memoryview(pcm)
+            for start in range(0, len(view), self.chunk_bytes):
+                if interrupt is not None and interrupt.is_set():
+                    break
+                if start == 0:
+                    self.latencies.append(time.perf_counter() - trigger_time)
+                self.sink.write(view[start:start + self.chunk_bytes])
+        return True
+
+    def latency_report(self):
+        """Summarizes trigger-to-first-sample latency in milliseconds."""
+        if not self.latencies:
+            return "No phrases played yet."
+        ms = sorted(1000.0 * t for t in self.latencies)
+        pick = lambda q: ms[min(len(ms) - 1, int(q * len(ms)))]
+        return (f"Trigger-to-first-sample over {len(ms)} phrases: "
+                f"p50 {pick(0.50):.2f} ms, p95 {pick(0.95):.2f} ms, max {ms[-1]:.2f} ms")
+
+    def close(self):
+        self.sink.close()
+        if self._bundle:
+            self.clips = {}
+            self._bundle.close()
+
+# --- Playback Queue ---
+
+def _notify(on_start, start_ns):
+    if on_start is not None:
+        try:
+            on_start(start_ns)
+        except Exception as e:
+            print(f"Error in playback callback: {e}")
+
+class PlaybackQueue:
+    """
+    Plays phrases on a worker thread so that whoever submits them never waits
+    for audio. Policies:
+      - interrupt: "none" queues behind the current phrase, "urgent" lets the
+        labels in `urgent` cut off the current phrase and skip the queue, and
+        "always" does that for every command (latest gesture wins).
+      - coalesce: a label already playing or waiting is not queued again.
+      - max_age: commands that waited longer than this many seconds are
+        dropped instead of being spoken late.
+    A command's optional `on_start` callback is called exactly once from the
+    worker thread: with time.time_ns() when its phrase starts, or with None
+    if it is dropped without playing.
+    """
+
+    def __init__(self, engine, interrupt="urgent", urgent=("PALM", "THREE"), coalesce=True, max_age=1.5):
+        self.engine = engine
+        self.interrupt = interrupt
+        self.urgent = set(urgent)
+        self.coalesce = coalesce
+        self.max_age = max_age
+        self.stats = {"played": 0, "interrupted": 0, "coalesced": 0, "stale": 0}
 
+        self._cond = threading.Condition()
+        self._pending = deque()  # (label, trigger_time, on_start)
+        self._current = None
+        self._stop_current = threading.Event()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="playback", daemon=True)
+        self._worker.start()
+
+    def submit(self, gesture_label, trigger_time=None, on_start=None):
+        """Queues a phrase and returns immediately."""
+        if gesture_label in NON_GESTURES:
+            _notify(on_start, None)
+            return
+        trigger_time = time.perf_counter() if trigger_time is None else trigger_time
+        with self._cond:
+            preempt = self.interrupt == "always" or (self.interrupt == "urgent" and gesture_label in self.urgent)
+            if preempt:
+                for _, _, skipped in self._pending:
+                    _notify(skipped, None)
+                self._pending.clear()
+                if self._current is not None:
+                    self._stop_current.set()
+                    self.stats["interrupted"] += 1
+            elif self.coalesce and (gesture_label == self._current
+                                    or any(label == gesture_label for label, _, _ in self._pending)):
+                self.stats["coalesced"] += 1
+                _notify(on_start, None)
+                return
+            self._pending.append((gesture_label, trigger_time, on_start))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                if self._closed:
+                    return
+                label, trigger_time, on_start = self._pending.popleft()
+                if self.max_age is not None and time.perf_counter() - trigger_time > self.max_age:
+                    self.stats["stale"] += 1
+                    _notify(on_start, None)
+                    continue
+                self._current = label
+                self._stop_current.clear()
+            _notify(on_start, time.time_ns())
+            try:
+                self.engine.play(label, interrupt=self._stop_current, trigger_time=trigger_time)
+                self.stats["played"] += 1
+            except Exception as e:
+                print(f"Error playing audio: {e}")
+            finally:
+                with self._cond:
+                    self._current = None
+
+    def report(self):
+        s = self.stats
+        return (f"Playback: {s['played']} played, {s['interrupted']} interrupted, "
+                f"{s['coalesced']} coalesced, {s['stale']} dropped as stale.")
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            for _, _, skipped in self._pending:
+                _notify(skipped, None)
+            self._pending.clear()
+            self._stop_current.set()
+            self._cond.notify_all()
+        self._worker.join(timeout=2.0)
+
+_engine = None
+
+def start_engine(audio_dir=AUDIO_DIR, sink=None, bundle=None):
+    """Creates the shared engine up front, so all phrases are loaded before the first command."""
+    global _engine
+    _engine = AudioEngine(audio_dir, sink, bundle)
+    return _engine
+
+def get_engine():
+    """The shared engine, created on first use if start_engine was not called."""
+    if _engine is None:
+        start_engine()
+    return _engine
+
+def speak_phrase(gesture_label: str, trigger_time=None):
+    """
+    Plays the pre-loaded phrase for the given gesture label. `trigger_time` is
+    the time.perf_counter() at which the command arrived, for latency reporting.
+    """
+    # Do not play sounds for non-gestures.
+    if gesture_label in NON_GESTURES:
+        return
+
+    try:
+        get_engine().play(gesture_label, trigger_time=trigger_time)
     except Exception as e:
-        print(f"Error playing audio file with aplay: {e}")
+        print(f"Error playing audio: {e}")
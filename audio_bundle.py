@@ -0,0 +1,277 @@
+# audio_bundle.py
+"""
+Single-file bundle of every gesture phrase, converted ahead of time to the
+output device's native PCM format so the Pi never resamples or mixes at play
+time. The audio server memory-maps the bundle at startup and plays straight
+out of the mapping.
+
+File layout (little-endian):
+    header   HEADER: magic, version, number of entries, offset of the PCM data
+    index    one ENTRY per phrase: label, offset, length in bytes, rate,
+             channels, sample width
+    data     each phrase's raw interleaved PCM, starting on a PAGE boundary
+
+The builder reads generate_audio.py's WAVs, trims leading and trailing
+silence, peak-normalizes every phrase to the same level, converts to the
+target format, and refuses to write a bundle that is missing one of the
+keyboard panel's gestures (command_protocol.KEY_GESTURES).
+
+    python3 audio_bundle.py audio_files --output phrases.bundle --rate 48000 --channels 2
+    python3 audio_bundle.py --info phrases.bundle
+"""
+import argparse
+import mmap
+import os
+import struct
+import wave
+
+from command_protocol import KEY_GESTURES
+
+# --- File Format ---
+MAGIC = b"SOYLEAB\0"
+VERSION = 1
+HEADER = struct.Struct("<8sHHI")                # magic, version, entry count, data offset
+LABEL_BYTES = 24
+ENTRY = struct.Struct(f"<{LABEL_BYTES}sQQIHH")  # label, offset, length, rate, channels, sample width
+PAGE = 4096                                     # phrases start on page boundaries
+
+# --- Builder Defaults ---
+BUNDLE_PATH = "phrases.bundle"
+DEFAULT_RATE = 48000      # what most USB sound cards run at natively
+DEFAULT_CHANNELS = 2
+DEFAULT_SAMPLE_WIDTH = 2
+PEAK_DB = -1.0            # every phrase is scaled so its loudest sample sits here
+SILENCE_DB = -45.0        # leading and trailing audio quieter than this is trimmed
+EDGE_SECONDS = 0.005      # fade in/out applied after trimming, against clicks
+
+class AudioBundle:
+    """
+    A memory-mapped bundle. `clips` maps each label to a read-only memoryview
+    of its PCM inside the mapping, and `format` is the (rate, channels,
+    sample_width) all of them share.
+    """
+
+    def __init__(self, path, prefault=True):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self.format, self.index = self._read_index()
+        except Exception:
+            self._mmap.close()
+            raise
+        self._view = memoryview(self._mmap)
+        self.clips = {label: self._view[offset:offset + length] for label, (offset, length) in self.index.items()}
+        if prefault:
+            self._prefault()
+
+    def _read_index(self):
+        data = self._mmap
+        if len(data) < HEADER.size:
+            raise ValueError(f"{self.path} is not an audio bundle (file too short)")
+        magic, version, count, data_offset = HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not an audio bundle (bad magic)")
+        if version != VERSION:
+            raise ValueError(f"{self.path}: unsupported bundle format v{version}")
+        if HEADER.size + count * ENTRY.size > data_offset:
+            raise ValueError(f"{self.path}: index overlaps the audio data")
+
+        bundle_format, index = None, {}
+        for i in range(count):
+            raw_label, offset, length, rate, channels, sample_width = ENTRY.unpack_from(data, HEADER.size + i * ENTRY.size)
+            label = raw_label.rstrip(b"\0").decode("ascii")
+            if offset < data_offset or offset + length > len(data):
+                raise ValueError(f"{self.path}: phrase '{label}' lies outside the file")
+            if length % (channels * sample_width):
+                raise ValueError(f"{self.path}: phrase '{label}' ends mid-frame")
+            clip_format = (rate, channels, sample_width)
+            if bundle_format is None:
+                bundle_format = clip_format
+            elif clip_format != bundle_format:
+                raise ValueError(f"{self.path}: phrase '{label}' is {clip_format}, the others {bundle_format}")
+            index[label] = (offset, length)
+        return bundle_format, index
+
+    def _prefault(self):
+        """Asks the kernel for the whole file and touches every page, so the first play does not wait on the disk."""
+        if hasattr(self._mmap, "madvise") and hasattr(mmap, "MADV_WILLNEED"):
+            self._mmap.madvise(mmap.MADV_WILLNEED)
+        data = self._mmap
+        for offset in range(0, len(data), PAGE):
+            data[offset]
+
+    @property
+    def size(self):
+        return len(self._mmap)
+
+    def close(self):
+        for view in self.clips.values():
+            view.release()
+        self.clips = {}
+        self._view.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# --- Builder ---
+
+def read_wav(path):
+    """Reads a WAV into a float32 (frames, channels) array in [-1, 1] and its rate."""
+    import numpy as np
+    with wave.open(path, "rb") as wav:
+        rate, channels, sample_width = wav.getframerate(), wav.getnchannels(), wav.getsampwidth()
+        raw = wav.readframes(wav.getnframes())
+    if sample_width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif sample_width in (2, 4):
+        dtype = "<i2" if sample_width == 2 else "<i4"
+        samples = np.frombuffer(raw, dtype=dtype).astype(np.float32) / float(2 ** (8 * sample_width - 1))
+    else:
+        raise ValueError(f"{path}: unsupported sample width {sample_width}")
+    return samples.reshape(-1, channels), rate
+
+def convert(samples, rate, out_rate, out_channels, trim=True, peak_db=PEAK_DB):
+    """
+    Trims silence from both ends, mixes to `out_channels`, resamples to
+    `out_rate` and peak-normalizes. Returns float32 (frames, out_channels).
+    """
+    import numpy as np
+    if trim and len(samples):
+        loud = np.flatnonzero(np.abs(samples).max(axis=1) >= 10.0 ** (SILENCE_DB / 20.0))
+        if len(loud):
+            pad = int(EDGE_SECONDS * rate)
+            samples = samples[max(loud[0] - pad, 0):loud[-1] + pad + 1]
+
+    if samples.shape[1] != out_channels:
+        mono = samples.mean(axis=1, keepdims=True)
+        samples = np.repeat(mono, out_channels, axis=1)
+
+    if rate != out_rate and len(samples):
+        # Band-limited resampling through the spectrum: exact for short clips, no aliasing.
+        frames = len(samples)
+        out_frames = max(int(round(frames * out_rate / rate)), 1)
+        spectrum = np.fft.rfft(samples, axis=0)
+        bins = out_frames // 2 + 1
+        if bins <= len(spectrum):
+            spectrum = spectrum[:bins]
+        else:
+            spectrum = np.concatenate([spectrum, np.zeros((bins - len(spectrum), samples.shape[1]), spectrum.dtype)])
+        samples = (np.fft.irfft(spectrum, n=out_frames, axis=0) * (out_frames / frames)).astype(np.float32)
+
+    samples = np.array(samples, dtype=np.float32)
+    fade = min(int(EDGE_SECONDS * out_rate), len(samples) // 2)
+    if fade:
+        ramp = np.linspace(0.0, 1.0, fade, dtype=np.float32)[:, None]
+        samples[:fade] *= ramp
+        samples[-fade:] *= ramp[::-1]
+
+    peak = float(np.abs(samples).max()) if len(samples) else 0.0
+    if peak_db is not None and peak > 0:
+        samples *= 10.0 ** (peak_db / 20.0) / peak
+    return samples
+
+def to_pcm(samples, sample_width):
+    """Quantizes float samples to interleaved little-endian PCM bytes."""
+    import numpy as np
+    samples = np.clip(samples, -1.0, 1.0)
+    if sample_width == 1:
+        return np.round(samples * 127.0 + 128.0).astype(np.uint8).tobytes()
+    scale = float(2 ** (8 * sample_width - 1) - 1)
+    dtype = "<i2" if sample_width == 2 else "<i4"
+    return np.round(samples.astype(np.float64) * scale).astype(dtype).tobytes()
+
+def required_gestures():
+    """The gestures the keyboard panel can send; every bundle must be able to speak them."""
+    return list(KEY_GESTURES)
+
+def build_bundle(audio_dir, path, rate=DEFAULT_RATE, channels=DEFAULT_CHANNELS,
+                 sample_width=DEFAULT_SAMPLE_WIDTH, trim=True, peak_db=PEAK_DB, required=None):
+    """
+    Converts every WAV in `audio_dir` and writes them as one bundle. Raises
+    ValueError before writing anything if a gesture in `required` (KEY_GESTURES
+    by default) has no WAV. Returns {label: (seconds before, seconds after)}.
+    """
+    if sample_width not in (1, 2, 4):
+        raise ValueError(f"Unsupported sample width {sample_width}")
+    names = sorted(name for name in os.listdir(audio_dir) if name.lower().endswith(".wav"))
+    labels = [os.path.splitext(name)[0] for name in names]
+    required = required_gestures() if required is None else required
+    missing = [gesture for gesture in required if gesture not in labels]
+    if missing:
+        raise ValueError(f"{audio_dir} has no phrase for: {', '.join(missing)}")
+    for label in labels:
+        if len(label.encode("ascii")) > LABEL_BYTES:
+            raise ValueError(f"Label '{label}' is too long for the bundle index")
+
+    clips, summary = [], {}
+    for label, name in zip(labels, names):
+        samples, source_rate = read_wav(os.path.join(audio_dir, name))
+        converted = convert(samples, source_rate, rate, channels, trim=trim, peak_db=peak_db)
+        clips.append((label, to_pcm(converted, sample_width)))
+        summary[label] = (len(samples) / source_rate, len(converted) / rate)
+
+    align = lambda n: -(-n // PAGE) * PAGE
+    data_offset = align(HEADER.size + len(clips) * ENTRY.size)
+    entries, offset = [], data_offset
+    for label, pcm in clips:
+        entries.append(ENTRY.pack(label.encode("ascii"), offset, len(pcm), rate, channels, sample_width))
+        offset = align(offset + len(pcm))
+
+    # Written aside and renamed, so a server starting meanwhile never maps half a bundle.
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(clips), data_offset))
+        f.writelines(entries)
+        for (_, pcm), entry in zip(clips, entries):
+            f.seek(ENTRY.unpack(entry)[1])
+            f.write(pcm)
+    os.replace(tmp_path, path)
+    return summary
+
+def print_info(path):
+    with AudioBundle(path, prefault=False) as bundle:
+        rate, channels, sample_width = bundle.format or (0, 0, 0)
+        print(f"{path}: {len(bundle.clips)} phrases, {rate} Hz, {channels} ch, "
+              f"{8 * sample_width}-bit, {bundle.size / 1024:.0f} KiB")
+        bytes_per_second = rate * channels * sample_width or 1
+        for label, (offset, length) in bundle.index.items():
+            print(f"  {label:<12} offset {offset:>9}  {length:>9} bytes  {length / bytes_per_second:5.2f}s")
+        missing = [gesture for gesture in required_gestures() if gesture not in bundle.clips]
+        if missing:
+            print(f"Warning: no phrase for {', '.join(missing)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a memory-mapped phrase bundle for the audio server.")
+    parser.add_argument('audio_dir', nargs='?', default='audio_files', help='Directory of WAVs from generate_audio.py.')
+    parser.add_argument('--output', default=BUNDLE_PATH, help='Bundle file to write.')
+    parser.add_argument('--rate', type=int, default=DEFAULT_RATE,
+                        help="Sample rate of the Pi's output device (see `aplay --dump-hw-params`).")
+    parser.add_argument('--channels', type=int, default=DEFAULT_CHANNELS, help='Channel count of the output device.')
+    parser.add_argument('--sample-width', type=int, choices=[1, 2, 4], default=DEFAULT_SAMPLE_WIDTH,
+                        help='Bytes per sample.')
+    parser.add_argument('--peak-db', type=float, default=PEAK_DB, help='Level every phrase is normalized to, in dBFS.')
+    parser.add_argument('--no-trim', action='store_true', help='Keep leading and trailing silence.')
+    parser.add_argument('--info', metavar='BUNDLE', help='Print the index of an existing bundle and exit.')
+    args = parser.parse_args()
+
+    if args.info:
+        print_info(args.info)
+        return
+
+    try:
+        summary = build_bundle(args.audio_dir, args.output, args.rate, args.channels, args.sample_width,
+                               trim=not args.no_trim, peak_db=args.peak_db)
+    except ValueError as e:
+        parser.exit(1, f"Error: {e}\n")
+    for label, (before, after) in summary.items():
+        print(f"  {label:<12} {before:5.2f}s -> {after:5.2f}s")
+    print(f"Wrote {len(summary)} phrases ({args.rate} Hz, {args.channels} ch, {8 * args.sample_width}-bit) "
+          f"to {args.output} ({os.path.getsize(args.output) / 1024:.0f} KiB)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+# benchmark.py
+"""
+Per-stage latency benchmark for the camera-to-speech pipeline.
+
+Drives the real client stages (frame receive, JPEG decode, colour conversion,
+hand tracking, classification, drawing and the audio command send) from
+`video.mov` or a landmark recording, with loopback stand-ins for the two Pi
+servers, and reports throughput and p50/p95/p99 latency per stage.
+
+    python3 benchmark.py --video video.mov --output bench.json
+    python3 benchmark.py --landmarks session.lmk --baseline bench.json
+"""
+import argparse
+import json
+import platform
+import socket
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+import simplejpeg
+
+from gestures import classify_gesture
+from drawing import draw_ui, draw_landmarks, hands_result, DebugDashboard
+from landmark_log import read_landmarks, iter_frames, to_pixels
+from landmark_packets import HANDEDNESS_LABELS
+from stream_client import FrameReader, FrameDecoder
+from command_client import CommandClient
+from command_protocol import read_command, encode_sync_reply, SyncRequest
+from motion_gate import MotionGate
+
+# --- Stage Timing ---
+
+class StageTimer:
+    """Collects per-stage wall-clock samples in seconds."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples[stage].append(time.perf_counter() - start)
+
+    def add(self, stage, seconds):
+        self.samples[stage].append(seconds)
+
+    def summary(self):
+        stages = {}
+        for stage, samples in self.samples.items():
+            ms = np.asarray(samples) * 1000.0
+            total_s = ms.sum() / 1000.0
+            stages[stage] = {
+                "count": int(ms.size),
+                "mean_ms": float(ms.mean()),
+                "p50_ms": float(np.percentile(ms, 50)),
+                "p95_ms": float(np.percentile(ms, 95)),
+                "p99_ms": float(np.percentile(ms, 99)),
+                "max_ms": float(ms.max()),
+                "throughput_per_s": float(ms.size / total_s) if total_s > 0 else 0.0,
+            }
+        return stages
+
+# --- Loopback Stand-ins for the Pi Servers ---
+
+def _listen():
+    server = socket.socket()
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(("127.0.0.1", 0))
+    server.listen(1)
+    return server
+
+class LoopbackVideoServer(threading.Thread):
+    """Serves pre-encoded JPEGs with the video_stream_server framing, then closes."""
+
+    def __init__(self, jpegs):
+        super().__init__(daemon=True)
+        self.jpegs = jpegs
+        self.server = _listen()
+        self.address = self.server.getsockname()
+
+    def run(self):
+        conn, _ = self.server.accept()
+        with conn:
+            try:
+                for jpeg in self.jpegs:
+                    conn.sendall(len(jpeg).to_bytes(4, 'big'))
+                    conn.sendall(jpeg)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+        self.server.close()
+
+class LoopbackAudioServer(threading.Thread):
+    """Reads stream_server commands and stamps their arrival instead of playing audio; answers heartbeats."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.server = _listen()
+        self.address = self.server.getsockname()
+        self.received = []  # (perf_counter at arrival, label)
+
+    def run(self):
+        conn, _ = self.server.accept()
+
+        def recv_exactly(n):
+            data = b''
+            while len(data) < n:
+                chunk = conn.recv(n - len(data))
+                if not chunk:
+                    return None
+                data += chunk
+            return data
+
+        with conn:
+            while True:
+                command = read_command(recv_exactly)
+                if command is None:
+                    break
+                if isinstance(command, SyncRequest):
+                    conn.sendall(encode_sync_reply(command, time.time_ns()))
+                    continue
+                self.received.append((time.perf_counter(), command.label))
+        self.server.close()
+
+# --- Frame Sources ---
+
+def load_video_jpegs(path, max_frames, size, quality=80):
+    """Reads frames from a video file and encodes them as the Pi would."""
+    cap = cv2.VideoCapture(path)
+    jpegs = []
+    while cap.isOpened() and len(jpegs) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if size:
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        jpegs.append(simplejpeg.encode_jpeg(frame, quality=quality, colorspace='BGR', fastdct=True))
+    cap.release()
+    if not jpegs:
+        raise ValueError(f"No frames could be read from {path}")
+    return jpegs
+
+def result_from_records(frame_records):
+    """Rebuilds a MediaPipe-style Hands result from recorded landmarks, for the drawing stages."""
+    hands = frame_records[frame_records["hand_index"] >= 0]
+    return hands_result([(record["landmarks"], HANDEDNESS_LABELS.get(int(record["handedness"])),
+                          float(record["score"])) for record in hands])
+
+# --- Benchmark Runs ---
+
+def _send_timed(timer, audio, label, sent_at):
+    start = time.perf_counter()
+    audio.send(label)
+    timer.add("send", time.perf_counter() - start)
+    sent_at.append(start)
+
+def _add_delivery(timer, audio_server, sent_at, timeout=2.0):
+    deadline = time.perf_counter() + timeout
+    while len(audio_server.received) < len(sent_at) and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    for start, (arrived, _) in zip(sent_at, audio_server.received):
+        timer.add("deliver", arrived - start)
+
+def bench_video(timer, jpegs, send_every_frame, labels=None, gate=None):
+    import mediapipe as mp
+    hands = mp.solutions.hands.Hands(
+        static_image_mode=False, max_num_hands=1,
+        min_detection_confidence=0.6, min_tracking_confidence=0.6
+    )
+    dashboard = DebugDashboard()
+    video_server = LoopbackVideoServer(jpegs)
+    audio_server = LoopbackAudioServer()
+    video_server.start()
+    audio_server.start()
+
+    sent_at = []
+    last_sent_label = None
+    detection = None
+    frames = 0
+    cpu_start = time.process_time()
+    with socket.socket() as video_socket, CommandClient(*audio_server.address) as audio:
+        video_socket.connect(video_server.address)
+        audio.wait_connected(timeout=2.0)
+        reader = FrameReader(video_socket)
+        decoder = FrameDecoder()
+        start = time.perf_counter()
+        while True:
+            frame_start = time.perf_counter()
+            with timer.time("receive"):
+                jpeg_buffer = reader.read()
+            if jpeg_buffer is None:
+                break
+            with timer.time("decode"):
+                frame = decoder.decode(jpeg_buffer)
+            skip = False
+            if gate is not None:
+                with timer.time("motion_gate"):
+                    now = time.perf_counter()
+                    skip = not gate.check(frame, now) and detection is not None
+            if skip:
+                res, label, debug_info = detection
+            else:
+                with timer.time("cvtColor"):
+                    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                with timer.time("hands.process"):
+                    res = hands.process(frame_rgb)
+
+                h, w = frame.shape[:2]
+                if res.multi_hand_landmarks:
+                    with timer.time("classify"):
+                        lm = [(int(p.x * w), int(p.y * h)) for p in res.multi_hand_landmarks[0].landmark]
+                        label, debug_info = classify_gesture(lm)
+                else:
+                    label, debug_info = "NO_HAND", {}
+                detection = res, label, debug_info
+                if gate is not None:
+                    gate.ran(now, bool(res.multi_hand_landmarks))
+            if labels is not None:
+                labels.append(label)
+
+            if label != "UNKNOWN" and (send_every_frame or label != last_sent_label):
+                _send_timed(timer, audio, label, sent_at)
+                last_sent_label = label
+
+            with timer.time("draw_ui"):
+                draw_ui(frame, label)
+            with timer.time("draw_landmarks"):
+                draw_landmarks(frame, res.multi_hand_landmarks)
+            with timer.time("dashboard"):
+                dashboard.render(frame, res, debug_info)
+            timer.add("frame_total", time.perf_counter() - frame_start)
+            frames += 1
+        elapsed = time.perf_counter() - start
+
+    audio_server.join(timeout=2.0)
+    _add_delivery(timer, audio_server, sent_at)
+    if gate is not None:
+        print(gate.report())
+    print(f"Client CPU time: {1000.0 * (time.process_time() - cpu_start) / max(frames, 1):.2f} ms per frame.")
+    hands.close()
+    return frames, elapsed
+
+def bench_landmarks(timer, records, send_every_frame):
+    dashboard = DebugDashboard()
+    audio_server = LoopbackAudioServer()
+    audio_server.start()
+
+    sent_at = []
+    last_sent_label = None
+    frames = 0
+    with CommandClient(*audio_server.address) as audio:
+        audio.wait_connected(timeout=2.0)
+        start = time.perf_counter()
+        for _, frame_records in iter_frames(records):
+            frame_start = time.perf_counter()
+            first = frame_records[0]
+            if first["hand_index"] >= 0:
+                with timer.time("classify"):
+                    label, debug_info = classify_gesture(to_pixels(first))
+            else:
+                label, debug_info = "NO_HAND", {}
+
+            if label != "UNKNOWN" and (send_every_frame or label != last_sent_label):
+                _send_timed(timer, audio, label, sent_at)
+                last_sent_label = label
+
+            frame = np.zeros((int(first["height"]), int(first["width"]), 3), dtype=np.uint8)
+            res = result_from_records(frame_records)
+            with timer.time("draw_ui"):
+                draw_ui(frame, label)
+            with timer.time("draw_landmarks"):
+                draw_landmarks(frame, res.multi_hand_landmarks)
+            with timer.time("dashboard"):
+                dashboard.render(frame, res, debug_info)
+            timer.add("frame_total", time.perf_counter() - frame_start)
+            frames += 1
+        elapsed = time.perf_counter() - start
+
+    audio_server.join(timeout=2.0)
+    _add_delivery(timer, audio_server, sent_at)
+    return frames, elapsed
+
+# --- Reporting ---
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_report(results, baseline=None):
+    print(f"\n{results['frames']} frames in {results['elapsed_s']:.2f}s ({results['fps']:.1f} fps)")
+    header = f"{'stage':<16}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ops/s':>10}"
+    if baseline:
+        header += f"{'p50 vs base':>14}"
+    print(header)
+    for stage, s in results["stages"].items():
+        line = (f"{stage:<16}{s['count']:>7}{s['p50_ms']:>10.3f}{s['p95_ms']:>10.3f}"
+                f"{s['p99_ms']:>10.3f}{s['throughput_per_s']:>10.1f}")
+        base = baseline["stages"].get(stage) if baseline else None
+        if base and base["p50_ms"] > 0:
+            line += f"{(s['p50_ms'] / base['p50_ms'] - 1) * 100:>+13.1f}%"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage latency benchmark for the Soyle pipeline.")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--video', default='video.mov', help='Video file to stream through the full pipeline.')
+    source.add_argument('--landmarks', help='Landmark recording to replay (skips decode and hand tracking).')
+    parser.add_argument('--frames', type=int, default=300, help='Maximum number of video frames to use.')
+    parser.add_argument('--size', default='640x480', help="Frame size the Pi streams, or 'native'.")
+    parser.add_argument('--send-every-frame', action='store_true',
+                        help='Send a command on every labelled frame, not only on label changes.')
+    parser.add_argument('--motion-gate', action='store_true',
+                        help='Skip hand tracking on static frames (stream_client.py --motion-gate) for --video runs.')
+    parser.add_argument('--output', help='Write results to this JSON file.')
+    parser.add_argument('--baseline', help='Compare against a previous JSON result.')
+    args = parser.parse_args()
+
+    timer = StageTimer()
+    labels = []
+    if args.landmarks:
+        source_name = args.landmarks
+        frames, elapsed = bench_landmarks(timer, read_landmarks(args.landmarks), args.send_every_frame)
+    else:
+        source_name = args.video
+        size = None if args.size == 'native' else tuple(int(v) for v in args.size.split('x'))
+        print(f"Encoding up to {args.frames} frames from {args.video}...")
+        jpegs = load_video_jpegs(args.video, args.frames, size)
+        gate = MotionGate() if args.motion_gate else None
+        frames, elapsed = bench_video(timer, jpegs, args.send_every_frame, labels=labels, gate=gate)
+
+    results = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "source": source_name,
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "motion_gate": bool(args.motion_gate and not args.landmarks),
+        },
+        "frames": frames,
+        "elapsed_s": elapsed,
+        "fps": frames / elapsed if elapsed > 0 else 0.0,
+        "stages": timer.summary(),
+        "labels": labels,
+    }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+    if baseline and labels and baseline.get("labels"):
+        same = sum(a == b for a, b in zip(labels, baseline["labels"]))
+        print(f"Labels match the baseline on {same} of {min(len(labels), len(baseline['labels']))} frames.")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+# command_client.py
+"""
+The controllers' connection to the audio server, shared by keyboard_client,
+input_client and stream_client.
+
+A CommandClient keeps one connection open from a background thread, with
+TCP_NODELAY and TCP keepalive set, and reconnects with short, capped
+exponential backoff whenever it drops. Sending never waits for the network:
+while the link is down, commands wait in a small bounded outbox and go out
+on reconnect, unless they are older than `max_age` by then.
+
+Dead links are found with heartbeats. Every `heartbeat` seconds the client
+sends a clock SYNC request, which the server answers at once; no reply for
+`dead_after` seconds drops the connection and starts a reconnect, long before
+TCP itself would notice a Wi-Fi link that went away. The server reads a
+connection in order, so a SYNC reply also confirms every command sent before
+its request. Commands still unconfirmed when a link dies are sent again on the
+next connection, byte for byte: the server may have received them after all,
+and recognizes a repeat by its unchanged sequence number and send time.
+"""
+import random
+import socket
+import threading
+import time
+from collections import deque
+
+from command_protocol import (ACK, ACK_MAGIC, SYNC, SYNC_MAGIC, SYNC_REPLY, VERSION,
+                              configure_socket, encode_command, estimate_clock_offset)
+
+# --- Defaults ---
+HEARTBEAT_INTERVAL = 0.25  # seconds between SYNC requests
+DEAD_AFTER = 1.0           # seconds without any reply before the link counts as dead
+CONNECT_TIMEOUT = 1.0
+BACKOFF_MIN = 0.05         # first retry delay; doubles per failed attempt
+BACKOFF_MAX = 0.5
+OUTBOX_SIZE = 8            # commands kept while disconnected; the oldest go first
+MAX_AGE = 3.0              # queued commands older than this are dropped, not spoken late
+
+# --- Connection States ---
+CONNECTING = "connecting"
+CONNECTED = "connected"
+RECONNECTING = "reconnecting"
+CLOSED = "closed"
+
+def configure_link(sock, dead_after=DEAD_AFTER):
+    """
+    TCP_NODELAY, plus keepalive and (on Linux) a user timeout, so the kernel
+    also gives up on a dead peer within seconds instead of the default minutes.
+    """
+    configure_socket(sock)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    idle = max(int(dead_after), 1)
+    options = [("TCP_KEEPIDLE", idle), ("TCP_KEEPALIVE", idle),  # Linux, macOS names of the same option
+               ("TCP_KEEPINTVL", 1), ("TCP_KEEPCNT", 3),
+               ("TCP_USER_TIMEOUT", int(3000 * dead_after))]
+    for name, value in options:
+        if hasattr(socket, name):
+            try:
+                sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, name), value)
+            except OSError:
+                pass
+
+class CommandClient:
+    """
+    A self-healing command connection to one audio server. Call start(), then
+    send() from any thread; state and status() describe the link for UIs.
+    With clock_sync, the clock offset to the server is measured on every
+    connect and kept in `clock_offset` (ns) for latency traces.
+    """
+
+    def __init__(self, host, port=8485, heartbeat=HEARTBEAT_INTERVAL, dead_after=DEAD_AFTER,
+                 outbox_size=OUTBOX_SIZE, max_age=MAX_AGE, clock_sync=False, on_state=None, name="Audio"):
+        self.host, self.port = host, port
+        self.heartbeat = heartbeat
+        self.dead_after = dead_after
+        self.max_age = max_age
+        self.clock_sync = clock_sync
+        self.on_state = on_state
+        self.name = name
+        self.state = CONNECTING
+        self.clock_offset = None
+        self.rtt = None  # seconds, from the latest heartbeat
+        self.outages = []  # seconds each lost connection took to come back
+        self.stats = {"connects": 0, "sent": 0, "queued": 0, "resent": 0, "stale": 0, "overflow": 0}
+
+        self._lock = threading.Lock()  # guards the socket, outbox and unconfirmed commands
+        self._confirmed = threading.Condition(self._lock)
+        self._sock = None
+        self._outbox = deque(maxlen=outbox_size)  # (label, trace, queued_at, encoded command or None)
+        self._unconfirmed = deque()               # (label, trace, queued_at, encoded, first heartbeat after it)
+        self._ping = 0
+        self._down_since = None
+        self._connected = threading.Event()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"{name.lower()}-link", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    @property
+    def connected(self):
+        return self._connected.is_set()
+
+    def wait_connected(self, timeout=None):
+        """Blocks until the link is up. Returns False on timeout."""
+        return self._connected.wait(timeout)
+
+    def status(self):
+        """A one-line description of the link for UIs."""
+        if self.state == CONNECTED:
+            return f"Connected to {self.host}"
+        if self.state == CLOSED:
+            return "Disconnected"
+        return f"{self.state.capitalize()} to {self.host}..."
+
+    # --- Sending ---
+
+    def send(self, gesture_label, trace=None):
+        """
+        Sends a command. Returns True if it went out now, False if it was queued
+        until the link is back (or there was no label).
+        """
+        if not gesture_label:
+            return False
+        entry = (gesture_label, trace, time.monotonic(), None)
+        with self._lock:
+            if self._sock is not None:
+                try:
+                    self._transmit(entry)
+                    return True
+                except OSError:
+                    self._abort()  # the link thread sees it, requeues and reconnects
+            if len(self._outbox) == self._outbox.maxlen:
+                self.stats["overflow"] += 1
+            self._outbox.append(entry)
+            self.stats["queued"] += 1
+            return False
+
+    def _transmit(self, entry):
+        label, trace, queued_at, data = entry
+        if data is None:
+            # Encoded once, on first transmission: a resend is the same command, not a new one.
+            data = encode_command(label, trace=trace)
+        self._sock.sendall(data)
+        self._unconfirmed.append((label, trace, queued_at, data, self._ping))
+        self.stats["sent"] += 1
+
+    def _abort(self):
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _flush(self):
+        """Sends what queued up while disconnected, oldest first, dropping stale commands."""
+        now = time.monotonic()
+        while self._outbox:
+            entry = self._outbox.popleft()
+            if self.max_age is not None and now - entry[2] > self.max_age:
+                self.stats["stale"] += 1
+                continue
+            try:
+                self._transmit(entry)
+            except OSError:
+                self._outbox.appendleft(entry)
+                raise
+
+    def _requeue(self):
+        """Puts commands the server never confirmed back in front of the outbox."""
+        resend = [entry[:4] for entry in self._unconfirmed]
+        self._unconfirmed.clear()
+        self.stats["resent"] += len(resend)
+        self._outbox = deque(resend + list(self._outbox), maxlen=self._outbox.maxlen)
+
+    # --- Link Thread ---
+
+    def _set_state(self, state):
+        if state == self.state:
+            return
+        self.state = state
+        if self.on_state:
+            try:
+                self.on_state(state)
+            except Exception as e:
+                print(f"Error in connection state callback: {e}")
+
+    def _run(self):
+        backoff = BACKOFF_MIN
+        while not self._closed.is_set():
+            sock = None
+            try:
+                sock = socket.create_connection((self.host, self.port), timeout=CONNECT_TIMEOUT)
+                self._serve(sock)
+            except (OSError, ValueError) as e:
+                if self.connected and not self._closed.is_set():
+                    print(f"{self.name} server connection lost ({e}); reconnecting...")
+            finally:
+                if sock is not None:
+                    sock.close()
+            if self.connected:
+                with self._lock:
+                    self._sock = None
+                    if not self._closed.is_set():
+                        self._requeue()
+                    self._confirmed.notify_all()
+                self._connected.clear()
+                backoff = BACKOFF_MIN
+                if not self._closed.is_set():
+                    self._down_since = time.monotonic()
+                    self._set_state(RECONNECTING)
+            else:
+                # Jittered, so several controllers do not retry in lockstep after a Pi reboot.
+                self._closed.wait(backoff * random.uniform(0.5, 1.0))
+                backoff = min(backoff * 2, BACKOFF_MAX)
+        self._set_state(CLOSED)
+
+    def _serve(self, sock):
+        configure_link(sock, self.dead_after)
+        # Up only once the server has answered: a TCP handshake alone can
+        # complete on a link that carries nothing further.
+        offset, rtt = estimate_clock_offset(sock, samples=8 if self.clock_sync else 1, timeout=self.dead_after)
+        self.rtt = rtt / 1e9
+        if self.clock_sync:
+            self.clock_offset = offset
+            print(f"Latency tracing on: Pi clock is {offset / 1e6:+.2f} ms from ours "
+                  f"(round trip {rtt / 1e6:.2f} ms).")
+        with self._lock:
+            self._sock = sock
+            self._ping = 0
+            self.stats["connects"] += 1
+            try:
+                self._flush()
+            except OSError:
+                # Not connected yet, so _run will not clean up: keep what was being sent.
+                self._sock = None
+                self._requeue()
+                raise
+        if self._down_since is not None:
+            self.outages.append(time.monotonic() - self._down_since)
+            self._down_since = None
+        print(f"{self.name} connection to {self.host}:{self.port} successful!")
+        self._connected.set()
+        self._set_state(CONNECTED)
+
+        buffer = bytearray()
+        last_heard = last_ping = time.monotonic()
+        self._send_ping()
+        while not self._closed.is_set():
+            now = time.monotonic()
+            if now - last_heard > self.dead_after:
+                raise ConnectionError(f"no heartbeat reply for {now - last_heard:.1f}s")
+            if now - last_ping >= self.heartbeat:
+                self._send_ping()
+                last_ping = now
+            sock.settimeout(max(min(last_ping + self.heartbeat, last_heard + self.dead_after) - now, 0.001))
+            try:
+                chunk = sock.recv(4096)
+            except socket.timeout:
+                continue
+            if not chunk:
+                raise ConnectionError("closed by the server")
+            last_heard = time.monotonic()
+            buffer += chunk
+            self._read_replies(buffer)
+
+    def _send_ping(self):
+        with self._lock:
+            if self._sock is None:
+                return
+            self._sock.sendall(SYNC.pack(SYNC_MAGIC, VERSION, self._ping, time.time_ns()))
+            self._ping += 1
+
+    def _read_replies(self, buffer):
+        """Consumes complete SYNC replies and acks from the front of `buffer`."""
+        while buffer:
+            if buffer[0] == SYNC_MAGIC:
+                if len(buffer) < SYNC_REPLY.size:
+                    return
+                _, _, sequence, sent_ns, received_ns, replied_ns = SYNC_REPLY.unpack_from(buffer)
+                del buffer[:SYNC_REPLY.size]
+                self.rtt = ((time.time_ns() - sent_ns) - (replied_ns - received_ns)) / 1e9
+                with self._lock:
+                    while self._unconfirmed and self._unconfirmed[0][4] <= sequence:
+                        self._unconfirmed.popleft()
+                    self._confirmed.notify_all()
+            elif buffer[0] == ACK_MAGIC:
+                if len(buffer) < ACK.size:
+                    return
+                del buffer[:ACK.size]  # nothing asks for acks yet
+            else:
+                raise ValueError(f"unexpected reply byte {buffer[0]:#x}")
+
+    def close(self, drain=1.0):
+        """
+        Waits up to `drain` seconds for the server to confirm commands already
+        sent, so a controller that quits right after a key press still gets
+        it spoken, then closes the link. Queued commands are discarded.
+        """
+        if self.connected and drain:
+            try:
+                self._send_ping()
+            except OSError:
+                pass
+            with self._confirmed:
+                self._confirmed.wait_for(lambda: not self._unconfirmed or self._sock is None, drain)
+        self._closed.set()
+        with self._lock:
+            if self._sock is not None:
+                self._abort()
+        if self._thread.is_alive():
+            self._thread.join(timeout=2.0)
+        self._set_state(CLOSED)
+
+    def report(self):
+        s = self.stats
+        text = (f"{self.name} link: {s['connects']} connections, {s['sent']} commands sent "
+                f"({s['queued']} queued while down, {s['resent']} resent, {s['stale']} dropped as stale)")
+        if self.outages:
+            text += (f", {len(self.outages)} reconnects, longest outage "
+                     f"{1000 * max(self.outages):.0f} ms")
+        if self.rtt is not None:
+            text += f", last heartbeat RTT {1000 * self.rtt:.1f} ms"
+        return text + "."
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
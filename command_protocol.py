@@ -0,0 +1,191 @@
+# command_protocol.py
+"""
+Command protocol between the controllers and the audio server.
+
+Version 1 (legacy): one byte with the label's length, then the UTF-8 label.
+
+Version 2: a fixed 16-byte COMMAND record written in one send, starting with
+COMMAND_MAGIC. A v1 length byte is never 0xFF (no label is 255 bytes long),
+so the server tells the two formats apart by the first byte and keeps serving
+older clients. With FLAG_ACK set, the server answers with an ACK record once
+the phrase starts playing (or is skipped), carrying its receive and
+playback-start times. With FLAG_TRACE set, a TRACE record follows the command
+with the timestamps of the frame that produced it, for end-to-end tracing.
+
+Clock sync: a SYNC record starting with SYNC_MAGIC is answered right away
+with a SYNC_REPLY, NTP-style, so clients can estimate the offset between
+their clock and the Pi's.
+"""
+import itertools
+import socket
+import struct
+import time
+from collections import namedtuple
+
+# --- Wire Format ---
+COMMAND_MAGIC = 0xFF
+ACK_MAGIC = 0xFE
+SYNC_MAGIC = 0xFD
+VERSION = 2
+
+COMMAND = struct.Struct(">BBBBIQ")  # magic, version, opcode, flags, sequence, client send time (ns)
+ACK = struct.Struct(">BBxxIQQ")     # magic, version, sequence, server receive time (ns), playback start (ns, 0 = skipped)
+
+# Frame timestamps of a traced command. The capture time is on the Pi's clock,
+# the others on the client's; the clock offset converts them (0 = unknown).
+TRACE = struct.Struct(">qQQQQQ")  # client->Pi clock offset, capture, received, decoded, inferred, classified (ns)
+TRACE_FIELDS = ("capture", "received", "decoded", "inferred", "classified")
+
+SYNC = struct.Struct(">BBxxIQ")         # magic, version, sequence, client send time (ns)
+SYNC_REPLY = struct.Struct(">BBxxIQQQ")  # magic, version, sequence, client send, server receive, server reply (ns)
+
+FLAG_ACK = 0x01    # reply with an ACK record
+FLAG_TRACE = 0x02  # a TRACE record follows
+
+# Opcodes are positions in this table plus one and must never be reordered;
+# new gestures go at the end. Opcode 0 is reserved.
+GESTURE_OPCODES = (
+    "FIST", "PALM", "FOUR", "THREE", "PEACE", "ONE", "OK", "POINT", "L", "ROCK",
+    "ILY", "CALL_ME", "THUMB_UP", "THUMB_DOWN", "PINCH", "NO_HAND", "UNKNOWN",
+)
+OPCODE_OF = {label: opcode for opcode, label in enumerate(GESTURE_OPCODES, start=1)}
+
+# The gestures on the keyboard panel's keys 1 to 5. Every phrase set must cover them.
+KEY_GESTURES = ("FIST", "PALM", "FOUR", "THREE", "PEACE")
+
+Command = namedtuple("Command", "label opcode sequence flags sent_ns version trace", defaults=(None,))
+Ack = namedtuple("Ack", "sequence received_ns playback_ns")
+Trace = namedtuple("Trace", ("offset_ns",) + TRACE_FIELDS)
+SyncRequest = namedtuple("SyncRequest", "sequence sent_ns")
+
+_sequence = itertools.count(1)
+
+def configure_socket(sock):
+    """Disables Nagle's algorithm so each command leaves immediately."""
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+def encode_command(gesture_label, flags=0, sequence=None, trace=None):
+    """
+    Encodes a label as a v2 command, numbered from a per-process sequence.
+    Labels without an opcode fall back to the v1 format. Passing a Trace
+    appends it and sets FLAG_TRACE.
+    """
+    opcode = OPCODE_OF.get(gesture_label)
+    if opcode is None:
+        return encode_legacy(gesture_label)
+    if sequence is None:
+        sequence = next(_sequence) & 0xFFFFFFFF
+    if trace is None:
+        return COMMAND.pack(COMMAND_MAGIC, VERSION, opcode, flags, sequence, time.time_ns())
+    return (COMMAND.pack(COMMAND_MAGIC, VERSION, opcode, flags | FLAG_TRACE, sequence, time.time_ns())
+            + TRACE.pack(*(value or 0 for value in trace)))
+
+def encode_legacy(gesture_label):
+    label_bytes = gesture_label.encode('utf-8')
+    return len(label_bytes).to_bytes(1, 'big') + label_bytes
+
+def decode_trace(record):
+    return Trace(*(value or None for value in TRACE.unpack(record)))
+
+def decode_command(record):
+    """Decodes a full COMMAND record (magic byte included), without any trailing TRACE."""
+    magic, version, opcode, flags, sequence, sent_ns = COMMAND.unpack(record)
+    if magic != COMMAND_MAGIC or version != VERSION:
+        raise ValueError(f"Unsupported command record (magic {magic:#x}, version {version})")
+    if not 1 <= opcode <= len(GESTURE_OPCODES):
+        raise ValueError(f"Unknown gesture opcode {opcode}")
+    return Command(GESTURE_OPCODES[opcode - 1], opcode, sequence, flags, sent_ns, version)
+
+def legacy_command(label):
+    return Command(label, OPCODE_OF.get(label, 0), None, 0, None, 1)
+
+def parse_record(first):
+    """
+    The layout of everything a client sends, shared by the asyncio server and
+    blocking readers. A generator: given a record's first byte, it yields how
+    many more bytes it needs, is sent exactly those, and returns the Command
+    or SyncRequest (None for an empty legacy label, which carries nothing).
+    """
+    if first[0] == COMMAND_MAGIC:
+        command = decode_command(first + (yield COMMAND.size - 1))
+        if command.flags & FLAG_TRACE:
+            command = command._replace(trace=decode_trace((yield TRACE.size)))
+        return command
+    if first[0] == SYNC_MAGIC:
+        return decode_sync(first + (yield SYNC.size - 1))
+    # Legacy protocol: a single byte for the label's size, then the UTF-8 label.
+    if first[0] == 0:
+        return None
+    return legacy_command((yield first[0]).decode('utf-8'))
+
+def read_command(recv_exactly):
+    """
+    Reads one command of either version, or a clock sync request, with
+    `recv_exactly(n)`, which returns exactly n bytes or None at end of stream.
+    Returns None at end of stream.
+    """
+    while True:
+        first = recv_exactly(1)
+        if not first:
+            return None
+        record = parse_record(first)
+        try:
+            size = next(record)
+            while True:
+                data = recv_exactly(size)
+                if not data:
+                    return None
+                size = record.send(data)
+        except StopIteration as done:
+            if done.value is not None:
+                return done.value
+
+def encode_ack(sequence, received_ns, playback_ns):
+    return ACK.pack(ACK_MAGIC, VERSION, sequence, received_ns, playback_ns or 0)
+
+def decode_ack(record):
+    magic, version, sequence, received_ns, playback_ns = ACK.unpack(record)
+    if magic != ACK_MAGIC:
+        raise ValueError(f"Not an ack record (magic {magic:#x})")
+    return Ack(sequence, received_ns, playback_ns or None)
+
+# --- Clock Sync ---
+
+def decode_sync(record):
+    magic, version, sequence, sent_ns = SYNC.unpack(record)
+    if magic != SYNC_MAGIC:
+        raise ValueError(f"Not a sync record (magic {magic:#x})")
+    return SyncRequest(sequence, sent_ns)
+
+def encode_sync_reply(request, received_ns):
+    return SYNC_REPLY.pack(SYNC_MAGIC, VERSION, request.sequence, request.sent_ns, received_ns, time.time_ns())
+
+def estimate_clock_offset(sock, samples=8, timeout=2.0):
+    """
+    Estimates (offset_ns, rtt_ns) between this machine's clock and the server's
+    with NTP-style round trips on a connected command socket; server time is
+    roughly local time + offset. The round trip with the lowest RTT wins, since
+    its one-way delays are the most symmetric. Must run before anything else
+    reads from the socket.
+    """
+    previous_timeout = sock.gettimeout()
+    sock.settimeout(timeout)
+    best = None
+    try:
+        for sequence in range(samples):
+            sock.sendall(SYNC.pack(SYNC_MAGIC, VERSION, sequence, time.time_ns()))
+            reply = b''
+            while len(reply) < SYNC_REPLY.size:
+                chunk = sock.recv(SYNC_REPLY.size - len(reply))
+                if not chunk:
+                    raise ConnectionError("Server closed the connection during clock sync")
+                reply += chunk
+            t4 = time.time_ns()
+            _, _, _, t1, t2, t3 = SYNC_REPLY.unpack(reply)
+            rtt = (t4 - t1) - (t3 - t2)
+            offset = ((t2 - t1) + (t3 - t4)) // 2
+            if best is None or rtt < best[1]:
+                best = (offset, rtt)
+    finally:
+        sock.settimeout(previous_timeout)
+    return best
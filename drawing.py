@@ -1,7 +1,12 @@
 # drawing.py
 
 import cv2
+import numpy as np
 import mediapipe as mp
+from functools import lru_cache
+from types import SimpleNamespace
+from mediapipe.framework.formats import landmark_pb2, classification_pb2
+from overlay import TextLayer
 
 mp_draw = mp.solutions.drawing_utils
 mp_hands = mp.solutions.hands
@@ -14,10 +19,11 @@ class DebugDashboard:
         self.font_size = font_size
         self.color = font_color
         self.line_height = int(self.font_size * 35)
+        # Static lines and finger states come from the cache; only changed lines are rasterized.
+        self.text = TextLayer(self.font_size, self.color, 1, self.font)
 
     def _put_text(self, frame, text, line_num):
-        cv2.putText(frame, text, (self.x, self.y + line_num * self.line_height), 
-                    self.font, self.font_size, self.color, 1)
+        self.text.draw(frame, text, (self.x, self.y + line_num * self.line_height))
 
     def render(self, frame, res, gesture_debug_info):
         if not res or not res.multi_hand_landmarks:
@@ -41,12 +47,45 @@ class DebugDashboard:
             self._put_text(frame, f"- RG: {states['RG']:<10} | {angles['RG']:.1f}", 5)
             self._put_text(frame, f"- PK: {states['PK']:<10} | {angles['PK']:.1f}", 6)
 
+HEADER_HEIGHT = 61  # rows covered by the header bar, as cv2.rectangle to y=60 inclusive
+
+@lru_cache(maxsize=32)
+def _header_layer(width, label):
+    """The opaque header bar with its label, rendered once per frame width and label."""
+    header = np.zeros((HEADER_HEIGHT, width, 3), dtype=np.uint8)
+    cv2.putText(header, f"Gesture: {label}", (18, 40), cv2.FONT_HERSHEY_SIMPLEX, 1.1, (0, 255, 0), 2)
+    header.flags.writeable = False
+    return header
+
 def draw_ui(frame, stable_label):
     h, w = frame.shape[:2]
-    cv2.rectangle(frame, (0, 0), (w, 60), (0, 0, 0), -1)
-    cv2.putText(frame, f"Gesture: {stable_label}", (18, 40), cv2.FONT_HERSHEY_SIMPLEX, 1.1, (0, 255, 0), 2)
+    frame[:HEADER_HEIGHT] = _header_layer(w, stable_label)[:h]
+
+LINK_TEXT = TextLayer(0.6, (0, 0, 255), 2)
+
+def draw_link_status(frame, status):
+    """A warning line at the bottom left, such as the audio link being down."""
+    LINK_TEXT.draw(frame, status, (18, frame.shape[0] - 18))
 
 def draw_landmarks(frame, landmarks):
     if landmarks:
         for hand_lms in landmarks:
             mp_draw.draw_landmarks(frame, hand_lms, mp_hands.HAND_CONNECTIONS)
+
+def hands_result(hands):
+    """
+    Builds a MediaPipe-style Hands result from [(landmarks, handedness, score), ...]
+    with normalized landmarks, so landmarks that did not come from a local
+    hands.process call (streamed or recorded) can be drawn and classified the same way.
+    """
+    if not hands:
+        return SimpleNamespace(multi_hand_landmarks=None, multi_handedness=None)
+    landmarks, handedness = [], []
+    for points, label, score in hands:
+        landmarks.append(landmark_pb2.NormalizedLandmarkList(landmark=[
+            landmark_pb2.NormalizedLandmark(x=x, y=y, z=z) for x, y, z in np.asarray(points).tolist()
+        ]))
+        handedness.append(classification_pb2.ClassificationList(classification=[
+            classification_pb2.Classification(label=label or "", score=float(score))
+        ]))
+    return SimpleNamespace(multi_hand_landmarks=landmarks, multi_handedness=handedness)
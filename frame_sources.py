@@ -0,0 +1,134 @@
+# frame_sources.py
+"""
+Pluggable frame sources for video_stream_server. Every source yields frames as
+a single I420 (YUV420 planar) array shaped (height * 3 // 2, stride), which is
+what the Pi camera's YUV420 stream delivers, so the JPEG encoder can work on
+the Y/U/V planes directly without an intermediate BGR frame.
+"""
+import time
+
+import numpy as np
+import simplejpeg
+
+# The camera's full-field-of-view sensor mode; the stream is scaled from this.
+SENSOR_MODE_SIZE = (1640, 1232)
+
+def split_yuv420(frame, width, height):
+    """Returns the Y, U and V planes of an I420 frame, honouring any row padding."""
+    stride = frame.shape[1]
+    y = frame[:height, :width]
+    u = frame[height:height + height // 4].reshape(height // 2, stride // 2)[:, :width // 2]
+    v = frame[height + height // 4:height + height // 2].reshape(height // 2, stride // 2)[:, :width // 2]
+    if stride != width:
+        # Padded rows only happen for widths the ISP cannot output directly.
+        y, u, v = np.ascontiguousarray(y), np.ascontiguousarray(u), np.ascontiguousarray(v)
+    return y, u, v
+
+def encode_yuv420(frame, width, height, quality=80):
+    """Encodes an I420 frame straight from its planes to a JPEG."""
+    y, u, v = split_yuv420(frame, width, height)
+    return simplejpeg.encode_jpeg_yuv_planes(y, u, v, quality=quality, fastdct=True)
+
+class Picamera2Source:
+    """
+    The Pi camera. Only a YUV420 stream of the requested size is used; the
+    full-resolution `main` stream is optional and, when disabled, the output
+    stream becomes `main` itself while the sensor mode stays wide.
+    """
+
+    def __init__(self, size=(640, 480), main_size=SENSOR_MODE_SIZE):
+        from picamera2 import Picamera2
+        from libcamera import controls
+
+        self.size = size
+        self.picam2 = Picamera2()
+        if main_size:
+            self.stream = "lores"
+            config = self.picam2.create_video_configuration(
+                main={"size": main_size},
+                lores={"size": size, "format": "YUV420"}
+            )
+        else:
+            self.stream = "main"
+            # Requesting the raw stream at the full sensor mode keeps the wide
+            # field of view without the ISP producing a large unused output.
+            config = self.picam2.create_video_configuration(
+                main={"size": size, "format": "YUV420"},
+                raw={"size": SENSOR_MODE_SIZE}
+            )
+        self.picam2.configure(config)
+        self.picam2.set_controls({"AwbEnable": 1, "AwbMode": controls.AwbModeEnum.Auto})
+        self.picam2.start()
+        time.sleep(2.0)
+
+    def read(self):
+        return self.picam2.capture_array(self.stream)
+
+    def stop(self):
+        self.picam2.stop()
+
+class VideoFileSource:
+    """Plays a video file at its own frame rate, looping at the end."""
+
+    def __init__(self, path, size=(640, 480), loop=True):
+        import cv2
+        self._cv2 = cv2
+        self.size = size
+        self.loop = loop
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise ValueError(f"Could not open video file {path}")
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.frame_interval = 1.0 / fps if fps and fps > 0 else 1.0 / 30
+        self._next_time = time.monotonic()
+
+    def read(self):
+        cv2 = self._cv2
+        ret, frame = self.cap.read()
+        if not ret and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read()
+        if not ret:
+            raise EOFError("End of video file")
+
+        delay = self._next_time - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._next_time = max(self._next_time, time.monotonic() - self.frame_interval) + self.frame_interval
+
+        frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420)
+
+    def stop(self):
+        self.cap.release()
+
+class SyntheticSource:
+    """A moving test pattern generated directly in I420, for tests without a camera or video."""
+
+    def __init__(self, size=(640, 480), fps=30):
+        self.size = size
+        self.frame_interval = 1.0 / fps
+        self._next_time = time.monotonic()
+        self._count = 0
+        width, height = size
+        self._x = np.arange(width, dtype=np.uint16)
+        self._y = np.arange(height, dtype=np.uint16)[:, None]
+
+    def read(self):
+        delay = self._next_time - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._next_time = max(self._next_time, time.monotonic() - self.frame_interval) + self.frame_interval
+
+        width, height = self.size
+        shift = self._count * 4
+        self._count += 1
+        frame = np.empty((height * 3 // 2, width), dtype=np.uint8)
+        frame[:height] = ((self._x + self._y + shift) & 0xFF).astype(np.uint8)
+        chroma = frame[height:].reshape(2, height // 2, width // 2)
+        chroma[0] = 128 + ((self._x[:width // 2] + shift) & 0x3F).astype(np.uint8)
+        chroma[1] = 128 - ((self._y[:height // 2] + shift) & 0x3F).astype(np.uint8)
+        return frame
+
+    def stop(self):
+        pass
@@ -1,8 +1,29 @@
 # generate_audio.py
+"""
+Creates the phrase WAVs in audio_files/ from text.
+
+Builds are incremental: every phrase gets a content key, a hash of its
+language, text, TTS backend, voice and output format. The rendered WAV is
+kept in a cache under that key, and audio_files/manifest.json records which
+key each gesture's file was built from. Only entries whose key changed are
+synthesized again, in a pool of worker processes; switching back to a
+language or phrase that was built before is a copy from the cache.
+
+    python3 generate_audio.py --lang en
+    python3 generate_audio.py --lang ru --backend espeak --workers 8
+    python3 generate_audio.py --backend tone    # offline placeholder tones, no network or ffmpeg
+"""
+import argparse
+import hashlib
+import importlib
+import json
+import math
 import os
+import shutil
 import subprocess
-from gtts import gTTS
-import argparse
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # --- Configuration ---
 # You can add more languages here if gTTS supports them.
@@ -10,7 +31,7 @@ import argparse
 PHRASES = {
     "en": {
         "FIST": "Call my family",
-        "PALM": "I need help", 
+        "PALM": "I need help",
         "FOUR": "I'm in pain",
         "THREE": "I can't breathe",
         "PEACE": "Where is the bathroom?",
@@ -18,48 +39,264 @@ PHRASES = {
     "ru": {
         "FIST": "Позвоните моей семье",
         "PALM": "Мне нужна помощь",
-        "FOUR": "Мне больно", 
+        "FOUR": "Мне больно",
         "THREE": "Я не могу дышать",
         "PEACE": "Где туалет?",
     }
 }
 
+OUTPUT_DIR = "audio_files"
+CACHE_DIR = ".audio_cache"
+MANIFEST_NAME = "manifest.json"
+# aplay on Pi works best with WAV files, 44100Hz, 16-bit, stereo.
+OUTPUT_RATE = 44100
+OUTPUT_CHANNELS = 2
+OUTPUT_CODEC = "pcm_s16le"
+
+# --- TTS Backends ---
+# A backend turns one phrase into an audio file of any format ffmpeg reads.
+# `identity` goes into the content key, so changing a backend's output
+# (bumping its version) rebuilds everything it made.
+
+class GTTSBackend:
+    """Google Translate TTS. Needs network; `voice` picks the accent's domain (com, co.uk, ...)."""
+    name = "gtts"
+    version = 1
+    ext = ".mp3"
+    offline = False
+
+    def __init__(self, voice=None):
+        self.voice = voice or "com"
+
+    def identity(self):
+        return f"{self.name}/{self.version}/{self.voice}"
+
+    def synthesize(self, text, lang, path):
+        from gtts import gTTS
+        gTTS(text=text, lang=lang, tld=self.voice).save(path)
+
+class EspeakBackend:
+    """eSpeak NG (or eSpeak) installed locally. Offline; `voice` defaults to the language."""
+    name = "espeak"
+    version = 1
+    ext = ".wav"
+    offline = True
+
+    def __init__(self, voice=None):
+        self.voice = voice
+        self.program = shutil.which("espeak-ng") or shutil.which("espeak")
+
+    def identity(self):
+        return f"{self.name}/{self.version}/{self.voice or ''}"
+
+    def synthesize(self, text, lang, path):
+        if not self.program:
+            raise RuntimeError("espeak-ng is not installed.")
+        subprocess.run([self.program, "-v", self.voice or lang, "-w", path, text],
+                       check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+class SayBackend:
+    """macOS `say`. Offline; `voice` is a voice name from `say -v '?'` matching the language."""
+    name = "say"
+    version = 1
+    ext = ".aiff"
+    offline = True
+
+    def __init__(self, voice=None):
+        self.voice = voice
+
+    def identity(self):
+        return f"{self.name}/{self.version}/{self.voice or ''}"
+
+    def synthesize(self, text, lang, path):
+        command = ["say", "-o", path] + (["-v", self.voice] if self.voice else []) + [text]
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+class ToneBackend:
+    """
+    A short tone per word instead of speech, written directly in the output
+    format. Needs neither network nor ffmpeg, for tests and dry runs on a bench.
+    """
+    name = "tone"
+    version = 1
+    ext = ".wav"
+    offline = True
+    native = True  # writes the output format itself, no conversion needed
+
+    def __init__(self, voice=None):
+        self.voice = voice
+
+    def identity(self):
+        return f"{self.name}/{self.version}"
+
+    def synthesize(self, text, lang, path, rate=OUTPUT_RATE, channels=OUTPUT_CHANNELS):
+        frames = bytearray()
+        for word in text.split():
+            digest = hashlib.sha256(word.encode("utf-8")).digest()
+            freq = 300 + digest[0] * 2
+            length = int(rate * 0.18)
+            for i in range(length):
+                envelope = min(1.0, i / (0.01 * rate), (length - i) / (0.01 * rate))
+                sample = int(12000 * envelope * math.sin(2 * math.pi * freq * i / rate))
+                frames += sample.to_bytes(2, "little", signed=True) * channels
+            frames += b"\0\0" * channels * int(rate * 0.05)
+        with wave.open(path, "wb") as wav:
+            wav.setnchannels(channels)
+            wav.setsampwidth(2)
+            wav.setframerate(rate)
+            wav.writeframes(bytes(frames))
+
+BACKENDS = {backend.name: backend for backend in (GTTSBackend, EspeakBackend, SayBackend, ToneBackend)}
+
+def make_backend(spec, voice=None):
+    """A backend by name, or any class given as module:Class with the same methods."""
+    if spec in BACKENDS:
+        return BACKENDS[spec](voice)
+    if ":" in spec:
+        module, cls = spec.split(":", 1)
+        return getattr(importlib.import_module(module), cls)(voice)
+    raise ValueError(f"Unknown TTS backend '{spec}' (choose from {', '.join(BACKENDS)} or module:Class)")
+
+# --- Incremental Build ---
+
+def entry_key(lang, phrase, backend, rate=OUTPUT_RATE, channels=OUTPUT_CHANNELS):
+    """The content key of one rendered phrase."""
+    content = {"lang": lang, "phrase": phrase, "backend": backend.identity(),
+               "rate": rate, "channels": channels, "codec": OUTPUT_CODEC}
+    return hashlib.sha256(json.dumps(content, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def load_manifest(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_manifest(path, manifest):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def copy_atomic(src, dst):
+    """Copies aside and renames, so the audio server never loads a half-written WAV."""
+    tmp_path = dst + ".tmp"
+    shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dst)
+
+def up_to_date(entry, key, path):
+    return (entry is not None and entry.get("key") == key and os.path.exists(path)
+            and os.path.getsize(path) == entry.get("bytes"))
+
+def render_entry(backend_spec, voice, lang, gesture, phrase, cache_path, rate, channels):
+    """
+    Worker: synthesizes one phrase and converts it to the output format,
+    writing it into the cache. Returns (gesture, seconds).
+    """
+    started = time.perf_counter()
+    backend = make_backend(backend_spec, voice)
+    tmp_path = f"{cache_path}.tmp.wav"
+    if getattr(backend, "native", False):
+        backend.synthesize(phrase, lang, tmp_path, rate=rate, channels=channels)
+    else:
+        source_path = f"{cache_path}.tts{backend.ext}"
+        try:
+            backend.synthesize(phrase, lang, source_path)
+            command = ['ffmpeg', '-y', '-i', source_path, '-ar', str(rate),
+                       '-ac', str(channels), '-acodec', OUTPUT_CODEC, tmp_path]
+            subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        finally:
+            if os.path.exists(source_path):
+                os.remove(source_path)
+    os.replace(tmp_path, cache_path)
+    return gesture, time.perf_counter() - started
+
+def build(lang, backend_spec="gtts", voice=None, output_dir=OUTPUT_DIR, cache_dir=CACHE_DIR,
+          rate=OUTPUT_RATE, channels=OUTPUT_CHANNELS, workers=None, force=False):
+    """
+    Brings output_dir up to date with PHRASES[lang]. Returns a dict of
+    gesture lists: "current", "cached" (copied from the cache), "built" and "failed".
+    """
+    backend = make_backend(backend_spec, voice)
+    os.makedirs(output_dir, exist_ok=True)
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+    result = {"current": [], "cached": [], "built": [], "failed": []}
+
+    jobs = {}
+    for gesture, phrase in PHRASES[lang].items():
+        key = entry_key(lang, phrase, backend, rate, channels)
+        wav_path = os.path.join(output_dir, f"{gesture}.wav")
+        cache_path = os.path.join(cache_dir, f"{key}.wav")
+        if not force and up_to_date(manifest.get(gesture), key, wav_path):
+            result["current"].append(gesture)
+        elif not force and os.path.exists(cache_path):
+            copy_atomic(cache_path, wav_path)
+            result["cached"].append(gesture)
+        else:
+            jobs[gesture] = (phrase, key, cache_path)
+            continue
+        manifest[gesture] = {"key": key, "lang": lang, "phrase": phrase, "backend": backend.identity(),
+                             "bytes": os.path.getsize(wav_path)}
+
+    if jobs:
+        workers = max(1, min(workers or os.cpu_count() or 1, len(jobs)))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(render_entry, backend_spec, voice, lang, gesture, phrase, cache_path,
+                                   rate, channels): gesture
+                       for gesture, (phrase, key, cache_path) in jobs.items()}
+            for future in as_completed(futures):
+                gesture = futures[future]
+                phrase, key, cache_path = jobs[gesture]
+                try:
+                    _, seconds = future.result()
+                except Exception as e:
+                    print(f"Failed to process gesture '{gesture}': {e}")
+                    result["failed"].append(gesture)
+                    continue
+                wav_path = os.path.join(output_dir, f"{gesture}.wav")
+                copy_atomic(cache_path, wav_path)
+                manifest[gesture] = {"key": key, "lang": lang, "phrase": phrase, "backend": backend.identity(),
+                                     "bytes": os.path.getsize(wav_path)}
+                result["built"].append(gesture)
+                print(f"Successfully created {wav_path} ({seconds:.1f}s)")
+
+    save_manifest(manifest_path, manifest)
+    return result
+
 # --- Main execution ---
-if __name__ == "__main__":
+def main():
     parser = argparse.ArgumentParser(description="Generate audio files for Soyle gestures.")
     parser.add_argument('--lang', type=str, default='ru', choices=PHRASES.keys(),
                         help='Language for the audio phrases.')
+    parser.add_argument('--backend', default='gtts',
+                        help=f"TTS backend: {', '.join(BACKENDS)}, or module:Class for your own.")
+    parser.add_argument('--voice', help="Backend-specific voice (gTTS domain, eSpeak voice, or say voice).")
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Phrases synthesized and converted at once (default: one per CPU).')
+    parser.add_argument('--rate', type=int, default=OUTPUT_RATE, help='Sample rate of the WAVs.')
+    parser.add_argument('--channels', type=int, default=OUTPUT_CHANNELS, help='Channel count of the WAVs.')
+    parser.add_argument('--output-dir', default=OUTPUT_DIR, help='Where the WAVs and manifest go.')
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help='Content-addressed store of rendered phrases.')
+    parser.add_argument('--force', action='store_true', help='Synthesize every phrase again.')
     args = parser.parse_args()
 
-    lang = args.lang
-    output_dir = "audio_files"
-    os.makedirs(output_dir, exist_ok=True)
+    print(f"Selected language: {args.lang}")
+    start = time.perf_counter()
+    try:
+        result = build(args.lang, args.backend, args.voice, args.output_dir, args.cache_dir,
+                       args.rate, args.channels, args.workers, args.force)
+    except ValueError as e:
+        parser.exit(1, f"Error: {e}\n")
 
-    print(f"Selected language: {lang}")
-    print("Generating and converting audio files to WAV...")
-    
-    for gesture, phrase in PHRASES[lang].items():
-        try:
-            # Step 1: Generate MP3 from text using gTTS
-            mp3_path = os.path.join(output_dir, f"{gesture}.mp3")
-            tts = gTTS(text=phrase, lang=lang)
-            tts.save(mp3_path)
-
-            # Step 2: Convert MP3 to WAV using ffmpeg
-            # aplay on Pi works best with WAV files, 44100Hz, 16-bit, stereo.
-            wav_path = os.path.join(output_dir, f"{gesture}.wav")
-            command = [
-                'ffmpeg', '-y', '-i', mp3_path, '-ar', '44100', 
-                '-ac', '2', '-acodec', 'pcm_s16le', wav_path
-            ]
-            subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            
-            # Step 3: Clean up the intermediate MP3 file
-            os.remove(mp3_path)
-            print(f"Successfully created {wav_path}")
-            
-        except Exception as e:
-            print(f"Failed to process gesture '{gesture}': {e}")
+    print(f"\nAudio file generation complete in {time.perf_counter() - start:.1f}s: "
+          f"{len(result['built'])} generated, {len(result['cached'])} from cache, "
+          f"{len(result['current'])} already up to date.")
+    if result["failed"]:
+        if not make_backend(args.backend, args.voice).offline:
             print("Please ensure you have an internet connection and 'ffmpeg' is installed.")
+        parser.exit(1, f"Failed: {', '.join(result['failed'])}\n")
 
-    print("\nAudio file generation complete.")
+if __name__ == "__main__":
+    main()
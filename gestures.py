@@ -1,6 +1,8 @@
 # gestures.py
 
+import json
 import math
+import os
 import numpy as np
 
 # --- Detection Thresholds ---
@@ -14,6 +16,29 @@ L_ANGLE_MAX = 120
 L_INDEX_LEN_MIN = 0.48
 L_THUMB_LEN_MIN = 0.40
 
+# Thresholds a tuned profile (tune_thresholds.py --output) may override.
+TUNABLE_THRESHOLDS = (
+    "EXT_ANGLE_DEG", "CURL_ANGLE_DEG", "OK_PINCH_THRESH",
+    "L_ANGLE_MIN", "L_ANGLE_MAX", "L_INDEX_LEN_MIN", "L_THUMB_LEN_MIN",
+)
+PROFILE_ENV = "SOYLE_GESTURE_PROFILE"  # profile loaded at import, also by spawned workers
+
+def current_thresholds():
+    return {name: globals()[name] for name in TUNABLE_THRESHOLDS}
+
+def load_profile(path):
+    """
+    Replaces the detection thresholds above with those of a tuned profile.
+    Both classify_gesture and classify_gesture_batch read them on every call.
+    """
+    with open(path) as f:
+        thresholds = json.load(f)["thresholds"]
+    unknown = set(thresholds) - set(TUNABLE_THRESHOLDS)
+    if unknown:
+        raise ValueError(f"{path}: unknown thresholds {', '.join(sorted(unknown))}")
+    globals().update({name: float(value) for name, value in thresholds.items()})
+    return thresholds
+
 # ---------- Landmark processing and geometry utils ----------
 
 def dist(a, b):
@@ -22,99 +47,345 @@ def dist(a, b):
 def finger_is_extended(lm, tip, pip, mcp, wrist):
     return dist(lm[tip], lm[wrist]) > dist(lm[pip], lm[wrist]) > dist(lm[mcp], lm[wrist])
 
-def angle_deg(a, b, c):
-    ab = np.array(a) - np.array(b)
-    cb = np.array(c) - np.array(b)
-    denom = (np.linalg.norm(ab) * np.linalg.norm(cb)) + 1e-6
-    cosang = np.dot(ab, cb) / denom
-    cosang = max(-1.0, min(1.0, cosang))
-    return math.degrees(math.acos(cosang))
-
-def angle_between_points(a1, a0, b1, b0):
-    v1 = np.array(a1) - np.array(a0)
-    v2 = np.array(b1) - np.array(b0)
-    denom = (np.linalg.norm(v1) * np.linalg.norm(v2)) + 1e-6
-    cosang = np.dot(v1, v2) / denom
-    cosang = max(-1.0, min(1.0, cosang))
-    return math.degrees(math.acos(cosang))
-
-def palm_scale(lm):
-    WRIST = 0
-    IX_MCP, MD_MCP, RG_MCP = 5, 9, 13
-    s1 = dist(lm[WRIST], lm[IX_MCP])
-    s2 = dist(lm[WRIST], lm[MD_MCP])
-    s3 = dist(lm[WRIST], lm[RG_MCP])
-    scale = np.median([s1, s2, s3])
-    return max(scale, 1e-3)
-
-def norm_dist(lm, i, j):
-    return dist(lm[i], lm[j]) / palm_scale(lm)
+# ---------- Gesture Definitions ----------
+# Each gesture is a condition on the five finger states, plus optionally the
+# name of a geometry check that must also pass. Rules are tried in order and
+# the first match wins. The finger-state conditions are compiled into
+# DECISION_TABLE at import, so adding a gesture costs nothing per frame.
+
+GESTURE_LABELS = (
+    "UNKNOWN", "ILY", "ROCK", "FOUR", "OK", "PINCH", "CALL_ME", "L", "THREE",
+    "ONE", "FIST", "PALM", "PEACE", "THUMB_UP", "THUMB_DOWN", "POINT",
+)
+GESTURE_CODES = {label: code for code, label in enumerate(GESTURE_LABELS)}
+
+FINGER_NAMES = ("TH", "IX", "MD", "RG", "PK")
+FINGER_STATES = ("unknown", "extended", "curled")
+STATE_UNKNOWN, STATE_EXTENDED, STATE_CURLED = 0, 1, 2
+
+class Fingers:
+    """The finger states of one decision-table entry, for the rule conditions below."""
+
+    def __init__(self, states):
+        self.states = dict(zip(FINGER_NAMES, states))
+
+    def extended(self, *names):
+        return all(self.states[n] == STATE_EXTENDED for n in names)
+
+    def curled(self, *names):
+        return all(self.states[n] == STATE_CURLED for n in names)
+
+    def any_extended(self, *names):
+        return any(self.states[n] == STATE_EXTENDED for n in names)
+
+    def any_curled(self, *names):
+        return any(self.states[n] == STATE_CURLED for n in names)
+
+    def extended_count(self):
+        return sum(state == STATE_EXTENDED for state in self.states.values())
+
+# (label, finger-state condition, geometry check or None)
+GESTURE_RULES = (
+    ("ILY", lambda f: f.extended("TH", "IX", "PK") and f.curled("MD", "RG"), None),
+    ("ROCK", lambda f: f.extended("IX", "PK") and f.curled("MD", "RG"), None),
+    ("FOUR", lambda f: f.extended("IX", "MD", "RG", "PK"), None),
+    ("OK", lambda f: f.any_extended("MD", "RG", "PK"), "pinch"),
+    ("PINCH", lambda f: not f.any_extended("MD", "RG", "PK"), "pinch"),
+    ("CALL_ME", lambda f: f.extended("TH", "PK") and f.curled("IX", "MD", "RG"), None),
+    ("L", lambda f: f.extended("IX", "TH") and f.curled("MD", "RG"), "l_shape"),
+    ("THREE", lambda f: f.extended("TH", "IX", "MD") and f.curled("RG", "PK"), None),
+    ("ONE", lambda f: f.extended("IX") and not f.any_extended("TH", "MD", "RG", "PK"), None),
+    ("FIST", lambda f: f.extended_count() <= 1 and not f.extended("IX"), None),
+    ("PALM", lambda f: f.extended("IX", "MD", "RG", "PK") and not f.any_curled("MD", "RG"), None),
+    ("PEACE", lambda f: f.extended("IX", "MD") and not f.any_extended("RG", "PK"), None),
+    ("THUMB_UP", lambda f: f.extended("TH") and f.curled("IX", "MD", "RG", "PK"), "thumb_up"),
+    ("THUMB_DOWN", lambda f: f.extended("TH") and f.curled("IX", "MD", "RG", "PK"), "thumb_down"),
+    ("POINT", lambda f: f.extended("IX") and not f.any_extended("MD", "RG", "PK"), None),
+)
+
+# ---------- Decision Table ----------
+
+def state_key(states):
+    """Index of a finger-state tuple (FINGER_NAMES order) into DECISION_TABLE."""
+    return states[0] + 3 * states[1] + 9 * states[2] + 27 * states[3] + 81 * states[4]
+
+def compile_rules(rules):
+    """
+    Resolves the finger-state conditions of `rules` for all 3^5 state
+    combinations. Each entry is (steps, default): `steps` holds the
+    (geometry check, label) pairs still to try in order, and `default` is the
+    label if none passes. Most entries have no steps at all.
+    """
+    table = []
+    for key in range(3 ** len(FINGER_NAMES)):
+        fingers = Fingers((key // 3 ** i) % 3 for i in range(len(FINGER_NAMES)))
+        steps, default = [], "UNKNOWN"
+        for label, condition, check in rules:
+            if not condition(fingers):
+                continue
+            if check is None:
+                default = label
+                break
+            steps.append((check, label))
+        table.append((tuple(steps), default))
+    return tuple(table)
+
+DECISION_TABLE = compile_rules(GESTURE_RULES)
 
 # ---------- Gesture Classification Engine ----------
 
+WRIST = 0
+TH_TIP, TH_IP, TH_MCP = 4, 3, 2
+IX_TIP, IX_PIP, IX_MCP = 8, 6, 5
+
+# (tip, pip, mcp) joint triplets per finger, in FINGER_NAMES order.
+_FINGER_JOINTS = np.array([(4, 3, 2), (8, 6, 5), (12, 10, 9), (16, 14, 13), (20, 18, 17)])
+_JOINTS = [tuple(joints) for joints in _FINGER_JOINTS.tolist()]
+
+def _vector_angle(v1x, v1y, v2x, v2y):
+    denom = math.sqrt(v1x * v1x + v1y * v1y) * math.sqrt(v2x * v2x + v2y * v2y) + 1e-6
+    cosang = (v1x * v2x + v1y * v2y) / denom
+    return math.degrees(math.acos(max(-1.0, min(1.0, cosang))))
+
+class HandGeometry:
+    """Geometry beyond the finger states, computed on first use; palm scale at most once per hand."""
+
+    __slots__ = ("lm", "_scale")
+
+    def __init__(self, lm):
+        self.lm = lm
+        self._scale = None
+
+    def scale(self):
+        if self._scale is None:
+            w = self.lm[WRIST]
+            s = sorted((dist(w, self.lm[5]), dist(w, self.lm[9]), dist(w, self.lm[13])))
+            self._scale = max(s[1], 1e-3)  # median of three
+        return self._scale
+
+    def norm_dist(self, i, j):
+        return dist(self.lm[i], self.lm[j]) / self.scale()
+
+    def thumb_margin(self):
+        return max(12, self.scale() * 0.15)
+
+def _check_pinch(g):
+    return g.norm_dist(TH_TIP, IX_TIP) < OK_PINCH_THRESH
+
+def _check_l_shape(g):
+    lm = g.lm
+    ang_t_i = _vector_angle(lm[IX_TIP][0] - lm[IX_MCP][0], lm[IX_TIP][1] - lm[IX_MCP][1],
+                            lm[TH_TIP][0] - lm[TH_MCP][0], lm[TH_TIP][1] - lm[TH_MCP][1])
+    return (L_ANGLE_MIN <= ang_t_i <= L_ANGLE_MAX and g.norm_dist(IX_TIP, IX_MCP) > L_INDEX_LEN_MIN
+            and g.norm_dist(TH_TIP, TH_MCP) > L_THUMB_LEN_MIN)
+
+def _check_thumb_up(g):
+    return g.lm[TH_TIP][1] < g.lm[WRIST][1] - g.thumb_margin()
+
+def _check_thumb_down(g):
+    return g.lm[TH_TIP][1] > g.lm[WRIST][1] + g.thumb_margin()
+
+GEOMETRY_CHECKS = {
+    "pinch": _check_pinch,
+    "l_shape": _check_l_shape,
+    "thumb_up": _check_thumb_up,
+    "thumb_down": _check_thumb_down,
+}
+
+def finger_states(lm):
+    """Returns (states, angles) for the five fingers: FINGER_STATES codes and PIP/IP angles in degrees."""
+    states, angles = [], []
+    for finger, (tip, pip, mcp) in enumerate(_JOINTS):
+        t, p, m = lm[tip], lm[pip], lm[mcp]
+        ang = _vector_angle(t[0] - p[0], t[1] - p[1], m[0] - p[0], m[1] - p[1])
+        state = STATE_UNKNOWN
+        if finger == 0:
+            # The thumb uses its own angle thresholds plus a wrist-distance check.
+            wrist_to_tip = dist(lm[WRIST], t)
+            wrist_to_mcp = dist(lm[WRIST], m)
+            if ang >= 150 and wrist_to_tip > wrist_to_mcp * 0.85: state = STATE_EXTENDED
+            if ang <= 120 and wrist_to_tip < wrist_to_mcp * 0.95: state = STATE_CURLED
+        else:
+            if ang >= EXT_ANGLE_DEG: state = STATE_EXTENDED
+            if ang <= CURL_ANGLE_DEG: state = STATE_CURLED
+        states.append(state)
+        angles.append(ang)
+    return states, angles
+
 def classify_gesture(lm):
-    WRIST = 0
-    TH_TIP, TH_IP, TH_MCP = 4, 3, 2
-    IX_TIP, IX_PIP, IX_MCP = 8, 6, 5
-    MD_TIP, MD_PIP, MD_MCP = 12, 10, 9
-    RG_TIP, RG_PIP, RG_MCP = 16, 14, 13
-    PK_TIP, PK_PIP, PK_MCP = 20, 18, 17
-
-    debug_info = {}
-
-    def finger_state(tip, pip, mcp, ext_th=EXT_ANGLE_DEG, curl_th=CURL_ANGLE_DEG):
-        ang = angle_deg(lm[tip], lm[pip], lm[mcp])
-        state = "unknown"
-        if ang >= ext_th: state = "extended"
-        if ang <= curl_th: state = "curled"
-        return state, ang
-
-    def thumb_state():
-        ang = angle_deg(lm[TH_TIP], lm[TH_IP], lm[TH_MCP])
-        wrist_to_tip = dist(lm[WRIST], lm[TH_TIP])
-        wrist_to_mcp = dist(lm[WRIST], lm[TH_MCP])
-        state = "unknown"
-        if ang >= 150 and wrist_to_tip > wrist_to_mcp * 0.85: state = "extended"
-        if ang <= 120 and wrist_to_tip < wrist_to_mcp * 0.95: state = "curled"
-        return state, ang
-
-    th_s, th_a = thumb_state()
-    ix_s, ix_a = finger_state(IX_TIP, IX_PIP, IX_MCP)
-    md_s, md_a = finger_state(MD_TIP, MD_PIP, MD_MCP)
-    rg_s, rg_a = finger_state(RG_TIP, RG_PIP, RG_MCP)
-    pk_s, pk_a = finger_state(PK_TIP, PK_PIP, PK_MCP)
-
-    debug_info['states'] = {'TH': th_s, 'IX': ix_s, 'MD': md_s, 'RG': rg_s, 'PK': pk_s}
-    debug_info['angles'] = {'TH': th_a, 'IX': ix_a, 'MD': md_a, 'RG': rg_a, 'PK': pk_a}
-
-    thumb_ext, index_ext, middle_ext, ring_ext, pinky_ext = (s == "extended" for s in [th_s, ix_s, md_s, rg_s, pk_s])
-    thumb_curled, index_curled, middle_curled, ring_curled, pinky_curled = (s == "curled" for s in [th_s, ix_s, md_s, rg_s, pk_s])
-
-    thumb_index_tip = norm_dist(lm, TH_TIP, IX_TIP)
-
-    if thumb_ext and index_ext and pinky_ext and middle_curled and ring_curled: return "ILY", debug_info
-    if index_ext and pinky_ext and middle_curled and ring_curled: return "ROCK", debug_info
-    if index_ext and middle_ext and ring_ext and pinky_ext: return "FOUR", debug_info
-    if thumb_index_tip < OK_PINCH_THRESH and (middle_ext or ring_ext or pinky_ext): return "OK", debug_info
-    if thumb_index_tip < OK_PINCH_THRESH and not (middle_ext or ring_ext or pinky_ext): return "PINCH", debug_info
-    if thumb_ext and pinky_ext and index_curled and middle_curled and ring_curled: return "CALL_ME", debug_info
-    if index_ext and thumb_ext and middle_curled and ring_curled:
-        ang_t_i = angle_between_points(lm[IX_TIP], lm[IX_MCP], lm[TH_TIP], lm[TH_MCP])
-        idx_len = norm_dist(lm, IX_TIP, IX_MCP)
-        th_len = norm_dist(lm, TH_TIP, TH_MCP)
-        if L_ANGLE_MIN <= ang_t_i <= L_ANGLE_MAX and idx_len > L_INDEX_LEN_MIN and th_len > L_THUMB_LEN_MIN:
-            return "L", debug_info
-    if thumb_ext and index_ext and middle_ext and ring_curled and pinky_curled: return "THREE", debug_info
-    if index_ext and not thumb_ext and not middle_ext and not ring_ext and not pinky_ext: return "ONE", debug_info
-
-    ext_count = sum([thumb_ext, index_ext, middle_ext, ring_ext, pinky_ext])
-    if ext_count <= 1 and not index_ext: return "FIST", debug_info
-    if index_ext and middle_ext and ring_ext and pinky_ext and not (middle_curled or ring_curled): return "PALM", debug_info
-    if index_ext and middle_ext and not (ring_ext or pinky_ext): return "PEACE", debug_info
-    if thumb_ext and index_curled and middle_curled and ring_curled and pinky_curled:
-        margin = max(12, palm_scale(lm) * 0.15)
-        if lm[TH_TIP][1] < lm[WRIST][1] - margin: return "THUMB_UP", debug_info
-        if lm[TH_TIP][1] > lm[WRIST][1] + margin: return "THUMB_DOWN", debug_info
-    if index_ext and not (middle_ext or ring_ext or pinky_ext): return "POINT", debug_info
-
-    return "UNKNOWN", debug_info
+    """
+    Classifies one hand from 21 (x, y) pixel landmarks. Returns (label,
+    debug_info) with the finger states and angles for the dashboard.
+    """
+    states, angles = finger_states(lm)
+    debug_info = {
+        'states': {name: FINGER_STATES[s] for name, s in zip(FINGER_NAMES, states)},
+        'angles': dict(zip(FINGER_NAMES, angles)),
+    }
+
+    steps, label = DECISION_TABLE[state_key(states)]
+    if steps:
+        geometry = HandGeometry(lm)
+        for check, step_label in steps:
+            if GEOMETRY_CHECKS[check](geometry):
+                return step_label, debug_info
+    return label, debug_info
+
+
+# ---------- Vectorized Batch Engine ----------
+# Looks every hand up in the same DECISION_TABLE as classify_gesture, over
+# (N, 21, 2) landmark arrays, for offline re-labelling and threshold sweeps
+# over recorded landmarks.
+
+_MAX_STEPS = max(len(steps) for steps, _ in DECISION_TABLE)
+_CHECK_NAMES = tuple(GEOMETRY_CHECKS)
+_TABLE_DEFAULT = np.array([GESTURE_CODES[label] for _, label in DECISION_TABLE], dtype=np.int8)
+_TABLE_CHECK = np.full((len(DECISION_TABLE), _MAX_STEPS), -1, dtype=np.int8)
+_TABLE_LABEL = np.zeros((len(DECISION_TABLE), _MAX_STEPS), dtype=np.int8)
+for _key, (_steps, _) in enumerate(DECISION_TABLE):
+    for _i, (_check, _label) in enumerate(_steps):
+        _TABLE_CHECK[_key, _i] = _CHECK_NAMES.index(_check)
+        _TABLE_LABEL[_key, _i] = GESTURE_CODES[_label]
+_STATE_WEIGHTS = 3 ** np.arange(len(FINGER_NAMES))
+
+def _batch_dist(lms, i, j):
+    d = lms[:, i] - lms[:, j]
+    return np.hypot(d[..., 0], d[..., 1])
+
+def _batch_angle(a1, a0, b1, b0):
+    v1 = a1 - a0
+    v2 = b1 - b0
+    denom = np.sqrt(np.sum(v1 * v1, axis=-1)) * np.sqrt(np.sum(v2 * v2, axis=-1)) + 1e-6
+    cosang = (v1[..., 0] * v2[..., 0] + v1[..., 1] * v2[..., 1]) / denom
+    return np.degrees(np.arccos(np.clip(cosang, -1.0, 1.0)))
+
+def batch_palm_scale(lms):
+    """Palm scale for every hand in an (N, 21, 2) array, computed once per hand."""
+    lms = np.asarray(lms, dtype=np.float64)[..., :2]
+    s = np.stack([_batch_dist(lms, 0, 5), _batch_dist(lms, 0, 9), _batch_dist(lms, 0, 13)], axis=-1)
+    return np.maximum(np.median(s, axis=-1), 1e-3)
+
+def _batch_pinch(lms, scale):
+    return _batch_dist(lms, TH_TIP, IX_TIP) / scale < OK_PINCH_THRESH
+
+def _batch_l_shape(lms, scale):
+    ang_t_i = _batch_angle(lms[:, IX_TIP], lms[:, IX_MCP], lms[:, TH_TIP], lms[:, TH_MCP])
+    idx_len = _batch_dist(lms, IX_TIP, IX_MCP) / scale
+    th_len = _batch_dist(lms, TH_TIP, TH_MCP) / scale
+    return (L_ANGLE_MIN <= ang_t_i) & (ang_t_i <= L_ANGLE_MAX) & (idx_len > L_INDEX_LEN_MIN) & (th_len > L_THUMB_LEN_MIN)
+
+def _batch_thumb_up(lms, scale):
+    return lms[:, TH_TIP, 1] < lms[:, WRIST, 1] - np.maximum(12, scale * 0.15)
+
+def _batch_thumb_down(lms, scale):
+    return lms[:, TH_TIP, 1] > lms[:, WRIST, 1] + np.maximum(12, scale * 0.15)
+
+_BATCH_CHECKS = {
+    "pinch": _batch_pinch,
+    "l_shape": _batch_l_shape,
+    "thumb_up": _batch_thumb_up,
+    "thumb_down": _batch_thumb_down,
+}
+
+def resolve_codes(keys, check, combos=None):
+    """
+    GESTURE_LABELS codes for an array of DECISION_TABLE keys. `check(name,
+    rows)` returns whether the named geometry check passes for keys[rows],
+    either shaped (len(rows),) or, when evaluating `combos` threshold
+    combinations at once, (combos, len(rows)).
+    """
+    codes = _TABLE_DEFAULT[keys]
+    if combos is not None:
+        codes = np.repeat(codes[None], combos, axis=0)
+    step_checks = _TABLE_CHECK[keys]
+    # Later steps first, so an earlier passing step overwrites them.
+    for step in reversed(range(_MAX_STEPS)):
+        for check_id in np.unique(step_checks[:, step]):
+            if check_id < 0:
+                continue
+            rows = np.flatnonzero(step_checks[:, step] == check_id)
+            passed = check(_CHECK_NAMES[check_id], rows)
+            codes[..., rows] = np.where(passed, _TABLE_LABEL[keys[rows], step], codes[..., rows])
+    return codes
+
+def finger_state_codes(angles, thumb_extended, thumb_curled, ext_angle, curl_angle):
+    """
+    FINGER_STATES codes from (..., 5) angles for the given finger thresholds.
+    The thumb's own rule is passed in already evaluated, as it is not tuned.
+    """
+    extended = angles >= ext_angle
+    curled = angles <= curl_angle
+    extended[..., 0] = thumb_extended
+    curled[..., 0] = thumb_curled
+    # "curled" wins over "extended", as in finger_states.
+    states = np.full(angles.shape, STATE_UNKNOWN, dtype=np.int8)
+    states[extended] = STATE_EXTENDED
+    states[curled] = STATE_CURLED
+    return states
+
+def state_keys(states):
+    """state_key for (..., 5) arrays of finger states."""
+    return states.astype(np.intp) @ _STATE_WEIGHTS
+
+def thumb_rule(angles, lms):
+    """The thumb's (extended, curled) flags: its own angle thresholds plus a wrist-distance check."""
+    wrist_to_tip = _batch_dist(lms, WRIST, TH_TIP)
+    wrist_to_mcp = _batch_dist(lms, WRIST, TH_MCP)
+    return ((angles[:, 0] >= 150) & (wrist_to_tip > wrist_to_mcp * 0.85),
+            (angles[:, 0] <= 120) & (wrist_to_tip < wrist_to_mcp * 0.95))
+
+def joint_angles(lms):
+    """PIP/IP angles in degrees, (N, 5) in FINGER_NAMES order."""
+    tip = lms[:, _FINGER_JOINTS[:, 0]]
+    pip = lms[:, _FINGER_JOINTS[:, 1]]
+    mcp = lms[:, _FINGER_JOINTS[:, 2]]
+    return _batch_angle(tip, pip, mcp, pip)
+
+def classify_gesture_batch(lms):
+    """
+    Classifies N hands at once. Takes an (N, 21, 2) or (N, 21, 3) landmark array
+    (only x/y are used) and returns (codes, angles, states): label codes indexing
+    GESTURE_LABELS, PIP/IP angles in degrees and finger state codes indexing
+    FINGER_STATES, the last two shaped (N, 5) in FINGER_NAMES order.
+    """
+    lms = np.asarray(lms, dtype=np.float64)[..., :2]
+    if lms.ndim != 3 or lms.shape[1] != 21:
+        raise ValueError(f"Expected landmarks shaped (N, 21, 2), got {lms.shape}")
+
+    angles = joint_angles(lms)
+    states = finger_state_codes(angles, *thumb_rule(angles, lms), EXT_ANGLE_DEG, CURL_ANGLE_DEG)
+
+    scale = []  # computed on the first geometry check, for all hands
+    def check(name, rows):
+        if not scale:
+            scale.append(batch_palm_scale(lms))
+        return _BATCH_CHECKS[name](lms[rows], scale[0][rows])
+
+    codes = resolve_codes(state_keys(states), check)
+    return codes, angles, states
+
+def tuning_features(lms):
+    """
+    Everything the tunable thresholds are compared against, per hand of an
+    (N, 21, 2) array: joint angles, the (untuned) thumb rule, and the
+    palm-normalized pinch and L-shape measures. The thumb up/down checks do
+    not depend on tunable thresholds and are evaluated here.
+    """
+    lms = np.asarray(lms, dtype=np.float64)[..., :2]
+    scale = batch_palm_scale(lms)
+    angles = joint_angles(lms)
+    thumb_extended, thumb_curled = thumb_rule(angles, lms)
+    return {
+        "angles": angles,
+        "thumb_extended": thumb_extended,
+        "thumb_curled": thumb_curled,
+        "pinch": _batch_dist(lms, TH_TIP, IX_TIP) / scale,
+        "l_angle": _batch_angle(lms[:, IX_TIP], lms[:, IX_MCP], lms[:, TH_TIP], lms[:, TH_MCP]),
+        "index_len": _batch_dist(lms, IX_TIP, IX_MCP) / scale,
+        "thumb_len": _batch_dist(lms, TH_TIP, TH_MCP) / scale,
+        "thumb_up": _batch_thumb_up(lms, scale),
+        "thumb_down": _batch_thumb_down(lms, scale),
+    }
+
+if os.environ.get(PROFILE_ENV):
+    load_profile(os.environ[PROFILE_ENV])
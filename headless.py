@@ -0,0 +1,116 @@
+# headless.py
+"""
+Output for stream_client.py when nobody watches a window: a small preview
+image rewritten at a capped rate, and periodic throughput and latency
+metrics, printed and optionally appended to a JSON-lines file.
+"""
+import json
+import os
+import threading
+import time
+
+import cv2
+
+from drawing import draw_landmarks
+
+# --- Defaults ---
+PREVIEW_FPS = 1.0
+PREVIEW_WIDTH = 320
+METRICS_INTERVAL = 10.0  # seconds between metrics reports
+
+class PreviewWriter:
+    """Writes a downscaled, annotated JPEG of the latest frame, at most `fps` times a second."""
+
+    def __init__(self, path, fps=PREVIEW_FPS, width=PREVIEW_WIDTH, quality=70):
+        self.path = path
+        self.interval = 1.0 / fps if fps > 0 else 0.0
+        self.width = width
+        self.quality = quality
+        self.written = 0
+        self._last = None
+        root, ext = os.path.splitext(path)
+        self._tmp_path = f"{root}.tmp{ext or '.jpg'}"
+
+    def update(self, frame, res, label, now):
+        """Offers a frame; cheap when it is not yet time for the next preview."""
+        if self._last is not None and now - self._last < self.interval:
+            return False
+        self._last = now
+        h, w = frame.shape[:2]
+        scale = min(self.width / w, 1.0)
+        small = cv2.resize(frame, (max(int(w * scale), 1), max(int(h * scale), 1)), interpolation=cv2.INTER_AREA)
+        if res is not None:
+            draw_landmarks(small, res.multi_hand_landmarks)  # normalized, so any size works
+        cv2.putText(small, label, (8, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+        # Written aside and renamed, so readers never see half an image.
+        cv2.imwrite(self._tmp_path, small, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        os.replace(self._tmp_path, self.path)
+        self.written += 1
+        return True
+
+class ClientMetrics:
+    """
+    Counts processed frames, inference time and commands, and reports them
+    every `interval` seconds. Safe to feed from several threads.
+    """
+
+    def __init__(self, interval=METRICS_INTERVAL, path=None, quiet=False):
+        self.interval = interval
+        self.path = path
+        self.quiet = quiet
+        self._lock = threading.Lock()
+        self._start = self._window_start = time.monotonic()
+        self.totals = {"frames": 0, "commands": 0, "manual": 0}
+        self._reset_window()
+
+    def _reset_window(self):
+        self._frames = 0
+        self._commands = 0
+        self._inference_total = 0.0
+        self._inference_max = 0.0
+
+    def frame(self, inference_s):
+        """Records one processed frame and how long tracking and classification took."""
+        with self._lock:
+            self._frames += 1
+            self.totals["frames"] += 1
+            self._inference_total += inference_s
+            self._inference_max = max(self._inference_max, inference_s)
+            now = time.monotonic()
+            if now - self._window_start >= self.interval:
+                self._emit(now)
+
+    def command(self, manual=False):
+        with self._lock:
+            self._commands += 1
+            self.totals["commands"] += 1
+            if manual:
+                self.totals["manual"] += 1
+
+    def _emit(self, now):
+        elapsed = max(now - self._window_start, 1e-6)
+        record = {
+            "time": round(time.time(), 3),
+            "uptime_s": round(now - self._start, 1),
+            "fps": round(self._frames / elapsed, 2),
+            "inference_ms_mean": round(1000.0 * self._inference_total / max(self._frames, 1), 2),
+            "inference_ms_max": round(1000.0 * self._inference_max, 2),
+            "commands": self._commands,
+            "frames_total": self.totals["frames"],
+            "commands_total": self.totals["commands"],
+        }
+        if not self.quiet:
+            print(f"[metrics] {record['fps']:.1f} fps, inference {record['inference_ms_mean']:.1f} ms "
+                  f"(max {record['inference_ms_max']:.1f}), {record['commands']} commands "
+                  f"({record['commands_total']} total)", flush=True)
+        if self.path:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+        self._window_start = now
+        self._reset_window()
+
+    def report(self):
+        elapsed = max(time.monotonic() - self._start, 1e-6)
+        t = self.totals
+        return (f"Metrics: {t['frames']} frames in {elapsed:.1f}s ({t['frames'] / elapsed:.1f} fps), "
+                f"{t['commands']} commands sent ({t['manual']} manual).")
@@ -1,7 +1,6 @@
 import cv2
-import socket
 import numpy as np
-import time
+from command_client import CommandClient
 
 # --- Connection Settings ---
 PI_ADDRESS = "172.20.10.2" # The IP address of your Raspberry Pi
@@ -18,61 +17,56 @@ KEY_TO_GESTURE = {
     ord('t'): "THUMB_UP",  ord('d'): "THUMB_DOWN",
 }
 
-def send_gesture_command(sock, gesture_label):
-    """Sends a gesture command to the server."""
-    if not gesture_label:
-        return
-    try:
-        label_bytes = gesture_label.encode('utf-8')
-        size_bytes = len(label_bytes).to_bytes(1, 'big')
-        sock.sendall(size_bytes)
-        sock.sendall(label_bytes)
-        print(f"Sent command: '{gesture_label}'")
-    except (BrokenPipeError, ConnectionResetError):
-        print("Connection lost. Could not send command.")
-        return False
-    return True
+def draw_window(status):
+    """The controller window, with the connection status at the bottom."""
+    ui_image = np.zeros((230, 400, 3), dtype=np.uint8)
+    cv2.putText(ui_image, "Keyboard Controller Active", (30, 50), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+    cv2.putText(ui_image, "Press keys to trigger sounds.", (40, 100), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (200, 200, 200), 1)
+    cv2.putText(ui_image, "Press 'q' to quit.", (110, 150), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (200, 200, 200), 1)
+    color = (0, 255, 0) if status.startswith("Connected") else (0, 0, 255)
+    cv2.putText(ui_image, status, (20, 200), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+    return ui_image
 
 def main():
-    print(f"Attempting to connect to Raspberry Pi Audio Server at {PI_ADDRESS}:{PORT}...")
-    
-    try:
-        with socket.socket() as client_socket:
-            client_socket.connect((PI_ADDRESS, PORT))
-            print("Connection successful! Press keys to send gestures. Press 'q' to quit.")
+    print(f"Connecting to Raspberry Pi Audio Server at {PI_ADDRESS}:{PORT}...")
+    print("Press keys to send gestures. Press 'q' to quit.")
 
-            # Create a simple UI window
-            window_name = "Soyle | Keyboard Controller"
-            ui_image = np.zeros((200, 400, 3), dtype=np.uint8)
-            cv2.putText(ui_image, "Keyboard Controller Active", (30, 50), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
-            cv2.putText(ui_image, "Press keys to trigger sounds.", (40, 100), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (200, 200, 200), 1)
-            cv2.putText(ui_image, "Press 'q' to quit.", (110, 150), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (200, 200, 200), 1)
-            
-            last_key = -1
-            
-            while True:
-                cv2.imshow(window_name, ui_image)
-                key = cv2.waitKey(1) & 0xFF
+    # Connects in the background and reconnects by itself after a dropped link.
+    client = CommandClient(PI_ADDRESS, PORT).start()
+    window_name = "Soyle | Keyboard Controller"
+    status = None
+    last_key = -1
+    try:
+        while True:
+            if client.status() != status:
+                status = client.status()
+                cv2.imshow(window_name, draw_window(status))
+            key = cv2.waitKey(1) & 0xFF
 
-                if key != 255 and key != last_key: # New key pressed
-                    if key in KEY_TO_GESTURE:
-                        if not send_gesture_command(client_socket, KEY_TO_GESTURE[key]):
-                            break # Connection failed, exit loop
-                    elif key == ord('q'):
-                        break
-                
-                last_key = key
-                
-                # Check if the window was closed
-                if cv2.getWindowProperty(window_name, cv2.WND_PROP_VISIBLE) < 1:
+            if key != 255 and key != last_key: # New key pressed
+                if key in KEY_TO_GESTURE:
+                    gesture = KEY_TO_GESTURE[key]
+                    if client.send(gesture):
+                        print(f"Sent command: '{gesture}'")
+                    else:
+                        print(f"Queued command: '{gesture}' until the connection is back.")
+                elif key == ord('q'):
                     break
 
-    except ConnectionRefusedError:
-        print(f"Connection refused. Is the stream_server.py script running on the Pi?")
+            last_key = key
+
+            # Check if the window was closed
+            if cv2.getWindowProperty(window_name, cv2.WND_PROP_VISIBLE) < 1:
+                break
+
+    except KeyboardInterrupt:
+        pass
     except Exception as e:
         print(f"An error occurred: {e}")
     finally:
+        client.close()
         cv2.destroyAllWindows()
+        print(client.report())
         print("Client shut down.")
 
 if __name__ == "__main__":
@@ -1,49 +1,40 @@
 import cv2
-import socket
 import numpy as np
+from functools import lru_cache
+from command_client import CommandClient
+from command_protocol import KEY_GESTURES
+from overlay import TextLayer, TextSlot
 
 # --- Configuration ---
 PI_ADDRESS = "172.20.10.2"
 PORT = 8485
+POLL_MS = 100  # waitKey timeout; key presses still return at once
 
 # --- Key to Gesture Mapping ---
 # Organized for a 2-column layout in the UI
-KEY_MAP = [
-    ("1", "FIST", "Call my family"),
-    ("2", "PALM", "I need help"),
-    ("3", "FOUR", "I'm in pain"),
-    ("4", "THREE", "I can't breathe"),
-    ("5", "PEACE", "Where is the bathroom?"),
-]
+KEY_DESCRIPTIONS = {
+    "FIST": "Call my family",
+    "PALM": "I need help",
+    "FOUR": "I'm in pain",
+    "THREE": "I can't breathe",
+    "PEACE": "Where is the bathroom?",
+}
+KEY_MAP = [(str(i), gesture, KEY_DESCRIPTIONS[gesture]) for i, gesture in enumerate(KEY_GESTURES, start=1)]
 KEY_TO_GESTURE = {ord(k[0]): k[1] for k in KEY_MAP}
 
-def send_gesture_command(sock, gesture_label):
-    """Sends a gesture command to the server."""
-    if not gesture_label: return False
-    try:
-        label_bytes = gesture_label.encode('utf-8')
-        size_bytes = len(label_bytes).to_bytes(1, 'big')
-        sock.sendall(size_bytes)
-        sock.sendall(label_bytes)
-        return True
-    except (BrokenPipeError, ConnectionResetError):
-        return False
+# --- Control Panel Rendering ---
+PANEL_SIZE = (700, 480)
+STATUS_TEXT = {True: TextLayer(0.7, (0, 255, 0), 2), False: TextLayer(0.7, (0, 0, 255), 2)}
+COMMAND_TEXT = TextLayer(0.7, (255, 255, 0), 2)
 
-def draw_control_panel(status, last_sent_label):
-    """Creates a visually appealing UI for the keyboard client."""
-    width, height = 700, 480
+@lru_cache(maxsize=1)
+def _static_panel():
+    """Title, key instructions and quit hint, rendered once."""
+    width, height = PANEL_SIZE
     panel = np.zeros((height, width, 3), dtype=np.uint8)
-    
+
     # Title
     cv2.putText(panel, "Demo Control Panel", (30, 40), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-    
-    # Status
-    status_color = (0, 255, 0) if "Connected" in status else (0, 0, 255)
-    cv2.putText(panel, f"Status: {status}", (30, 80), cv2.FONT_HERSHEY_SIMPLEX, 0.7, status_color, 2)
-    
-    # Last Sent Command
-    if last_sent_label:
-        cv2.putText(panel, f"Last Command: {last_sent_label}", (30, 110), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 0), 2)
 
     # Instructions
     start_y = 160
@@ -53,56 +44,71 @@ def draw_control_panel(status, last_sent_label):
         y = start_y + (i % ((len(KEY_MAP) + 1) // 2)) * 30
         text = f"Press '{key.upper()}': {desc}"
         cv2.putText(panel, text, (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (200, 200, 200), 1)
-        
+
     cv2.putText(panel, "Press 'Q' to Quit", (width - 180, height - 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 165, 255), 2)
+    panel.flags.writeable = False
     return panel
 
+class ControlPanel:
+    """The panel image; only the status and last-command lines are ever redrawn."""
+
+    def __init__(self):
+        self.base = _static_panel()
+        self.image = self.base.copy()
+        self.status = TextSlot(STATUS_TEXT[True], (30, 80))
+        self.last_command = TextSlot(COMMAND_TEXT, (30, 110))
+
+    def update(self, status, last_sent_label):
+        """Brings the image up to date. Returns True if it changed and needs showing again."""
+        changed = self.status.update(self.image, self.base, f"Status: {status}",
+                                     STATUS_TEXT["Connected" in status])
+        changed |= self.last_command.update(self.image, self.base,
+                                            f"Last Command: {last_sent_label}" if last_sent_label else "")
+        return changed
+
+def draw_control_panel(status, last_sent_label):
+    """Creates a visually appealing UI for the keyboard client."""
+    panel = ControlPanel()
+    panel.update(status, last_sent_label)
+    return panel.image
+
 def main():
     window_name = "Soyle | Demo Control Panel"
-    status = "Connecting..."
     last_sent_label = ""
-    
+
+    # Connects in the background and reconnects by itself; the panel shows the link state.
+    client = CommandClient(PI_ADDRESS, PORT).start()
+    panel = ControlPanel()
     try:
-        with socket.socket() as client_socket:
-            client_socket.connect((PI_ADDRESS, PORT))
-            status = f"Connected to {PI_ADDRESS}"
-            
-            while True:
-                panel = draw_control_panel(status, last_sent_label)
-                cv2.imshow(window_name, panel)
-                key = cv2.waitKey(1) & 0xFF
-
-                if key != 255: # A key was pressed
-                    if key in KEY_TO_GESTURE:
-                        gesture = KEY_TO_GESTURE[key]
-                        if send_gesture_command(client_socket, gesture):
-                            print(f"Sent command: '{gesture}'")
-                            last_sent_label = gesture
-                        else:
-                            status = "Connection Lost"
-                            break
-                    elif key == ord('q'):
-                        break
-                
-                if cv2.getWindowProperty(window_name, cv2.WND_PROP_VISIBLE) < 1:
+        while True:
+            # Redraw and re-show only when the status or last command changed.
+            if panel.update(client.status(), last_sent_label):
+                cv2.imshow(window_name, panel.image)
+            key = cv2.waitKey(POLL_MS) & 0xFF
+
+            if key != 255: # A key was pressed
+                if key in KEY_TO_GESTURE:
+                    gesture = KEY_TO_GESTURE[key]
+                    if client.send(gesture):
+                        print(f"Sent command: '{gesture}'")
+                    else:
+                        print(f"Queued command: '{gesture}' (waiting for the connection)")
+                    last_sent_label = gesture
+                elif key == ord('q'):
                     break
 
-    except ConnectionRefusedError:
-        status = "Connection Refused (Is server running?)"
-        print(status)
+            if cv2.getWindowProperty(window_name, cv2.WND_PROP_VISIBLE) < 1:
+                break
+
+    except KeyboardInterrupt:
+        pass
     except Exception as e:
-        status = f"Error: {e}"
-        print(status)
+        print(f"Error: {e}")
     finally:
+        client.close()
         cv2.destroyAllWindows()
+        print(client.report())
         print("Client shut down.")
-        
-        # Display final status if connection failed
-        if "Connected" not in status:
-            panel = draw_control_panel(status, "")
-            cv2.imshow(window_name, panel)
-            cv2.waitKey(0)
-            cv2.destroyAllWindows()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,257 @@
+# landmark_log.py
+"""
+Compact binary recording of MediaPipe hand landmarks, and a replay source that
+feeds them back through classify_gesture and the command-sending path without
+a camera or a MediaPipe run per frame.
+
+File layout: a small fixed header followed by fixed-size little-endian records
+(RECORD_DTYPE), one per detected hand, or a single hand_index=-1 record for a
+frame with no hand. Records are appended as they arrive, so a recording that
+was cut off mid-write is still readable up to its last complete record.
+
+Columnar files (.npz) hold the same fields one array per column, plus an
+optional per-record gesture label column, for offline processing of long
+videos where whole columns are read at once.
+"""
+import argparse
+import os
+import struct
+import time
+from collections import Counter
+
+import numpy as np
+
+from gestures import classify_gesture, load_profile
+import stabilizer as label_stabilizer
+from landmark_packets import hands_from_result, HANDEDNESS_CODES
+
+# --- File Format ---
+MAGIC = b"SOYLMK"
+VERSION = 1
+NUM_LANDMARKS = 21
+HEADER = struct.Struct("<6sHHI")  # magic, version, landmarks per hand, record size
+
+RECORD_DTYPE = np.dtype([
+    ("frame", "<u4"),           # frame counter, shared by all hands of one frame
+    ("timestamp", "<f8"),       # seconds, time.time() at capture or receipt
+    ("width", "<u2"),           # frame size the normalized landmarks refer to
+    ("height", "<u2"),
+    ("hand_index", "<i1"),      # position in multi_hand_landmarks, -1 = no hand
+    ("handedness", "<i1"),      # HANDEDNESS_CODES, -1 = unknown
+    ("score", "<f4"),
+    ("landmarks", "<f4", (NUM_LANDMARKS, 3)),  # normalized x, y, z as MediaPipe reports them
+])
+
+
+def frame_records(frame, timestamp, width, height, hands=()):
+    """The RECORD_DTYPE records for one frame's hands, or one hand_index=-1 record if there are none."""
+    records = np.zeros(max(len(hands), 1), dtype=RECORD_DTYPE)
+    records["frame"] = frame
+    records["timestamp"] = timestamp
+    records["width"] = width
+    records["height"] = height
+    records["hand_index"] = -1
+    records["handedness"] = -1
+    for i, (landmarks, handedness, score) in enumerate(hands):
+        records["hand_index"][i] = i
+        records["handedness"][i] = HANDEDNESS_CODES.get(handedness, -1)
+        records["score"][i] = score
+        records["landmarks"][i] = landmarks
+    return records
+
+class LandmarkRecorder:
+    """Appends per-frame landmarks to a recording file."""
+
+    def __init__(self, path, append=False):
+        self.path = path
+        self.frame = 0
+        if append:
+            try:
+                existing = read_landmarks(path)
+            except FileNotFoundError:
+                existing = None
+            if existing is not None:
+                if len(existing):
+                    self.frame = int(existing["frame"][-1]) + 1
+                # Drop a partially written trailing record before appending.
+                self._file = open(path, "r+b")
+                self._file.truncate(HEADER.size + len(existing) * RECORD_DTYPE.itemsize)
+                self._file.seek(0, 2)
+                return
+        self._file = open(path, "wb")
+        self._file.write(HEADER.pack(MAGIC, VERSION, NUM_LANDMARKS, RECORD_DTYPE.itemsize))
+
+    def write(self, timestamp, width, height, hands=()):
+        """
+        Writes one frame. `hands` is a sequence of (landmarks, handedness, score)
+        with landmarks as 21 normalized (x, y, z) points.
+        """
+        self._file.write(frame_records(self.frame, timestamp, width, height, hands).tobytes())
+        self.frame += 1
+
+    def write_result(self, res, width, height, timestamp=None):
+        """Records a MediaPipe Hands result for a frame of the given size."""
+        self.write(time.time() if timestamp is None else timestamp, width, height, hands_from_result(res))
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_landmarks(path):
+    """Memory-maps a recording and returns its records as a RECORD_DTYPE array."""
+    with open(path, "rb") as f:
+        header = f.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise ValueError(f"{path} is not a landmark recording (file too short)")
+    magic, version, num_landmarks, record_size = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a landmark recording (bad magic)")
+    if version != VERSION or num_landmarks != NUM_LANDMARKS or record_size != RECORD_DTYPE.itemsize:
+        raise ValueError(f"{path}: unsupported recording format v{version} "
+                         f"({num_landmarks} landmarks, {record_size}-byte records)")
+
+    count = (os.path.getsize(path) - HEADER.size) // RECORD_DTYPE.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    return np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=HEADER.size, shape=(count,))
+
+def write_columns(path, records, labels=None):
+    """
+    Writes records as a compressed columnar .npz. `labels` optionally holds one
+    GESTURE_LABELS code per record (-1 for no hand).
+    """
+    columns = {name: np.ascontiguousarray(records[name]) for name in RECORD_DTYPE.names}
+    if labels is not None:
+        columns["label"] = np.asarray(labels, dtype=np.int8)
+    np.savez_compressed(path, version=np.uint16(VERSION), **columns)
+
+def read_columns(path):
+    """Reads a columnar .npz back into (records, labels); labels is None if the file has none."""
+    with np.load(path) as data:
+        if int(data["version"]) != VERSION:
+            raise ValueError(f"{path}: unsupported columnar format v{int(data['version'])}")
+        records = np.zeros(len(data["frame"]), dtype=RECORD_DTYPE)
+        for name in RECORD_DTYPE.names:
+            records[name] = data[name]
+        labels = data["label"] if "label" in data.files else None
+    return records, labels
+
+def to_pixels(record):
+    """Converts a record's landmarks to the integer pixel list classify_gesture gets live."""
+    w, h = int(record["width"]), int(record["height"])
+    return [(int(x * w), int(y * h)) for x, y, _ in record["landmarks"].tolist()]
+
+def pixel_array(records):
+    """Pixel landmarks for many records at once, shaped (N, 21, 2), for classify_gesture_batch."""
+    size = np.stack([records["width"], records["height"]], axis=-1).astype(np.float64)
+    return np.trunc(records["landmarks"][..., :2] * size[:, None, :]).astype(np.int32)
+
+def iter_frames(records, realtime=False):
+    """
+    Yields (timestamp, frame_records) per recorded frame. With realtime=True the
+    frames are paced to their recorded timestamps, otherwise as fast as possible.
+    """
+    if not len(records):
+        return
+    frames = records["frame"]
+    bounds = np.flatnonzero(np.diff(frames)) + 1
+    starts = np.concatenate(([0], bounds))
+    ends = np.concatenate((bounds, [len(records)]))
+
+    t0_recorded = float(records["timestamp"][0])
+    t0_wall = time.perf_counter()
+    for start, end in zip(starts, ends):
+        frame_records = records[start:end]
+        timestamp = float(frame_records["timestamp"][0])
+        if realtime:
+            delay = (timestamp - t0_recorded) - (time.perf_counter() - t0_wall)
+            if delay > 0:
+                time.sleep(delay)
+        yield timestamp, frame_records
+
+
+def replay(path, send=None, realtime=True, stabilizer=None):
+    """
+    Replays a recording through classify_gesture and the same send-on-change rule
+    stream_client uses. `send` is called with each label that would be sent to
+    the audio server. With a GestureStabilizer, labels are smoothed over the
+    recorded timestamps first, as they are live. Returns a summary dict.
+    """
+    records = read_landmarks(path)
+    labels = Counter()
+    last_sent_label = None
+    frames = sends = 0
+    start = time.perf_counter()
+
+    for timestamp, frame_records in iter_frames(records, realtime=realtime):
+        first = frame_records[0]
+        if first["hand_index"] >= 0:
+            label, _ = classify_gesture(to_pixels(first))
+            score = float(first["score"])
+        else:
+            label, score = "NO_HAND", 1.0
+        labels[label] += 1
+        frames += 1
+        if stabilizer:
+            label = stabilizer.update(label, timestamp, score)
+
+        if label != last_sent_label and label != "UNKNOWN":
+            if send:
+                send(label)
+            last_sent_label = label
+            sends += 1
+
+    elapsed = time.perf_counter() - start
+    return {
+        "frames": frames,
+        "sends": sends,
+        "elapsed_s": elapsed,
+        "fps": frames / elapsed if elapsed > 0 else 0.0,
+        "labels": dict(labels),
+        "suppressed": stabilizer.suppressed if stabilizer else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a landmark recording through the gesture pipeline.")
+    parser.add_argument("path", help="Recording written by LandmarkRecorder.")
+    parser.add_argument("--fast", action="store_true", help="Replay as fast as possible instead of at recorded speed.")
+    parser.add_argument("--host", help="Send commands to the audio server at this address.")
+    parser.add_argument("--port", type=int, default=8485, help="Audio server port.")
+    parser.add_argument("--gesture-profile", metavar="PATH",
+                        help="Classify with the thresholds of a profile written by tune_thresholds.py.")
+    label_stabilizer.add_arguments(parser)
+    args = parser.parse_args()
+    if args.gesture_profile:
+        load_profile(args.gesture_profile)
+        print(f"Loaded gesture thresholds from {args.gesture_profile}")
+    stabilizer = label_stabilizer.from_args(args)
+
+    if args.host:
+        from command_client import CommandClient
+        with CommandClient(args.host, args.port) as audio:
+            audio.wait_connected(timeout=5.0)
+            summary = replay(args.path, audio.send, realtime=not args.fast, stabilizer=stabilizer)
+        print(audio.report())
+    else:
+        summary = replay(args.path, lambda label: print(f"Would send '{label}'"),
+                         realtime=not args.fast, stabilizer=stabilizer)
+
+    print(f"Replayed {summary['frames']} frames in {summary['elapsed_s']:.2f}s "
+          f"({summary['fps']:.1f} fps), {summary['sends']} commands sent, "
+          f"{summary['suppressed']} suppressed by the stabilizer.")
+    print("Raw labels per frame:")
+    for label, count in sorted(summary["labels"].items(), key=lambda item: -item[1]):
+        print(f"  {label:<10} {count}")
+
+if __name__ == "__main__":
+    main()
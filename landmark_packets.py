@@ -0,0 +1,98 @@
+# landmark_packets.py
+"""
+Compact binary packets for the landmark-only video stream, where the Pi runs
+hand tracking itself and sends 21 points per hand instead of a JPEG. Packets
+travel in the usual 4-byte length framing of video_stream_server and start
+with a type byte, which never collides with a JPEG's 0xFF 0xD8 start marker,
+so clients tell the two stream kinds apart per packet.
+
+Landmark packet: LANDMARK_HEADER, then per hand HAND_HEADER followed by
+21 x (x, y, z) normalized coordinates as float16 or float32.
+Preview packet:  PACKET_PREVIEW followed by a small JPEG thumbnail.
+Frame packet:    FRAME_HEADER (capture time in ns) followed by a full JPEG,
+                 sent instead of a bare JPEG by `video_stream_server.py --timestamps`.
+"""
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+# --- Packet Format ---
+PACKET_LANDMARKS = b'L'
+PACKET_PREVIEW = b'P'
+PACKET_FRAME = b'F'
+JPEG_MAGIC = b'\xff\xd8'
+VERSION = 1
+NUM_LANDMARKS = 21
+
+FLAG_FLOAT16 = 0x01
+
+LANDMARK_HEADER = struct.Struct("<cBBBdHH")  # type, version, flags, hand count, capture time, width, height
+HAND_HEADER = struct.Struct("<bxf")          # handedness code, pad, score
+FRAME_HEADER = struct.Struct("<cQ")          # type, capture time (time.time_ns())
+
+HANDEDNESS_CODES = {"Left": 0, "Right": 1}
+HANDEDNESS_LABELS = {code: label for label, code in HANDEDNESS_CODES.items()}
+
+LandmarkPacket = namedtuple("LandmarkPacket", "timestamp width height hands")
+
+def hands_from_result(res):
+    """
+    Extracts [(landmarks, handedness, score), ...] from a MediaPipe Hands result,
+    with landmarks as 21 normalized (x, y, z) tuples.
+    """
+    hands = []
+    if res.multi_hand_landmarks:
+        for i, hand_lms in enumerate(res.multi_hand_landmarks):
+            label, score = None, 0.0
+            if res.multi_handedness and i < len(res.multi_handedness):
+                classification = res.multi_handedness[i].classification[0]
+                label, score = classification.label, classification.score
+            hands.append(([(p.x, p.y, p.z) for p in hand_lms.landmark], label, score))
+    return hands
+
+def encode_landmark_packet(timestamp, width, height, hands, float16=True):
+    """Packs one frame's hands. float16 halves the size at ~1e-3 relative precision."""
+    dtype = '<f2' if float16 else '<f4'
+    parts = [LANDMARK_HEADER.pack(PACKET_LANDMARKS, VERSION, FLAG_FLOAT16 if float16 else 0,
+                                  len(hands), timestamp, width, height)]
+    for landmarks, handedness, score in hands:
+        parts.append(HAND_HEADER.pack(HANDEDNESS_CODES.get(handedness, -1), score))
+        parts.append(np.asarray(landmarks, dtype=dtype).reshape(NUM_LANDMARKS, 3).tobytes())
+    return b''.join(parts)
+
+def decode_landmark_packet(packet):
+    """Unpacks a landmark packet into a LandmarkPacket with float32 (21, 3) landmark arrays."""
+    kind, version, flags, hand_count, timestamp, width, height = LANDMARK_HEADER.unpack_from(packet)
+    if kind != PACKET_LANDMARKS or version != VERSION:
+        raise ValueError(f"Unsupported landmark packet {kind!r} v{version}")
+    dtype = np.dtype('<f2' if flags & FLAG_FLOAT16 else '<f4')
+    coords_size = NUM_LANDMARKS * 3 * dtype.itemsize
+
+    hands = []
+    offset = LANDMARK_HEADER.size
+    for _ in range(hand_count):
+        handedness, score = HAND_HEADER.unpack_from(packet, offset)
+        offset += HAND_HEADER.size
+        coords = np.frombuffer(packet, dtype=dtype, count=NUM_LANDMARKS * 3, offset=offset)
+        offset += coords_size
+        hands.append((coords.reshape(NUM_LANDMARKS, 3).astype(np.float32),
+                      HANDEDNESS_LABELS.get(handedness), score))
+    return LandmarkPacket(timestamp, width, height, hands)
+
+def encode_preview_packet(jpeg):
+    return PACKET_PREVIEW + jpeg
+
+def encode_frame_packet(capture_ns, jpeg):
+    return FRAME_HEADER.pack(PACKET_FRAME, capture_ns) + jpeg
+
+def decode_frame_packet(packet):
+    """Returns (capture_ns, jpeg) for a frame packet, with the JPEG as a view into `packet`."""
+    _, capture_ns = FRAME_HEADER.unpack_from(packet)
+    return capture_ns, memoryview(packet)[FRAME_HEADER.size:]
+
+def packet_kind(packet):
+    """Returns PACKET_LANDMARKS, PACKET_PREVIEW, PACKET_FRAME or JPEG_MAGIC for a received packet."""
+    if packet[:2] == JPEG_MAGIC:
+        return JPEG_MAGIC
+    return bytes(packet[:1])
@@ -0,0 +1,189 @@
+# latency_trace.py
+"""
+End-to-end latency tracing, from the Pi camera capturing a frame to the audio
+server starting the phrase that frame triggered.
+
+The frame's capture time comes from video_stream_server (`--timestamps`, or
+any landmark packet). stream_client (`--trace`) adds when it received,
+decoded, ran hand tracking on and classified the frame, plus its clock offset
+to the Pi. It sends all of that with the command, and stream_server
+(`--trace-file`) adds the receive and playback-start times. The server then
+writes one JSON line per traced command, with every timestamp moved onto the
+Pi's clock. This script summarizes such a file as per-hop histograms:
+
+    python3 latency_trace.py trace.jsonl
+"""
+import argparse
+import json
+import threading
+from collections import deque
+
+import numpy as np
+
+# (hop name, start event, end event), in pipeline order.
+HOPS = (
+    ("video_link", "capture", "received"),
+    ("decode", "received", "decoded"),
+    ("inference", "decoded", "inferred"),
+    ("classify", "inferred", "classified"),
+    ("client_send", "classified", "sent"),
+    ("command_link", "sent", "server_received"),
+    ("playback_queue", "server_received", "playback"),
+    ("end_to_end", "capture", "playback"),
+)
+HISTOGRAM_EDGES_MS = (0, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+
+# --- Trace Records ---
+
+def trace_events(command, received_ns, playback_ns):
+    """
+    Returns every known timestamp of a traced command in ns on the server's
+    clock. Client-side times are shifted by the offset the client measured.
+    """
+    trace = command.trace
+    offset = trace.offset_ns or 0
+    events = {
+        "capture": trace.capture,  # already on the Pi's clock
+        "received": trace.received and trace.received + offset,
+        "decoded": trace.decoded and trace.decoded + offset,
+        "inferred": trace.inferred and trace.inferred + offset,
+        "classified": trace.classified and trace.classified + offset,
+        "sent": command.sent_ns and command.sent_ns + offset,
+        "server_received": received_ns,
+        "playback": playback_ns,
+    }
+    return {name: value for name, value in events.items() if value}
+
+def hop_latencies(events):
+    """Milliseconds spent in each hop whose start and end are both known."""
+    return {hop: (events[end] - events[start]) / 1e6
+            for hop, start, end in HOPS if start in events and end in events}
+
+class TraceWriter:
+    """
+    Appends one JSON line per traced command. write() only queues the
+    timestamps; a writer thread encodes and saves them, so tracing adds no
+    file I/O to the playback thread whose timing it records.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._cond = threading.Condition()
+        self._pending = deque()  # (command, received_ns, playback_ns)
+        self._closed = False
+        self._file = open(path, "a")
+        self._worker = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+        self._worker.start()
+
+    def write(self, command, received_ns, playback_ns):
+        """Queues a traced command and returns immediately. Safe to call from any thread."""
+        with self._cond:
+            if self._closed:
+                return
+            self._pending.append((command, received_ns, playback_ns))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+                command, received_ns, playback_ns = self._pending.popleft()
+                more = bool(self._pending)
+            events = trace_events(command, received_ns, playback_ns)
+            record = {
+                "label": command.label,
+                "sequence": command.sequence,
+                "clock_offset_ms": (command.trace.offset_ns or 0) / 1e6,
+                "played": playback_ns is not None,
+                "events": events,
+                "hops_ms": hop_latencies(events),
+            }
+            try:
+                self._file.write(json.dumps(record) + "\n")
+                if not more:
+                    self._file.flush()
+                self.count += 1
+            except OSError as e:
+                print(f"Error writing latency trace: {e}")
+
+    def callback(self, command, received_ns, then=None):
+        """Builds a playback on_start callback that traces the command, then calls `then`."""
+        def on_start(playback_ns):
+            self.write(command, received_ns, playback_ns)
+            if then is not None:
+                then(playback_ns)
+        return on_start
+
+    def close(self):
+        """Writes out whatever is still queued, then closes the file."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._worker.join(timeout=5.0)
+        self._file.close()
+
+# --- Report ---
+
+def read_trace(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def histogram(values_ms, edges=HISTOGRAM_EDGES_MS, width=40):
+    """Text histogram with one row per bucket of `edges`, plus an overflow row."""
+    counts, _ = np.histogram(values_ms, bins=list(edges) + [np.inf])
+    peak = max(counts.max(), 1)
+    rows = []
+    for low, high, count in zip(edges, list(edges[1:]) + [None], counts):
+        bucket = f"{low}-{high} ms" if high is not None else f">{low} ms"
+        rows.append(f"  {bucket:>14} {count:>6} {'#' * int(round(width * count / peak))}")
+    return "\n".join(rows)
+
+def summarize(records):
+    """Per-hop count and percentiles in ms, for hops present in any record."""
+    summary = {}
+    for hop, _, _ in HOPS:
+        values = np.array([r["hops_ms"][hop] for r in records if hop in r["hops_ms"]])
+        if values.size:
+            summary[hop] = {
+                "count": int(values.size),
+                "p50_ms": float(np.percentile(values, 50)),
+                "p95_ms": float(np.percentile(values, 95)),
+                "p99_ms": float(np.percentile(values, 99)),
+                "max_ms": float(values.max()),
+                "values": values,
+            }
+    return summary
+
+def print_report(records, show_histograms=True):
+    played = sum(1 for r in records if r["played"])
+    print(f"{len(records)} traced commands, {played} played, {len(records) - played} skipped.")
+    summary = summarize(records)
+    print(f"{'hop':<16}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for hop, s in summary.items():
+        print(f"{hop:<16}{s['count']:>7}{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}"
+              f"{s['p99_ms']:>10.2f}{s['max_ms']:>10.2f}")
+    if show_histograms:
+        for hop, s in summary.items():
+            print(f"\n{hop}:")
+            print(histogram(s["values"]))
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a Soyle end-to-end latency trace.")
+    parser.add_argument('path', help='Trace file written by stream_server.py --trace-file.')
+    parser.add_argument('--label', help='Only include commands for this gesture.')
+    parser.add_argument('--no-histograms', action='store_true', help='Print the percentile table only.')
+    args = parser.parse_args()
+
+    records = read_trace(args.path)
+    if args.label:
+        records = [r for r in records if r["label"] == args.label]
+    if not records:
+        print("No traced commands found.")
+        return
+    print_report(records, show_histograms=not args.no_histograms)
+
+if __name__ == "__main__":
+    main()
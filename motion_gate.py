@@ -0,0 +1,86 @@
+# motion_gate.py
+"""
+Motion-gated scheduling of hand tracking. A tiny grayscale copy of each frame
+is compared with the one hand tracking last ran on; if little has changed, the
+previous result is reused instead of running MediaPipe again. While no hand
+is in view and nothing moves, tracking only runs a few times a second. Any
+motion, or a hand appearing, brings it straight back to every frame.
+"""
+import cv2
+import numpy as np
+
+# --- Gate Settings ---
+GATE_SIZE = 64            # longest side of the grayscale copy compared between frames
+PIXEL_THRESHOLD = 15      # grey levels a pixel must change by to count as moving
+MOTION_FRACTION = 0.01    # share of moving pixels that counts as motion
+IDLE_INTERVAL = 0.25      # seconds between detection runs while NO_HAND and static
+REFRESH_INTERVAL = 0.5    # longest a static hand's result is reused before re-tracking
+
+class MotionGate:
+    """Decides per frame whether hand tracking has to run, and counts what it skipped."""
+
+    def __init__(self, gate_size=GATE_SIZE, pixel_threshold=PIXEL_THRESHOLD, motion_fraction=MOTION_FRACTION,
+                 idle_interval=IDLE_INTERVAL, refresh_interval=REFRESH_INTERVAL):
+        self.gate_size = gate_size
+        self.pixel_threshold = pixel_threshold
+        self.motion_fraction = motion_fraction
+        self.idle_interval = idle_interval
+        self.refresh_interval = refresh_interval
+
+        self._reference = None  # small grayscale frame tracking last ran on
+        self._current = None
+        self._last_run = None
+        self._hand_present = False
+        self.stats = {"frames": 0, "tracked": 0, "static_skips": 0, "idle_skips": 0}
+
+    def _small_gray(self, frame):
+        height, width = frame.shape[:2]
+        scale = self.gate_size / max(width, height)
+        size = (max(int(width * scale), 1), max(int(height * scale), 1))
+        # Bilinear sampling reads only a few pixels per output pixel: ~30x cheaper
+        # than INTER_AREA on a colour frame, and PIXEL_THRESHOLD absorbs its noise.
+        return cv2.cvtColor(cv2.resize(frame, size, interpolation=cv2.INTER_LINEAR), cv2.COLOR_BGR2GRAY)
+
+    def moved(self, gray):
+        if self._reference is None or self._reference.shape != gray.shape:
+            return True
+        changed = cv2.absdiff(gray, self._reference) > self.pixel_threshold
+        return np.count_nonzero(changed) >= self.motion_fraction * changed.size
+
+    def check(self, frame, now):
+        """
+        Returns True if hand tracking should run on this BGR frame (time `now`
+        in seconds), False if the previous result can be reused. Call ran()
+        after every run.
+        """
+        self.stats["frames"] += 1
+        self._current = self._small_gray(frame)
+        if self._last_run is None or self.moved(self._current):
+            return True
+        if self._hand_present:
+            if now - self._last_run >= self.refresh_interval:
+                return True
+            self.stats["static_skips"] += 1
+            return False
+        if now - self._last_run >= self.idle_interval:
+            return True
+        self.stats["idle_skips"] += 1
+        return False
+
+    def ran(self, now, hand_present):
+        """Records that tracking ran on the frame last passed to check()."""
+        self.stats["tracked"] += 1
+        self._reference = self._current
+        self._last_run = now
+        self._hand_present = hand_present
+
+    @property
+    def skipped(self):
+        return self.stats["static_skips"] + self.stats["idle_skips"]
+
+    def report(self):
+        s = self.stats
+        frames = max(s["frames"], 1)
+        return (f"Motion gate: tracked {s['tracked']} of {s['frames']} frames, skipped {self.skipped} "
+                f"({100.0 * self.skipped / frames:.0f}%: {s['static_skips']} static hand, "
+                f"{s['idle_skips']} idle without a hand).")
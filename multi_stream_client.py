@@ -0,0 +1,337 @@
+# multi_stream_client.py
+"""
+Serves several camera streams, each with several hands, from one host.
+
+Every stream has its own receiver thread and audio connection. Hand tracking
+runs in a pool of worker processes; each stream is pinned to one worker,
+because a MediaPipe tracker carries state from frame to frame. Every tick,
+the hands of all streams whose results came back are classified together in
+one classify_gesture_batch call. Each hand's label changes are then sent to
+the audio server of the stream it came from. Streams from a --landmarks
+server skip the workers entirely.
+
+    python3 multi_stream_client.py --stream 172.20.10.2 --stream 172.20.10.3:8486:8485 --workers 4
+
+Aggregate throughput grows with the number of workers while there are at
+least as many streams as workers.
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from multiprocessing.connection import wait
+
+import numpy as np
+
+from gestures import classify_gesture_batch, GESTURE_LABELS
+from landmark_packets import (packet_kind, decode_landmark_packet, decode_frame_packet,
+                              PACKET_LANDMARKS, PACKET_FRAME, JPEG_MAGIC)
+from pipeline import LatestSlot
+from stream_client import FrameReader
+from command_client import CommandClient
+import stabilizer as label_stabilizer
+
+# --- Defaults ---
+VIDEO_PORT = 8486
+AUDIO_PORT = 8485
+STATS_INTERVAL = 10.0  # seconds between throughput printouts
+
+# --- Tracker Workers ---
+
+def tracker_worker(conn, max_hands):
+    """
+    Worker process: decodes JPEGs and runs one MediaPipe tracker per stream it
+    is pinned to. Receives (stream_id, jpeg) and answers with
+    (stream_id, width, height, hands), where hands holds (landmarks, handedness,
+    score) with float32 (21, 3) normalized landmarks. None stops it. A job
+    that fails, such as a corrupt JPEG, is answered with no hands.
+    """
+    import mediapipe as mp
+    import simplejpeg
+    from landmark_packets import hands_from_result
+
+    trackers = {}
+    try:
+        while True:
+            job = conn.recv()
+            if job is None:
+                break
+            stream_id, jpeg = job
+            try:
+                frame = simplejpeg.decode_jpeg(jpeg, colorspace='RGB')
+                tracker = trackers.get(stream_id)
+                if tracker is None:
+                    tracker = trackers[stream_id] = mp.solutions.hands.Hands(
+                        static_image_mode=False, max_num_hands=max_hands,
+                        min_detection_confidence=0.6, min_tracking_confidence=0.6
+                    )
+                res = tracker.process(frame)
+                hands = [(np.asarray(landmarks, dtype=np.float32), handedness, score)
+                         for landmarks, handedness, score in hands_from_result(res)]
+                conn.send((stream_id, frame.shape[1], frame.shape[0], hands))
+            except Exception as e:
+                print(f"Tracker error on stream {stream_id}: {e}")
+                conn.send((stream_id, 0, 0, []))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        for tracker in trackers.values():
+            tracker.close()
+
+# --- Streams ---
+
+class Stream:
+    """One Pi: its video connection, its audio connection and its per-hand command state."""
+
+    def __init__(self, index, host, video_port=VIDEO_PORT, audio_port=AUDIO_PORT, stabilizer_factory=None):
+        self.index = index
+        self.name = f"{host}:{video_port}"
+        self.host, self.video_port, self.audio_port = host, video_port, audio_port
+        self.slot = LatestSlot()  # receiver -> scheduler: ("jpeg", bytes) or ("hands", w, h, hands)
+        self.busy = False         # a frame is out at its worker
+        self.processed = 0
+        self.last_sent = {}       # hand key -> last label sent
+        self.stabilizers = {}     # hand key -> GestureStabilizer
+        self.stabilizer_factory = stabilizer_factory
+        self.audio = None  # CommandClient, reconnecting by itself
+        self.video_socket = None
+
+    def connect(self):
+        self.audio = CommandClient(self.host, self.audio_port, name=f"Stream {self.index} audio").start()
+        self.video_socket = socket.create_connection((self.host, self.video_port))
+        print(f"Stream {self.index}: connected to {self.name} (audio on port {self.audio_port} connects in the background).")
+
+    def receive(self, stop):
+        """Receiver thread: keeps only the newest frame or landmark packet."""
+        reader = FrameReader(self.video_socket)
+        try:
+            while not stop.is_set():
+                packet = reader.read()
+                if packet is None: break
+                kind = packet_kind(packet)
+                if kind == JPEG_MAGIC:
+                    self.slot.put(("jpeg", bytes(packet)))
+                elif kind == PACKET_FRAME:
+                    self.slot.put(("jpeg", bytes(decode_frame_packet(packet)[1])))
+                elif kind == PACKET_LANDMARKS:
+                    landmarks = decode_landmark_packet(packet)
+                    self.slot.put(("hands", landmarks.width, landmarks.height, landmarks.hands))
+                # Preview thumbnails are only for display, which this client has none of.
+        except OSError:
+            pass  # Socket shut down while stopping.
+        finally:
+            print(f"Stream {self.index}: video stream from {self.name} ended.")
+            self.slot.close()
+
+    def send(self, label):
+        self.audio.send(label)  # queued while the audio link is reconnecting
+
+    def close(self):
+        if self.audio:
+            self.audio.close()
+        if self.video_socket:
+            try:
+                self.video_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.video_socket.close()
+
+def parse_stream(text):
+    """HOST[:VIDEO_PORT[:AUDIO_PORT]]"""
+    parts = text.split(':')
+    host = parts[0]
+    video_port = int(parts[1]) if len(parts) > 1 and parts[1] else VIDEO_PORT
+    audio_port = int(parts[2]) if len(parts) > 2 and parts[2] else AUDIO_PORT
+    return host, video_port, audio_port
+
+# --- Batched Classification ---
+
+def hand_keys(hands):
+    """Stable per-hand keys within a stream: handedness when it is unique in the frame."""
+    labels = [handedness for _, handedness, _ in hands]
+    return [handedness if handedness and labels.count(handedness) == 1 else f"hand{i}"
+            for i, handedness in enumerate(labels)]
+
+def classify_tick(results):
+    """
+    Classifies every hand of every result in one batch. `results` holds
+    (stream, width, height, hands); returns {stream: {hand key: (label, score)}}.
+    """
+    landmarks, owners = [], []
+    per_stream = {}
+    for stream, width, height, hands in results:
+        per_stream.setdefault(stream, {})
+        for key, (points, _, score) in zip(hand_keys(hands), hands):
+            # Same truncation to pixels as the live client's int(p.x * w).
+            landmarks.append(np.trunc(np.asarray(points, dtype=np.float64)[:, :2] * (width, height)))
+            owners.append((stream, key, float(score)))
+    if landmarks:
+        codes, _, _ = classify_gesture_batch(np.stack(landmarks))
+        for (stream, key, score), code in zip(owners, codes):
+            per_stream[stream][key] = (GESTURE_LABELS[code], score)
+    return per_stream
+
+def dispatch_labels(stream, labels, now):
+    """Applies per-hand stabilizing and send-on-change for one stream's frame."""
+    stream.processed += 1
+    keys = set(labels) | set(stream.last_sent) | set(stream.stabilizers)
+    for key in keys:
+        label, score = labels.get(key, ("NO_HAND", 1.0))
+        if stream.stabilizer_factory is not None:
+            stabilizer = stream.stabilizers.get(key)
+            if stabilizer is None:
+                stabilizer = stream.stabilizers[key] = stream.stabilizer_factory()
+            label = stabilizer.update(label, now, score)
+        if label != stream.last_sent.get(key) and label != "UNKNOWN":
+            if label != "NO_HAND":
+                print(f"Stream {stream.index} ({key}): sending '{label}'")
+                stream.send(label)
+            stream.last_sent[key] = label
+
+# --- Scheduler ---
+
+def run(streams, workers, stop, max_hands=2):
+    """
+    Hands each idle stream's newest frame to its worker, collects whatever
+    results are ready, and classifies them together, until every stream ends.
+    A worker that dies is restarted; only the frames it had in hand are lost.
+    """
+    conns = [conn for conn, _ in workers]
+
+    def replace_worker(i):
+        print(f"Hand-tracking worker {i} stopped unexpectedly; restarting it.")
+        conns[i].close()
+        workers[i][1].join(timeout=1.0)
+        workers[i] = spawn_worker(max_hands)
+        conns[i] = workers[i][0]
+        for stream in streams:
+            if stream.index % len(conns) == i:
+                stream.busy = False
+
+    last_report = time.monotonic()
+    processed_at_report = 0
+    while not stop.is_set():
+        results = []
+        for stream in streams:
+            if stream.busy:
+                continue
+            item = stream.slot.get(timeout=0)
+            if item is None:
+                continue
+            if item[0] == "jpeg":
+                try:
+                    conns[stream.index % len(conns)].send((stream.index, item[1]))
+                    stream.busy = True
+                except (BrokenPipeError, OSError):
+                    replace_worker(stream.index % len(conns))
+            else:
+                _, width, height, hands = item
+                results.append((stream, width, height, hands))
+
+        for conn in wait(conns, timeout=0.005):
+            try:
+                stream_id, width, height, hands = conn.recv()
+            except (EOFError, OSError):
+                replace_worker(conns.index(conn))
+                continue
+            stream = streams[stream_id]
+            stream.busy = False
+            results.append((stream, width, height, hands))
+
+        if results:
+            now = time.time()
+            labels = classify_tick(results)
+            for stream, _, _, _ in results:
+                dispatch_labels(stream, labels[stream], now)
+
+        if all(stream.slot.closed and not stream.busy for stream in streams):
+            break
+        now = time.monotonic()
+        if now - last_report >= STATS_INTERVAL:
+            processed = sum(stream.processed for stream in streams)
+            print(f"Processing {(processed - processed_at_report) / (now - last_report):.1f} frames/s "
+                  f"across {len(streams)} streams.")
+            last_report, processed_at_report = now, processed
+
+def spawn_worker(max_hands):
+    """Starts one tracker worker and returns (connection, process)."""
+    # Spawned, not forked: the parent already runs threads and may hold MediaPipe state.
+    context = multiprocessing.get_context("spawn")
+    parent_conn, child_conn = context.Pipe()
+    process = context.Process(target=tracker_worker, args=(child_conn, max_hands), daemon=True)
+    process.start()
+    child_conn.close()
+    return parent_conn, process
+
+def start_workers(count, max_hands):
+    return [spawn_worker(max_hands) for _ in range(count)]
+
+def stop_workers(workers):
+    for conn, _ in workers:
+        try:
+            conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+    for _, process in workers:
+        process.join(timeout=5.0)
+        if process.is_alive():
+            process.terminate()
+
+def main():
+    parser = argparse.ArgumentParser(description="Soyle gesture client for several camera streams.")
+    parser.add_argument('--stream', action='append', required=True, metavar='HOST[:VIDEO_PORT[:AUDIO_PORT]]',
+                        help='A video stream server and its audio server. Repeat for more streams.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Hand-tracking processes (at most one per stream is used).')
+    parser.add_argument('--max-hands', type=int, default=2, help='Hands to track per stream.')
+    label_stabilizer.add_arguments(parser)
+    args = parser.parse_args()
+
+    stabilizer_factory = None
+    if label_stabilizer.from_args(args) is not None:
+        stabilizer_factory = lambda: label_stabilizer.from_args(args)
+    streams = [Stream(i, *parse_stream(spec), stabilizer_factory=stabilizer_factory)
+               for i, spec in enumerate(args.stream)]
+
+    worker_count = max(1, min(args.workers, len(streams)))
+    print(f"Starting {worker_count} hand-tracking workers for {len(streams)} streams...")
+    workers = start_workers(worker_count, args.max_hands)
+
+    stop = threading.Event()
+    threads = []
+    start = None
+    try:
+        for stream in streams:
+            stream.connect()
+        start = time.monotonic()
+        for stream in streams:
+            thread = threading.Thread(target=stream.receive, args=(stop,), name=f"receiver-{stream.index}",
+                                      daemon=True)
+            thread.start()
+            threads.append(thread)
+        run(streams, workers, stop, args.max_hands)
+    except ConnectionRefusedError as e:
+        print(f"Connection refused: {e}")
+    except KeyboardInterrupt:
+        print("\nShutting down.")
+    finally:
+        stop.set()
+        for stream in streams:
+            stream.close()
+        for thread in threads:
+            thread.join(timeout=2.0)
+        stop_workers(workers)
+
+        for stream in streams:
+            print(f"Stream {stream.index} ({stream.name}): {stream.processed} frames processed.")
+            if stream.audio:
+                print(f"  {stream.audio.report()}")
+        if start is not None:
+            elapsed = time.monotonic() - start
+            total = sum(stream.processed for stream in streams)
+            print(f"Total: {total} frames in {elapsed:.1f}s ({total / elapsed:.1f} frames/s).")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# overlay.py
+"""
+Layered text rendering for OpenCV overlays. Text is rasterized once into a
+small mask and cached by its content; drawing it is then a masked fill of the
+text's box, instead of rasterizing the glyphs again on every frame. Static
+parts of a view are rendered once into a base image; only boxes whose text
+changed are restored from the base and redrawn.
+
+Plain cv2 and NumPy, so the keyboard panel can use it without MediaPipe.
+"""
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+class TextLayer:
+    """
+    One font, scale, colour and thickness. A string's mask is cached the
+    second time it is drawn; text seen only once (such as a changing number)
+    is drawn with cv2.putText directly, as is text that the frame edge would
+    clip. Masks are kept for the most recently drawn `cache_size` strings.
+    Pixels match cv2.putText with the same arguments.
+    """
+
+    def __init__(self, scale, color, thickness=1, font=cv2.FONT_HERSHEY_SIMPLEX, cache_size=128):
+        self.scale = scale
+        self.color = color
+        self.thickness = thickness
+        self.font = font
+        self.cache_size = cache_size
+        self._masks = OrderedDict()  # text -> (mask, fill, dx, dy)
+        self._seen = OrderedDict()   # text drawn once, not cached yet
+
+    def _pad(self):
+        # Strokes reach past getTextSize's box, tall glyphs such as | [ { by more at larger scales.
+        return int(self.scale * 4) + self.thickness
+
+    def _mask(self, text):
+        cached = self._masks.get(text)
+        if cached is not None:
+            self._masks.move_to_end(text)
+            return cached
+        (width, height), baseline = cv2.getTextSize(text, self.font, self.scale, self.thickness)
+        pad = self._pad()
+        mask = np.zeros((height + baseline + 2 * pad, width + 2 * pad), dtype=np.uint8)
+        cv2.putText(mask, text, (pad, pad + height), self.font, self.scale, 255, self.thickness)
+        # Builds that antialias text leave partial coverage; keep the solid strokes.
+        mask = np.where(mask >= 128, 255, 0).astype(np.uint8)
+        # Trim to the pixels actually set, so redraws touch as little as possible.
+        ys, xs = np.nonzero(mask)
+        if len(ys):
+            mask = np.ascontiguousarray(mask[ys.min():ys.max() + 1, xs.min():xs.max() + 1])
+            dx, dy = int(xs.min()) - pad, int(ys.min()) - pad - height
+        else:
+            mask, dx, dy = mask[:0, :0], 0, 0
+        fill = np.empty(mask.shape + (3,), dtype=np.uint8)
+        fill[:] = self.color
+        cached = (mask, fill, dx, dy)
+        self._masks[text] = cached
+        if len(self._masks) > self.cache_size:
+            self._masks.popitem(last=False)
+        return cached
+
+    def draw(self, frame, text, org):
+        """
+        Draws `text` with its baseline starting at `org`, like cv2.putText.
+        Returns the (x0, y0, x1, y1) box it touched, clipped to the frame, or None.
+        """
+        height, width = frame.shape[:2]
+        if text not in self._masks and text not in self._seen:
+            self._seen[text] = None
+            if len(self._seen) > self.cache_size:
+                self._seen.popitem(last=False)
+            return self._put_text(frame, text, org)
+
+        self._seen.pop(text, None)
+        mask, fill, dx, dy = self._mask(text)
+        x0, y0 = org[0] + dx, org[1] + dy
+        x1, y1 = x0 + mask.shape[1], y0 + mask.shape[0]
+        if x0 < 0 or y0 < 0 or x1 > width or y1 > height:
+            # cv2.putText clips strokes at the edge with its own rounding; let it draw those.
+            return self._put_text(frame, text, org)
+        if x0 == x1 or y0 == y1:
+            return None
+        region = frame[y0:y1, x0:x1]
+        region[...] = cv2.copyTo(fill, mask, region)
+        return x0, y0, x1, y1
+
+    def _put_text(self, frame, text, org):
+        """cv2.putText, returning the padded text box it may have touched, clipped to the frame."""
+        height, width = frame.shape[:2]
+        cv2.putText(frame, text, org, self.font, self.scale, self.color, self.thickness)
+        (w, h), baseline = cv2.getTextSize(text, self.font, self.scale, self.thickness)
+        pad = self._pad()
+        box = (max(org[0] - pad, 0), max(org[1] - h - pad, 0),
+               min(org[0] + w + pad, width), min(org[1] + baseline + pad, height))
+        return box if box[0] < box[2] and box[1] < box[3] else None
+
+def restore(frame, base, box):
+    """Copies a box from the pre-rendered base image back over a frame."""
+    if box is not None:
+        x0, y0, x1, y1 = box
+        frame[y0:y1, x0:x1] = base[y0:y1, x0:x1]
+
+class TextSlot:
+    """
+    A piece of text at a fixed position over a static base image. Redraws
+    only when its text or layer changes, and then only inside the old and new boxes.
+    """
+
+    def __init__(self, layer, org):
+        self.layer = layer
+        self.org = org
+        self.text = None
+        self.box = None
+
+    def update(self, frame, base, text, layer=None):
+        """Returns True if the frame changed."""
+        layer = layer or self.layer
+        if text == self.text and layer is self.layer:
+            return False
+        restore(frame, base, self.box)
+        self.box = layer.draw(frame, text, self.org) if text else None
+        self.text, self.layer = text, layer
+        return True
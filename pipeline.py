@@ -0,0 +1,48 @@
+# pipeline.py
+"""Thread handoff primitives shared by the Mac client and the Pi servers."""
+import threading
+
+class LatestSlot:
+    """
+    A bounded single-slot queue where the newest item wins: putting into a full
+    slot replaces the item the consumer has not taken yet and counts it as
+    dropped, so producers never block and consumers always see fresh data.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = None
+        self._has_item = False
+        self._closed = False
+        self.put_count = 0
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if self._has_item:
+                self.dropped += 1
+            self._item = item
+            self._has_item = True
+            self.put_count += 1
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Takes the newest item. Returns None on timeout or once the slot is closed and empty."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._has_item or self._closed, timeout):
+                return None
+            if not self._has_item:
+                return None
+            item = self._item
+            self._item = None
+            self._has_item = False
+            return item
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
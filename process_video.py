@@ -0,0 +1,237 @@
+# process_video.py
+"""
+Offline hand tracking and gesture labelling for long videos, in parallel.
+
+The video is split into segments that are processed in a pool of worker
+processes, each with its own MediaPipe Hands. Each segment starts a little
+early (the overlap), so its tracker has warmed up by the first frame it
+reports. Segments write their landmarks and labels to columnar files, plus
+annotated video if asked, and are merged in order at the end.
+
+    python3 process_video.py video.mov --landmarks video.npz
+    python3 process_video.py long.mp4 --landmarks long.npz --annotate long_annotated.mp4 --workers 8
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+
+import cv2
+import numpy as np
+
+from gestures import classify_gesture_batch, GESTURE_LABELS
+from landmark_log import frame_records, write_columns, read_columns, pixel_array, RECORD_DTYPE
+
+# --- Defaults ---
+SEGMENT_SECONDS = 60.0
+OVERLAP_SECONDS = 3.0
+NO_HAND = -1  # label code of frames without a hand
+
+def video_info(path):
+    """(fps, frames, width, height). The frame count is the container's estimate, 0 if unknown."""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise ValueError(f"Could not open video file {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.release()
+    return fps, frames, width, height
+
+def plan_segments(total_frames, fps, segment_seconds=SEGMENT_SECONDS, overlap_seconds=OVERLAP_SECONDS):
+    """
+    Returns (index, warmup_start, start, end) frame ranges covering the whole
+    video. `total_frames` is only an estimate, so the last segment's end is
+    None: it reads on to the end of the file, however long that really is.
+    """
+    length = max(int(round(segment_seconds * fps)), 1)
+    overlap = int(round(overlap_seconds * fps))
+    starts = range(0, max(total_frames, 1), length)
+    return [(i, max(start - overlap, 0), start, start + length if i < len(starts) - 1 else None)
+            for i, start in enumerate(starts)]
+
+def seek(cap, frame):
+    """
+    Positions `cap` on `frame` exactly. Many containers only seek to a nearby
+    keyframe, so the rest of the way is read with grab(). Returns False if the
+    video ends first.
+    """
+    if frame > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, frame)
+    position = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+    if not 0 <= position <= frame:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        position = 0
+    while position < frame:
+        if not cap.grab():
+            return False
+        position += 1
+    return True
+
+def label_codes(records):
+    """classify_gesture labels for every hand record at once, NO_HAND for hand-less frames."""
+    codes = np.full(len(records), NO_HAND, dtype=np.int8)
+    has_hand = records["hand_index"] >= 0
+    if has_hand.any():
+        codes[has_hand], _, _ = classify_gesture_batch(pixel_array(records[has_hand]))
+    return codes
+
+# --- Segment Worker ---
+
+def process_segment(path, segment, out_dir, max_hands=2, annotate=False):
+    """
+    Tracks hands over one segment in a worker process. Writes
+    segment_NNNNN.npz (and .mp4 when annotating) into `out_dir` and returns
+    (index, npz path, video path or None, frames, seconds).
+    """
+    import mediapipe as mp
+    index, warmup_start, start, end = segment
+    started = time.perf_counter()
+
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    if not seek(cap, warmup_start):
+        end = warmup_start  # the video is shorter than its estimated frame count
+
+    mp_hands = mp.solutions.hands
+    hands = mp_hands.Hands(static_image_mode=False, max_num_hands=max_hands,
+                           min_detection_confidence=0.6, min_tracking_confidence=0.6)
+    video_path = os.path.join(out_dir, f"segment_{index:05d}.mp4") if annotate else None
+    out = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height)) if annotate else None
+
+    chunks = []
+    frame_index = warmup_start
+    try:
+        while end is None or frame_index < end:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            result = hands.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            if frame_index >= start:
+                hand_list = []
+                if result.multi_hand_landmarks:
+                    for i, hand_landmarks in enumerate(result.multi_hand_landmarks):
+                        classification = result.multi_handedness[i].classification[0]
+                        hand_list.append(([(p.x, p.y, p.z) for p in hand_landmarks.landmark],
+                                          classification.label, classification.score))
+                # Timestamps follow the video clock, as test.py records them.
+                chunks.append(frame_records(frame_index, frame_index / fps, width, height, hand_list))
+                if out is not None:
+                    if result.multi_hand_landmarks:
+                        for hand_landmarks in result.multi_hand_landmarks:
+                            mp.solutions.drawing_utils.draw_landmarks(frame, hand_landmarks,
+                                                                      mp_hands.HAND_CONNECTIONS)
+                    out.write(frame)
+            frame_index += 1
+    finally:
+        cap.release()
+        hands.close()
+        if out is not None:
+            out.release()
+
+    records = np.concatenate(chunks) if chunks else np.zeros(0, dtype=RECORD_DTYPE)
+    npz_path = os.path.join(out_dir, f"segment_{index:05d}.npz")
+    write_columns(npz_path, records, label_codes(records))
+    return index, npz_path, video_path, len(chunks), time.perf_counter() - started
+
+# --- Merging ---
+
+def merge_columns(paths, output_path):
+    """Concatenates segment columnar files in order into one. Returns (records, labels)."""
+    parts = [read_columns(path) for path in paths]
+    if not parts:
+        return np.zeros(0, dtype=RECORD_DTYPE), np.zeros(0, dtype=np.int8)
+    records = np.concatenate([records for records, _ in parts])
+    labels = np.concatenate([labels for _, labels in parts])
+    if output_path:
+        write_columns(output_path, records, labels)
+    return records, labels
+
+def merge_videos(paths, output_path, fps, size):
+    """Joins segment videos in order: stream copy with ffmpeg if available, else re-encoding."""
+    if shutil.which("ffmpeg"):
+        list_path = output_path + ".segments.txt"
+        with open(list_path, "w") as f:
+            f.writelines(f"file '{os.path.abspath(path)}'\n" for path in paths)
+        try:
+            subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-f", "concat", "-safe", "0",
+                            "-i", list_path, "-c", "copy", output_path], check=True)
+            return
+        except subprocess.CalledProcessError:
+            print("ffmpeg concat failed; re-encoding instead.")
+        finally:
+            os.remove(list_path)
+
+    out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+    for path in paths:
+        cap = cv2.VideoCapture(path)
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            out.write(frame)
+        cap.release()
+    out.release()
+
+def main():
+    parser = argparse.ArgumentParser(description="Track and label hands in a video file, in parallel segments.")
+    parser.add_argument('input', nargs='?', default='video.mov', help='Video file to process.')
+    parser.add_argument('--landmarks', metavar='PATH', help='Write merged landmarks and labels to this .npz.')
+    parser.add_argument('--annotate', metavar='PATH',
+                        help='Write video with the landmarks drawn on it (skipped when not given).')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes.')
+    parser.add_argument('--segment-seconds', type=float, default=SEGMENT_SECONDS, help='Length of each segment.')
+    parser.add_argument('--overlap-seconds', type=float, default=OVERLAP_SECONDS,
+                        help='Frames tracked before each segment to warm its tracker up, in seconds.')
+    parser.add_argument('--max-hands', type=int, default=2, help='Hands to track per frame.')
+    args = parser.parse_args()
+
+    fps, total_frames, width, height = video_info(args.input)
+    segments = plan_segments(total_frames, fps, args.segment_seconds, args.overlap_seconds)
+    workers = max(1, min(args.workers, len(segments)))
+    print(f"{args.input}: {total_frames} frames at {fps:.1f} fps, {len(segments)} segments on {workers} workers.")
+
+    start = time.perf_counter()
+    results = {}
+    decoded = {}
+    with tempfile.TemporaryDirectory(prefix="soyle_segments_") as out_dir:
+        # Spawned workers each load their own MediaPipe graph from scratch.
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = [pool.submit(process_segment, args.input, segment, out_dir, args.max_hands,
+                                   bool(args.annotate)) for segment in segments]
+            for future in as_completed(futures):
+                index, npz_path, video_path, frames, seconds = future.result()
+                results[index] = (npz_path, video_path)
+                decoded[index] = frames
+                print(f"  segment {index + 1}/{len(segments)}: {frames} frames in {seconds:.1f}s "
+                      f"({frames / max(seconds, 1e-6):.1f} fps)")
+
+        ordered = [results[i] for i in sorted(results)]
+        if not any(decoded.values()):
+            raise SystemExit(f"Error: no frames could be decoded from {args.input}.")
+        records, labels = merge_columns([npz for npz, _ in ordered], args.landmarks)
+        if args.annotate:
+            merge_videos([video for _, video in ordered], args.annotate, fps, (width, height))
+
+    elapsed = time.perf_counter() - start
+    frames = len(np.unique(records["frame"]))
+    print(f"Processed {frames} frames in {elapsed:.1f}s ({frames / elapsed:.1f} fps overall).")
+    first_hand = labels[records["hand_index"] <= 0]
+    counts = Counter("NO_HAND" if code == NO_HAND else GESTURE_LABELS[code] for code in first_hand.tolist())
+    for label, count in counts.most_common():
+        print(f"  {label:<10} {count}")
+    if args.landmarks:
+        print(f"Landmarks and labels saved to {args.landmarks}")
+    if args.annotate:
+        print(f"Annotated video saved to {args.annotate}")
+
+if __name__ == "__main__":
+    main()
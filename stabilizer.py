@@ -0,0 +1,116 @@
+# stabilizer.py
+"""
+Temporal smoothing of per-frame gesture labels, so that a label seen for a
+frame or two (such as POINT on the way to PEACE) never reaches the audio
+server. Used by stream_client (live) and landmark_log (replay).
+"""
+from collections import deque
+
+# --- Defaults ---
+WINDOW = 5          # frames of history that vote
+ENTER_SHARE = 0.6   # vote share a new label needs to take over
+EXIT_SHARE = 0.4    # the current label holds while its share is at least this
+DWELL_SECONDS = 0.1 # a new label must stay the winner this long before it is output
+
+class GestureStabilizer:
+    """
+    Confidence-weighted voting over a ring buffer of recent labels, with
+    enter/exit hysteresis and a dwell time. Each update is O(1): the buffer
+    keeps running per-label weights, and the label set is small and fixed.
+
+    It also counts the commands it saved: how many times the raw labels would
+    have triggered a send under stream_client's send-on-change rule, against
+    how many times the stable label did.
+    """
+
+    def __init__(self, window=WINDOW, enter=ENTER_SHARE, exit=EXIT_SHARE, dwell=DWELL_SECONDS,
+                 initial="NO_HAND"):
+        if not 0 < exit <= enter <= 1:
+            raise ValueError("Shares must satisfy 0 < exit <= enter <= 1")
+        self.window = window
+        self.enter = enter
+        self.exit = exit
+        self.dwell = dwell
+        self.label = initial
+
+        self._history = deque()  # (label, weight)
+        self._weights = {}
+        self._total = 0.0
+        self._candidate = None
+        self._candidate_since = None
+        self._raw_last = None
+        self._stable_last = initial  # the starting label is not evidence of a gesture
+        self.stats = {"frames": 0, "raw_sends": 0, "sends": 0, "switches": 0}
+
+    def update(self, label, timestamp, confidence=1.0):
+        """
+        Adds one frame's label, with `timestamp` in seconds (live or recorded)
+        and an optional confidence as its vote weight. Returns the stable label.
+        """
+        if len(self._history) == self.window:
+            old_label, old_weight = self._history.popleft()
+            remaining = self._weights[old_label] - old_weight
+            if remaining > 1e-9:
+                self._weights[old_label] = remaining
+            else:
+                del self._weights[old_label]
+            self._total -= old_weight
+        weight = max(confidence, 1e-3)
+        self._history.append((label, weight))
+        self._weights[label] = self._weights.get(label, 0.0) + weight
+        self._total += weight
+
+        leader = max(self._weights, key=self._weights.get)
+        total = max(self._total, 1e-9)
+        candidate = None
+        if (leader != self.label and self._weights[leader] / total >= self.enter
+                and self._weights.get(self.label, 0.0) / total < self.exit):
+            candidate = leader
+
+        if candidate != self._candidate:
+            self._candidate = candidate
+            self._candidate_since = timestamp
+        if candidate is not None and timestamp - self._candidate_since >= self.dwell:
+            self.label = candidate
+            self._candidate = None
+            self.stats["switches"] += 1
+
+        self._count(label)
+        return self.label
+
+    def _count(self, raw_label):
+        stats = self.stats
+        stats["frames"] += 1
+        if raw_label != self._raw_last and raw_label != "UNKNOWN":
+            stats["raw_sends"] += 1
+            self._raw_last = raw_label
+        if self.label != self._stable_last and self.label != "UNKNOWN":
+            stats["sends"] += 1
+            self._stable_last = self.label
+
+    @property
+    def suppressed(self):
+        """Commands the raw labels would have sent that the stable label did not."""
+        return max(self.stats["raw_sends"] - self.stats["sends"], 0)
+
+    def report(self):
+        s = self.stats
+        return (f"Stabilizer: {s['frames']} frames, {s['sends']} commands instead of {s['raw_sends']} "
+                f"({self.suppressed} suppressed).")
+
+def add_arguments(parser):
+    """Adds the stabilizer's command-line options to an argparse parser."""
+    parser.add_argument('--window', type=int, default=WINDOW,
+                        help='Frames of label history that vote (1 disables stabilizing).')
+    parser.add_argument('--dwell', type=float, default=DWELL_SECONDS,
+                        help='Seconds a new label must keep winning before it is sent.')
+    parser.add_argument('--enter', type=float, default=ENTER_SHARE,
+                        help='Vote share a new label needs to replace the current one.')
+    parser.add_argument('--exit', type=float, default=EXIT_SHARE,
+                        help='Vote share below which the current label can be replaced.')
+
+def from_args(args):
+    """A stabilizer configured from add_arguments' options, or None if --window is 1 or less."""
+    if args.window <= 1:
+        return None
+    return GestureStabilizer(window=args.window, enter=args.enter, exit=args.exit, dwell=args.dwell)
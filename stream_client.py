@@ -5,6 +5,9 @@ import numpy as np
 import simplejpeg
 import mediapipe as mp
 import time
+import argparse
+import signal
+import threading
 
 # --- Connection Settings ---
 PI_ADDRESS = "172.20.10.2"
@@ -21,21 +24,376 @@ KEY_TO_GESTURE = {
 }
 
 # --- Local Mac module imports ---
-from gestures import classify_gesture
-from drawing import draw_ui, draw_landmarks, DebugDashboard
+from gestures import classify_gesture, load_profile
+from drawing import draw_ui, draw_landmarks, draw_link_status, hands_result, DebugDashboard
+from landmark_log import LandmarkRecorder
+from landmark_packets import (packet_kind, decode_landmark_packet, decode_frame_packet,
+                              PACKET_LANDMARKS, PACKET_PREVIEW, PACKET_FRAME, JPEG_MAGIC)
+from pipeline import LatestSlot
+from motion_gate import MotionGate
+from command_protocol import Trace
+from command_client import CommandClient
+from headless import ClientMetrics, PreviewWriter, PREVIEW_FPS, PREVIEW_WIDTH, METRICS_INTERVAL
+import stabilizer as label_stabilizer
 
-def send_audio_command(sock, gesture_label):
-    """Sends a gesture label to the audio server."""
-    if not gesture_label: return
+WINDOW_NAME = "Soyle | Pi Stream Client"
+
+class FrameReader:
+    """
+    Reads length-prefixed frames from the video socket with recv_into, into one
+    growable buffer that is reused across frames, so receiving allocates nothing
+    per frame once the buffer has grown to the largest frame seen.
+    """
+
+    def __init__(self, sock, initial_size=256 * 1024):
+        self.sock = sock
+        self._header = bytearray(4)
+        self._buffer = bytearray(initial_size)
+        self._view = memoryview(self._buffer)
+
+    def _recv_exactly(self, view):
+        while view:
+            received = self.sock.recv_into(view)
+            if not received: return False  # Server disconnected
+            view = view[received:]
+        return True
+
+    def read(self):
+        """
+        Returns a memoryview of the next JPEG, valid only until the next read(),
+        or None once the server disconnects.
+        """
+        if not self._recv_exactly(memoryview(self._header)): return None
+        frame_size = int.from_bytes(self._header, 'big')
+        if frame_size > len(self._buffer):
+            # A bytearray with live memoryviews cannot be resized, so swap in a new one.
+            self._buffer = bytearray(max(frame_size, 2 * len(self._buffer)))
+            self._view = memoryview(self._buffer)
+        frame = self._view[:frame_size]
+        if not self._recv_exactly(frame): return None
+        return frame
+
+class FrameDecoder:
+    """Decodes JPEGs into one reused BGR output array, reallocated only when frames grow."""
+
+    def __init__(self):
+        self._out = None
+
+    def decode(self, jpeg):
+        """Returns the decoded frame, which is overwritten by the next decode()."""
+        height, width, _, _ = simplejpeg.decode_jpeg_header(jpeg)
+        if self._out is None or self._out.size < height * width * 3:
+            self._out = np.empty(height * width * 3, dtype=np.uint8)
+        return simplejpeg.decode_jpeg(jpeg, colorspace='BGR', buffer=self._out)
+
+def next_frame(reader, decode, preview):
+    """
+    Reads video-stream packets until one yields a frame to work on. Returns
+    (frame, remote_hands, stamps), or None once the server disconnects. Plain
+    JPEG frames come back with remote_hands=None and still need hand tracking;
+    landmark packets from a --landmarks server come back with the Pi's hands,
+    over the latest preview thumbnail (kept in `preview`) scaled to frame size.
+    `stamps` holds the frame's time.time_ns() at capture (Pi clock, when the
+    server sends it), receipt and decode, for latency tracing.
+    """
+    while True:
+        packet = reader.read()
+        if packet is None: return None
+        stamps = {"capture": None, "received": time.time_ns()}
+        kind = packet_kind(packet)
+
+        if kind == PACKET_FRAME:
+            stamps["capture"], jpeg = decode_frame_packet(packet)
+            frame = decode(jpeg)
+            stamps["decoded"] = time.time_ns()
+            return frame, None, stamps
+        if kind == JPEG_MAGIC:
+            frame = decode(packet)
+            stamps["decoded"] = time.time_ns()
+            return frame, None, stamps
+        if kind == PACKET_PREVIEW:
+            preview["frame"] = simplejpeg.decode_jpeg(packet[1:], colorspace='BGR')
+        elif kind == PACKET_LANDMARKS:
+            landmarks = decode_landmark_packet(packet)
+            w, h = landmarks.width, landmarks.height
+            if preview.get("frame") is not None:
+                frame = cv2.resize(preview["frame"], (w, h), interpolation=cv2.INTER_LINEAR)
+            else:
+                frame = np.zeros((h, w, 3), dtype=np.uint8)
+            stamps["capture"] = int(landmarks.timestamp * 1e9)
+            stamps["decoded"] = time.time_ns()
+            return frame, landmarks.hands, stamps
+
+def detect_gesture(hands, frame, remote_hands=None, stamps=None):
+    """
+    Runs hand tracking and classification on a BGR frame. Returns (res, label, debug_info).
+    When the Pi already tracked the hands, `remote_hands` is used instead of running hands.process.
+    Inference and classification end times are added to `stamps` if given.
+    """
+    if remote_hands is None:
+        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        res = hands.process(frame_rgb)
+    else:
+        res = hands_result(remote_hands)
+    if stamps is not None:
+        stamps["inferred"] = time.time_ns()
+
+    if res.multi_hand_landmarks:
+        h, w = frame.shape[:2]
+        lm = [(int(p.x * w), int(p.y * h)) for p in res.multi_hand_landmarks[0].landmark]
+        label, debug_info = classify_gesture(lm)
+    else:
+        label, debug_info = "NO_HAND", {}
+    if stamps is not None:
+        stamps["classified"] = time.time_ns()
+    return res, label, debug_info
+
+def gated_detect(gate, last, hands, frame, remote_hands, stamps, frame_time):
+    """
+    detect_gesture behind an optional MotionGate: returns the `last` result
+    again when the gate finds nothing worth re-tracking. Landmark packets from
+    the Pi need no tracking here and always pass through.
+    """
+    if gate is None or remote_hands is not None:
+        return detect_gesture(hands, frame, remote_hands, stamps)
+    if not gate.check(frame, frame_time) and last is not None:
+        return last
+    result = detect_gesture(hands, frame, remote_hands, stamps)
+    gate.ran(frame_time, bool(result[0].multi_hand_landmarks))
+    return result
+
+def hand_score(res):
+    """MediaPipe's confidence in the first hand, used as its label's vote weight."""
+    if res.multi_handedness:
+        return res.multi_handedness[0].classification[0].score
+    return 1.0
+
+def stabilize(stabilizer, label, res, frame_time):
+    """The label to act on: smoothed over recent frames, or the raw one without a stabilizer."""
+    if stabilizer is None:
+        return label
+    return stabilizer.update(label, frame_time, hand_score(res))
+
+def frame_trace(stamps, clock_offset):
+    """The Trace sent with a command triggered by this frame, or None when not tracing."""
+    if clock_offset is None:
+        return None
+    return Trace(clock_offset, stamps.get("capture"), stamps.get("received"), stamps.get("decoded"),
+                 stamps.get("inferred"), stamps.get("classified"))
+
+def render_frame(frame, display_label, res, gesture_debug_info, dashboard, audio=None):
+    """Draws the overlay and dashboard onto the frame and shows it."""
+    draw_ui(frame, display_label)
+    draw_landmarks(frame, res.multi_hand_landmarks)
+    dashboard.render(frame, res, gesture_debug_info)
+    if audio is not None and not audio.connected:
+        draw_link_status(frame, f"Audio: {audio.status()}")
+    cv2.imshow(WINDOW_NAME, frame)
+
+def run_serial(hands, audio, video_socket, recorder, dashboard, stabilizer=None,
+               gate=None, metrics=None, preview_writer=None, headless=False):
+    """
+    Receives, infers and renders one frame at a time in a single loop.
+    Commands go out through the CommandClient `audio`; when it knows the
+    clock offset to the Pi, they carry their frame's latency trace.
+    With `headless`, nothing is drawn or shown and there is no keyboard override.
+    """
+    last_sent_label = None
+    detection = None
+    reader = FrameReader(video_socket)
+    decoder = FrameDecoder()
+    preview = {"frame": None}
+    while True:
+        # 1. Handle keyboard input for manual override
+        key = 255 if headless else cv2.waitKey(1) & 0xFF
+        manual_gesture = KEY_TO_GESTURE.get(key)
+
+        if manual_gesture:
+            audio.send(manual_gesture)
+            last_sent_label = manual_gesture
+            if metrics: metrics.command(manual=True)
+            print(f"MANUAL OVERRIDE: Sent '{manual_gesture}'")
+        elif key == ord('q'):
+            break
+
+        # 2. Receive and decode video frame
+        item = next_frame(reader, decoder.decode, preview)
+        if item is None: break
+        frame_time = time.time()
+        frame, remote_hands, stamps = item
+
+        # 3. Process the frame for gesture recognition
+        started = time.perf_counter()
+        detection = gated_detect(gate, detection, hands, frame, remote_hands, stamps, frame_time)
+        res, raw_label, gesture_debug_info = detection
+        if metrics: metrics.frame(time.perf_counter() - started)
+        stable_label = stabilize(stabilizer, raw_label, res, frame_time)
+        if recorder:
+            h, w = frame.shape[:2]
+            recorder.write_result(res, w, h, frame_time)
+
+        # 4. Send auto-detected gesture if it's new and not overridden
+        if stable_label != last_sent_label and stable_label != "UNKNOWN" and not manual_gesture:
+            audio.send(stable_label, frame_trace(stamps, audio.clock_offset))
+            last_sent_label = stable_label
+            if metrics: metrics.command()
+
+        # 5. Draw UI and display
+        display_label = manual_gesture if manual_gesture else stable_label
+        if preview_writer:
+            preview_writer.update(frame, res, display_label, frame_time)
+        if not headless:
+            render_frame(frame, display_label, res, gesture_debug_info, dashboard, audio)
+
+def run_pipelined(hands, audio, video_socket, recorder, dashboard, stabilizer=None,
+                  gate=None, metrics=None, preview_writer=None, headless=False):
+    """
+    Runs receive/decode and inference in background threads, connected to the
+    render loop by latest-frame-wins slots. Inference always takes the newest
+    decoded frame and the UI never blocks the network reader, so throughput
+    follows the slowest stage instead of the sum of all of them. With
+    `headless`, the main thread only feeds the preview writer, if any.
+    """
+    frame_slot = LatestSlot()   # receiver -> inference: (frame_time, frame, remote_hands, stamps)
+    result_slot = LatestSlot()  # inference -> render: (frame, res, label, debug_info)
+    stop = threading.Event()
+    send_lock = threading.Lock()  # auto and manual commands share the last-sent label
+    command_state = {"last_sent_label": None}
+
+    def receiver():
+        reader = FrameReader(video_socket)
+        preview = {"frame": None}
+        # Decoded frames outlive this loop iteration in the slots, so they
+        # get their own arrays rather than FrameDecoder's reused one.
+        decode = lambda jpeg: simplejpeg.decode_jpeg(jpeg, colorspace='BGR')
+        try:
+            while not stop.is_set():
+                item = next_frame(reader, decode, preview)
+                if item is None: break
+                frame, remote_hands, stamps = item
+                frame_slot.put((time.time(), frame, remote_hands, stamps))
+        except OSError:
+            pass  # Socket shut down while stopping.
+        except Exception as e:
+            print(f"Receiver error: {e}")
+        finally:
+            stop.set()
+            frame_slot.close()
+
+    def inference():
+        detection = None
+        try:
+            while not stop.is_set():
+                item = frame_slot.get(timeout=0.1)
+                if item is None:
+                    if frame_slot.closed: break
+                    continue
+                frame_time, frame, remote_hands, stamps = item
+                started = time.perf_counter()
+                detection = gated_detect(gate, detection, hands, frame, remote_hands, stamps, frame_time)
+                res, raw_label, debug_info = detection
+                if metrics: metrics.frame(time.perf_counter() - started)
+                label = stabilize(stabilizer, raw_label, res, frame_time)
+                if recorder:
+                    h, w = frame.shape[:2]
+                    recorder.write_result(res, w, h, frame_time)
+
+                with send_lock:
+                    if label != command_state["last_sent_label"] and label != "UNKNOWN":
+                        audio.send(label, frame_trace(stamps, audio.clock_offset))
+                        command_state["last_sent_label"] = label
+                        if metrics: metrics.command()
+                result_slot.put((frame, res, label, debug_info))
+        except Exception as e:
+            print(f"Inference error: {e}")
+        finally:
+            stop.set()
+            result_slot.close()
+
+    threads = [
+        threading.Thread(target=receiver, name="receiver", daemon=True),
+        threading.Thread(target=inference, name="inference", daemon=True),
+    ]
+    for t in threads:
+        t.start()
+
+    start = time.perf_counter()
+    rendered = 0
     try:
-        label_bytes = gesture_label.encode('utf-8')
-        size_bytes = len(label_bytes).to_bytes(1, 'big')
-        sock.sendall(size_bytes)
-        sock.sendall(label_bytes)
-    except (BrokenPipeError, ConnectionResetError):
-        print("Audio server connection lost.")
+        # Rendering stays on the main thread, as OpenCV's GUI requires.
+        while not stop.is_set():
+            key = 255 if headless else cv2.waitKey(1) & 0xFF
+            manual_gesture = KEY_TO_GESTURE.get(key)
+            if manual_gesture:
+                with send_lock:
+                    audio.send(manual_gesture)
+                    command_state["last_sent_label"] = manual_gesture
+                if metrics: metrics.command(manual=True)
+                print(f"MANUAL OVERRIDE: Sent '{manual_gesture}'")
+            elif key == ord('q'):
+                break
+
+            # Without a window there is no event loop to keep alive, so wait longer.
+            item = result_slot.get(timeout=0.1 if headless else 0.005)
+            if item is None:
+                continue
+            frame, res, label, debug_info = item
+            display_label = manual_gesture if manual_gesture else label
+            if preview_writer:
+                preview_writer.update(frame, res, display_label, time.time())
+            if not headless:
+                render_frame(frame, display_label, res, debug_info, dashboard, audio)
+                rendered += 1
+    finally:
+        stop.set()
+        try:
+            video_socket.shutdown(socket.SHUT_RDWR)  # Unblocks the receiver's recv().
+        except OSError:
+            pass
+        for t in threads:
+            t.join(timeout=2.0)
+
+        elapsed = max(time.perf_counter() - start, 1e-6)
+        print(f"Pipeline: received {frame_slot.put_count} ({frame_slot.put_count / elapsed:.1f} fps), "
+              f"inferred {result_slot.put_count} ({result_slot.put_count / elapsed:.1f} fps, "
+              f"{frame_slot.dropped} stale frames skipped), "
+              f"rendered {rendered} ({rendered / elapsed:.1f} fps, {result_slot.dropped} skipped)")
+
+def _raise_interrupt(signum, frame):
+    raise KeyboardInterrupt
 
 def main():
+    parser = argparse.ArgumentParser(description="Soyle camera gesture client.")
+    parser.add_argument('--record', metavar='PATH',
+                        help='Record per-frame hand landmarks to this file for later replay.')
+    parser.add_argument('--pipelined', action='store_true',
+                        help='Run receive/decode, inference and rendering as separate threads '
+                             'that always work on the newest frame.')
+    parser.add_argument('--trace', action='store_true',
+                        help='Measure the clock offset to the Pi and send each command with its '
+                             "frame's timestamps, for stream_server.py --trace-file.")
+    parser.add_argument('--motion-gate', action='store_true',
+                        help='Skip hand tracking on frames where nothing moved, and track only a few '
+                             'times a second while no hand is in view.')
+    parser.add_argument('--gesture-profile', metavar='PATH',
+                        help='Classify with the thresholds of a profile written by tune_thresholds.py.')
+    parser.add_argument('--host', default=PI_ADDRESS, help='Address of the Pi running both servers.')
+    headless = parser.add_argument_group('headless operation')
+    headless.add_argument('--headless', action='store_true',
+                          help='Open no window and draw nothing; for running as a service without a display.')
+    headless.add_argument('--preview', metavar='PATH',
+                          help='Keep a small annotated JPEG of the latest frame at this path.')
+    headless.add_argument('--preview-fps', type=float, default=PREVIEW_FPS, help='Preview updates per second.')
+    headless.add_argument('--preview-width', type=int, default=PREVIEW_WIDTH, help='Preview width in pixels.')
+    headless.add_argument('--metrics', metavar='PATH', help='Append periodic metrics to this JSON-lines file.')
+    headless.add_argument('--metrics-interval', type=float, default=METRICS_INTERVAL,
+                          help='Seconds between metrics reports.')
+    label_stabilizer.add_arguments(parser)
+    args = parser.parse_args()
+    if args.gesture_profile:
+        load_profile(args.gesture_profile)
+        print(f"Loaded gesture thresholds from {args.gesture_profile}")
+
     # --- MediaPipe Hands setup ---
     mp_hands = mp.solutions.hands
     hands = mp_hands.Hands(
@@ -45,81 +403,58 @@ def main():
 
     # --- State and Dashboard ---
     dashboard = DebugDashboard()
-    stable_label = "CONNECTING"
-    gesture_debug_info = {}
-    last_sent_label = None
+    recorder = LandmarkRecorder(args.record) if args.record else None
+    stabilizer = label_stabilizer.from_args(args)
+    gate = MotionGate() if args.motion_gate else None
+    preview_writer = PreviewWriter(args.preview, args.preview_fps, args.preview_width) if args.preview else None
+    # Headless runs always report; with a window, only when asked to.
+    metrics = None
+    if args.headless or args.metrics:
+        metrics = ClientMetrics(args.metrics_interval, args.metrics)
 
-    print(f"Attempting to connect to Pi Servers at {PI_ADDRESS}...")
-    
+    # A service manager stops the client with SIGTERM; shut down as on Ctrl-C.
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+
+    print(f"Attempting to connect to Pi Servers at {args.host}...")
+
+    # The audio link reconnects by itself; commands wait in its outbox while it is down.
+    # With --trace it measures the clock offset to the Pi on every connect.
+    audio = CommandClient(args.host, AUDIO_PORT, clock_sync=args.trace).start()
     try:
-        # Establish two separate connections
-        audio_socket = socket.socket()
-        audio_socket.connect((PI_ADDRESS, AUDIO_PORT))
-        print(f"Audio connection on port {AUDIO_PORT} successful!")
-        
+        if not audio.wait_connected(timeout=5.0):
+            print(f"Audio server on port {AUDIO_PORT} is not reachable yet; "
+                  f"commands are queued until it is.")
+
         video_socket = socket.socket()
-        video_socket.connect((PI_ADDRESS, VIDEO_PORT))
+        video_socket.connect((args.host, VIDEO_PORT))
         print(f"Video connection on port {VIDEO_PORT} successful!")
         
-        with audio_socket, video_socket:
-            while True:
-                # 1. Handle keyboard input for manual override
-                key = cv2.waitKey(1) & 0xFF
-                manual_gesture = KEY_TO_GESTURE.get(key)
-                
-                if manual_gesture:
-                    send_audio_command(audio_socket, manual_gesture)
-                    last_sent_label = manual_gesture
-                    print(f"MANUAL OVERRIDE: Sent '{manual_gesture}'")
-                elif key == ord('q'):
-                    break
-
-                # 2. Receive and decode video frame
-                size_bytes = video_socket.recv(4)
-                if not size_bytes: break
-                frame_size = int.from_bytes(size_bytes, 'big')
-
-                jpeg_buffer = b''
-                while len(jpeg_buffer) < frame_size:
-                    chunk = video_socket.recv(frame_size - len(jpeg_buffer))
-                    if not chunk: break
-                    jpeg_buffer += chunk
-                
-                if not jpeg_buffer: break
-                frame = simplejpeg.decode_jpeg(jpeg_buffer, colorspace='BGR')
-
-                # 3. Process the frame for gesture recognition
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                res = hands.process(frame_rgb)
-                
-                h, w = frame.shape[:2]
-                if res.multi_hand_landmarks:
-                    lm = [(int(p.x * w), int(p.y * h)) for p in res.multi_hand_landmarks[0].landmark]
-                    stable_label, gesture_debug_info = classify_gesture(lm)
-                else:
-                    stable_label = "NO_HAND"
-                    gesture_debug_info = {}
-
-                # 4. Send auto-detected gesture if it's new and not overridden
-                if stable_label != last_sent_label and stable_label != "UNKNOWN" and not manual_gesture:
-                    send_audio_command(audio_socket, stable_label)
-                    last_sent_label = stable_label
-
-                # 5. Draw UI and display
-                # Show the last *sent* label for consistency
-                display_label = manual_gesture if manual_gesture else stable_label
-                draw_ui(frame, display_label)
-                draw_landmarks(frame, res.multi_hand_landmarks)
-                dashboard.render(frame, res, gesture_debug_info)
-                cv2.imshow("Soyle | Pi Stream Client", frame)
+        with video_socket:
+            run = run_pipelined if args.pipelined else run_serial
+            run(hands, audio, video_socket, recorder, dashboard, stabilizer, gate,
+                metrics, preview_writer, args.headless)
 
     except ConnectionRefusedError as e:
         print(f"Connection refused. Are both servers running on the Pi? Port: {e.args[1]}")
+    except KeyboardInterrupt:
+        print("\nShutting down.")
     except Exception as e:
         print(f"An error occurred: {e}")
     finally:
-        cv2.destroyAllWindows()
+        audio.close()
+        print(audio.report())
+        if not args.headless:
+            cv2.destroyAllWindows()
         hands.close()
+        if gate:
+            print(gate.report())
+        if stabilizer:
+            print(stabilizer.report())
+        if metrics:
+            print(metrics.report())
+        if recorder:
+            recorder.close()
+            print(f"Landmarks recorded to {args.record}")
         print("Client shut down.")
 
 if __name__ == "__main__":
@@ -1,82 +1,180 @@
-import socket
+import argparse
+import asyncio
 import time
-from audio import speak_phrase
+from collections import OrderedDict
+from audio import start_engine, make_sink, PlaybackQueue
+from command_protocol import (FLAG_ACK, SyncRequest, configure_socket, parse_record, encode_ack,
+                              encode_sync_reply)
+from latency_trace import TraceWriter
+
+HOST = '0.0.0.0'  # Listen on all available network interfaces
+PORT = 8485
 
 # --- Audio State ---
 # We use a dictionary for debouncing, ensuring sounds don't repeat too rapidly.
+# It is shared by every connected client; all clients run on one event loop
+# thread, so it needs no locking.
 audio_state = {"last_spoken_label": None, "last_spoken_time": 0.0}
 
-def handle_connection(conn):
+# v2 commands seen recently, by (client host, sequence, client send time). A
+# reconnecting client resends commands it could not confirm byte for byte, so
+# one that did arrive the first time is recognized and dropped.
+RECENT_COMMANDS = 512
+recent_commands = OrderedDict()
+
+def is_repeat(host, command):
+    if command.sequence is None:
+        return False  # Legacy commands carry no sequence.
+    key = (host, command.sequence, command.sent_ns)
+    if key in recent_commands:
+        return True
+    recent_commands[key] = None
+    if len(recent_commands) > RECENT_COMMANDS:
+        recent_commands.popitem(last=False)
+    return False
+
+def dispatch_command(label, received, playback, on_start=None):
+    """
+    Debounces a command across all clients and queues it for playback.
+    `on_start` is told when the phrase starts, or None if it is not played.
+    """
+    now = time.time()
+    # Debounce: only speak if it's a new gesture or enough time has passed.
+    if label != audio_state["last_spoken_label"] or (now - audio_state["last_spoken_time"]) > 1.0:
+        print(f"Received command for '{label}', queueing audio...")
+        playback.submit(label, trigger_time=received, on_start=on_start)
+        audio_state["last_spoken_label"] = label
+        audio_state["last_spoken_time"] = now
+    elif on_start:
+        on_start(None)
+
+def ack_callback(writer, command, received_ns):
+    """Builds the playback callback that acks a v2 command from the playback thread."""
+    loop = asyncio.get_running_loop()
+
+    def write_ack(playback_ns):
+        if not writer.is_closing():
+            writer.write(encode_ack(command.sequence, received_ns, playback_ns))
+
+    return lambda playback_ns: loop.call_soon_threadsafe(write_ack, playback_ns)
+
+async def read_command(reader, idle_timeout, read_timeout):
+    """
+    Reads one command in either protocol version, or a clock sync request.
+    Returns None once the client disconnects.
+    """
+    while True:
+        first = await asyncio.wait_for(reader.read(1), idle_timeout)
+        if not first:
+            return None
+        record = parse_record(first)
+        try:
+            size = next(record)
+            while True:
+                data = await asyncio.wait_for(reader.readexactly(size), read_timeout)
+                size = record.send(data)
+        except StopIteration as done:
+            if done.value is not None:
+                return done.value
+
+async def handle_client(reader, writer, playback, read_timeout, idle_timeout, trace_writer=None):
     """
-    This function now runs in the main thread for a single client.
-    It listens for gesture labels and triggers the audio playback.
+    Serves one client until it disconnects. Many of these run concurrently on
+    the event loop, so a slow or stuck client never holds up the others:
+    a command that has started arriving must complete within `read_timeout`,
+    and with `idle_timeout` set, clients silent for that long are dropped.
+    Traced commands are logged to `trace_writer` when their phrase starts.
     """
+    addr = writer.get_extra_info('peername')
+    print(f"Connection established with: {addr}")
+    configure_socket(writer.get_extra_info('socket'))  # Acks leave without Nagle delay
     try:
         while True:
-            # Protocol: a single byte for the label's size, then the UTF-8 label.
-            size_bytes = conn.recv(1)
-            if not size_bytes:
+            command = await read_command(reader, idle_timeout, read_timeout)
+            received_ns = time.time_ns()
+            if command is None:
                 break # Client disconnected
-            
-            label_size = int.from_bytes(size_bytes, 'big')
-            if label_size == 0:
+            if isinstance(command, SyncRequest):
+                # Answered straight away: any delay here skews the client's clock offset.
+                writer.write(encode_sync_reply(command, received_ns))
+                continue
+            received = time.perf_counter()
+            if is_repeat(addr[0], command):
+                print(f"Dropping repeated '{command.label}' (sequence {command.sequence}) from {addr}.")
                 continue
 
-            # Ensure we receive all the bytes for the label
-            label_bytes = b''
-            while len(label_bytes) < label_size:
-                chunk = conn.recv(label_size - len(label_bytes))
-                if not chunk:
-                    break # Client disconnected
-                label_bytes += chunk
-            
-            if not label_bytes:
-                break # Client disconnected
-                
-            label = label_bytes.decode('utf-8')
-
-            now = time.time()
-            # Debounce: only speak if it's a new gesture or enough time has passed.
-            if label != audio_state["last_spoken_label"] or (now - audio_state["last_spoken_time"]) > 1.0:
-                print(f"Received command for '{label}', playing audio...")
-                speak_phrase(label)
-                audio_state["last_spoken_label"] = label
-                audio_state["last_spoken_time"] = now
+            on_start = None
+            if command.flags & FLAG_ACK:
+                on_start = ack_callback(writer, command, received_ns)
+            if trace_writer and command.trace:
+                on_start = trace_writer.callback(command, received_ns, then=on_start)
+            dispatch_command(command.label, received, playback, on_start)
 
+    except asyncio.TimeoutError:
+        print(f"Client {addr} timed out.")
+    except asyncio.IncompleteReadError:
+        print(f"Client {addr} disconnected mid-command.")
+    except ValueError as e:
+        print(f"Client {addr} sent an invalid command: {e}")
     except (BrokenPipeError, ConnectionResetError):
-        print("Client disconnected.")
+        print(f"Client {addr} disconnected.")
     except Exception as e:
         print(f"An error occurred in the connection handler: {e}")
     finally:
-        print("Connection closed.")
-        conn.close()
+        print(f"Connection with {addr} closed.")
+        writer.close()
 
-def main():
-    HOST = '0.0.0.0'  # Listen on all available network interfaces
-    PORT = 8485
-    
-    server_socket = socket.socket()
-    # This option allows the address to be reused immediately after the server is closed.
-    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    
-    server_socket.bind((HOST, PORT))
-    server_socket.listen(0)
+async def serve(playback, read_timeout, idle_timeout, trace_writer=None):
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_client(reader, writer, playback, read_timeout, idle_timeout, trace_writer),
+        HOST, PORT, reuse_address=True)
     print(f"Soyle Audio Server is running on {HOST}:{PORT}")
-    print("Waiting for a client to connect...")
+    print("Waiting for clients to connect...")
+    async with server:
+        await server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description="Soyle audio server.")
+    parser.add_argument('--sink', default='default',
+                        help="Audio output: default, alsa, aplay, null or file:PATH.")
+    parser.add_argument('--bundle', metavar='PATH',
+                        help="Memory-map phrases from a bundle built by audio_bundle.py instead of "
+                             "loading the WAVs in audio_files/.")
+    parser.add_argument('--interrupt', choices=['none', 'urgent', 'always'], default='urgent',
+                        help="Which commands cut off the phrase that is playing.")
+    parser.add_argument('--urgent', default='PALM,THREE',
+                        help="Comma-separated labels treated as urgent by --interrupt urgent.")
+    parser.add_argument('--no-coalesce', action='store_true',
+                        help="Queue a phrase again even if it is already playing or waiting.")
+    parser.add_argument('--max-age', type=float, default=1.5,
+                        help="Drop commands that waited longer than this many seconds (0 disables).")
+    parser.add_argument('--read-timeout', type=float, default=5.0,
+                        help="Seconds a client may take to finish sending a command it started.")
+    parser.add_argument('--idle-timeout', type=float, default=0,
+                        help="Disconnect clients that send nothing for this many seconds (0 disables).")
+    parser.add_argument('--trace-file', metavar='PATH',
+                        help="Append end-to-end latency traces of traced commands to this file "
+                             "(summarize with latency_trace.py).")
+    args = parser.parse_args()
+
+    # Load every phrase and open the output once, before any command arrives.
+    engine = start_engine(sink=make_sink(args.sink), bundle=args.bundle)
+    playback = PlaybackQueue(engine, interrupt=args.interrupt, urgent=args.urgent.split(','),
+                             coalesce=not args.no_coalesce, max_age=args.max_age or None)
+    trace_writer = TraceWriter(args.trace_file) if args.trace_file else None
 
     try:
-        while True:
-            # Accept a new connection. This is a blocking call.
-            conn, addr = server_socket.accept()
-            print(f"Connection established with: {addr}")
-            # Handle this one client until they disconnect.
-            handle_connection(conn)
-            print("Client disconnected. Waiting for a new connection...")
-            
+        asyncio.run(serve(playback, args.read_timeout, args.idle_timeout or None, trace_writer))
     except KeyboardInterrupt:
         print("\nServer is shutting down.")
     finally:
-        server_socket.close()
+        playback.close()
+        print(playback.report())
+        print(engine.latency_report())
+        engine.close()
+        if trace_writer:
+            trace_writer.close()
+            print(f"{trace_writer.count} latency traces written to {args.trace_file}")
         print("Server has been shut down successfully.")
 
 if __name__ == "__main__":
@@ -1,8 +1,10 @@
 import cv2
 import mediapipe as mp
+from landmark_log import LandmarkRecorder
 
 input_path = "video.mov"  # Replace with your file path
 output_path = "output.mp4"
+landmarks_path = "output_landmarks.lmk"  # Set to None to skip recording landmarks
 
 mp_hands = mp.solutions.hands
 mp_drawing = mp.solutions.drawing_utils
@@ -21,6 +23,7 @@ fps = cap.get(cv2.CAP_PROP_FPS)
 width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
 height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
 out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
+recorder = LandmarkRecorder(landmarks_path) if landmarks_path else None
 
 while cap.isOpened():
     ret, frame = cap.read()
@@ -29,6 +32,9 @@ while cap.isOpened():
 
     image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
     result = hands.process(image_rgb)
+    if recorder:
+        # Timestamps follow the video clock so replays run at recorded speed.
+        recorder.write_result(result, width, height, cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0)
 
     if result.multi_hand_landmarks:
         for hand_landmarks in result.multi_hand_landmarks:
@@ -41,3 +47,6 @@ cap.release()
 out.release()
 hands.close()
 print("✅ Video saved:", output_path)
+if recorder:
+    recorder.close()
+    print("✅ Landmarks saved:", landmarks_path)
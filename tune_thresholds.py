@@ -0,0 +1,264 @@
+# tune_thresholds.py
+"""
+Grid search over the detection thresholds at the top of gestures.py, against
+labelled landmark recordings.
+
+A source is either a columnar .npz with a per-record "label" column (such as
+process_video.py output after hand-correcting it), or any recording followed
+by "=LABEL" when one gesture was held throughout; then only the first hand of
+each frame is used.
+
+    python3 tune_thresholds.py session.npz peace.lmk=PEACE fist.lmk=FIST --output profile.json
+
+Threshold-independent geometry is computed once per hand. For each pair of
+finger angle thresholds, the finger states are looked up in gestures'
+decision table. The combinations of the remaining thresholds are then
+evaluated as NumPy broadcasts, each hand only over the thresholds its table
+entry's geometry checks use. Pairs are spread over worker processes.
+Load the resulting profile with `--gesture-profile profile.json` on
+stream_client.py and landmark_log.py, or with SOYLE_GESTURE_PROFILE=profile.json
+for any program.
+"""
+import argparse
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import gestures
+from gestures import GESTURE_LABELS, GESTURE_CODES, DECISION_TABLE, TUNABLE_THRESHOLDS
+from landmark_log import read_landmarks, read_columns, pixel_array
+
+# --- Default Grid ---
+# (start, stop, step), stop inclusive. Override with --grid NAME=START:STOP:STEP or NAME=VALUE.
+DEFAULT_GRID = {
+    "EXT_ANGLE_DEG": (140, 175, 5),
+    "CURL_ANGLE_DEG": (110, 150, 5),
+    "OK_PINCH_THRESH": (0.20, 0.44, 0.03),
+    "L_ANGLE_MIN": (45, 75, 7.5),
+    "L_ANGLE_MAX": (105, 135, 7.5),
+    "L_INDEX_LEN_MIN": (0.36, 0.60, 0.06),
+    "L_THUMB_LEN_MIN": (0.28, 0.52, 0.06),
+}
+# Thresholds evaluated together in one broadcast; the two angle thresholds vary per task.
+BROADCAST_THRESHOLDS = TUNABLE_THRESHOLDS[2:]
+BLOCK_ELEMENTS = 1 << 22  # combinations x hands evaluated per broadcast block
+NUM_LABELS = len(GESTURE_LABELS)
+
+# Thresholds each geometry check compares against.
+CHECK_THRESHOLDS = {
+    "pinch": ("OK_PINCH_THRESH",),
+    "l_shape": ("L_ANGLE_MIN", "L_ANGLE_MAX", "L_INDEX_LEN_MIN", "L_THUMB_LEN_MIN"),
+    "thumb_up": (),
+    "thumb_down": (),
+}
+# Per decision-table key, the broadcast thresholds its label can depend on.
+_KEY_THRESHOLDS = [tuple(name for name in BROADCAST_THRESHOLDS
+                         if any(name in CHECK_THRESHOLDS[check] for check, _ in steps))
+                   for steps, _ in DECISION_TABLE]
+
+def grid_values(start, stop, step):
+    count = int(round((stop - start) / step)) + 1
+    return np.round(start + step * np.arange(count), 6)
+
+def parse_grid(overrides):
+    grid = {name: grid_values(*spec) for name, spec in DEFAULT_GRID.items()}
+    for text in overrides or ():
+        name, _, spec = text.partition('=')
+        if name not in grid:
+            raise ValueError(f"Unknown threshold {name!r}; choose from {', '.join(TUNABLE_THRESHOLDS)}")
+        parts = [float(p) for p in spec.split(':')]
+        grid[name] = grid_values(*parts) if len(parts) == 3 else np.array(parts)
+    return grid
+
+# --- Corpus ---
+
+def load_corpus(sources):
+    """Returns (pixel landmarks (N, 21, 2), true label codes (N,)) for all labelled hands."""
+    landmarks, truth = [], []
+    for source in sources:
+        path, _, label = source.partition('=')
+        if path.endswith('.npz'):
+            records, labels = read_columns(path)
+        else:
+            records, labels = np.asarray(read_landmarks(path)), None
+        if label:
+            if label not in GESTURE_CODES:
+                raise ValueError(f"{source}: unknown gesture {label!r}")
+            keep = records["hand_index"] == 0
+            labels = np.full(len(records), GESTURE_CODES[label], dtype=np.int8)
+        elif labels is None:
+            raise ValueError(f"{path} has no label column; give one gesture for it as {path}=LABEL")
+        else:
+            keep = (records["hand_index"] >= 0) & (labels >= 0)
+        landmarks.append(pixel_array(records[keep]))
+        truth.append(labels[keep].astype(np.int8))
+        print(f"  {source}: {int(keep.sum())} labelled hands")
+    return np.concatenate(landmarks), np.concatenate(truth)
+
+# --- Evaluation ---
+
+def geometry_check(features, combo):
+    """A gestures.resolve_codes check over the broadcast thresholds in `combo` (name -> (M,) array)."""
+    def check(name, rows):
+        if name == "pinch":
+            return features["pinch"][rows] < combo["OK_PINCH_THRESH"][:, None]
+        if name == "l_shape":
+            angle = features["l_angle"][rows]
+            return ((combo["L_ANGLE_MIN"][:, None] <= angle) & (angle <= combo["L_ANGLE_MAX"][:, None])
+                    & (features["index_len"][rows] > combo["L_INDEX_LEN_MIN"][:, None])
+                    & (features["thumb_len"][rows] > combo["L_THUMB_LEN_MIN"][:, None]))
+        return features[name][rows]  # thumb_up/thumb_down do not depend on tuned thresholds
+    return check
+
+def evaluate_pair(features, truth, ext_angle, curl_angle, values):
+    """
+    Confusion matrices (M, NUM_LABELS, NUM_LABELS), truth by prediction, for
+    one pair of angle thresholds and every combination of the broadcast
+    thresholds' `values` (name -> grid values), in itertools.product order.
+
+    Hands are grouped by which thresholds their table entry depends on. Each
+    group is evaluated only over the combinations of those (a pinch-only entry
+    over the pinch values, a final entry once), then spread over all M.
+    """
+    states = gestures.finger_state_codes(features["angles"], features["thumb_extended"],
+                                         features["thumb_curled"], ext_angle, curl_angle)
+    keys = gestures.state_keys(states)
+    shape = tuple(len(values[name]) for name in BROADCAST_THRESHOLDS)
+    grid_index = dict(zip(BROADCAST_THRESHOLDS, (i.ravel() for i in np.indices(shape))))
+    confusion = np.zeros((int(np.prod(shape)), NUM_LABELS * NUM_LABELS), dtype=np.int64)
+
+    groups = {}
+    for key in np.unique(keys):
+        groups.setdefault(_KEY_THRESHOLDS[key], []).append(key)
+    for names, group_keys in groups.items():
+        rows = np.flatnonzero(np.isin(keys, group_keys))
+        product = list(itertools.product(*(values[name] for name in names)))
+        combo = {name: np.array(column, dtype=np.float64) for name, column in zip(names, zip(*product))}
+        sub = {name: column[rows] for name, column in features.items()}
+        sub_truth = truth[rows].astype(np.intp) * NUM_LABELS
+        part = np.zeros((len(product), NUM_LABELS * NUM_LABELS), dtype=np.int64)
+        block = max(BLOCK_ELEMENTS // len(rows), 1)
+        for start in range(0, len(product), block):
+            block_combo = {name: column[start:start + block] for name, column in combo.items()}
+            count = min(block, len(product) - start)
+            codes = gestures.resolve_codes(keys[rows], geometry_check(sub, block_combo), combos=count)
+            index = (np.arange(count)[:, None] * (NUM_LABELS * NUM_LABELS) + sub_truth + codes).ravel()
+            part[start:start + count] = np.bincount(
+                index, minlength=count * NUM_LABELS * NUM_LABELS).reshape(count, -1)
+        if names:
+            confusion += part[np.ravel_multi_index([grid_index[name] for name in names],
+                                                   [len(values[name]) for name in names])]
+        else:
+            confusion += part[0]
+    return confusion.reshape(-1, NUM_LABELS, NUM_LABELS)
+
+def scores(confusion):
+    """Per-label (precision, recall, support) and macro F1 over labels present in the truth, per matrix."""
+    tp = np.diagonal(confusion, axis1=-2, axis2=-1).astype(np.float64)
+    support = confusion.sum(axis=-1)
+    predicted = confusion.sum(axis=-2)
+    precision = np.divide(tp, predicted, out=np.zeros_like(tp), where=predicted > 0)
+    recall = np.divide(tp, support, out=np.zeros_like(tp), where=support > 0)
+    f1 = np.divide(2 * precision * recall, precision + recall, out=np.zeros_like(tp),
+                   where=precision + recall > 0)
+    present = support > 0
+    macro = (f1 * present).sum(axis=-1) / np.maximum(present.sum(axis=-1), 1)
+    return precision, recall, support, macro
+
+def evaluate(features, truth, thresholds):
+    """Confusion matrix for one full set of thresholds."""
+    values = {name: np.array([thresholds[name]], dtype=np.float64) for name in BROADCAST_THRESHOLDS}
+    return evaluate_pair(features, truth, thresholds["EXT_ANGLE_DEG"], thresholds["CURL_ANGLE_DEG"], values)[0]
+
+# --- Parallel Search ---
+
+_worker = {}
+
+def _init_worker(features, truth, values):
+    _worker.update(features=features, truth=truth, values=values)
+
+def _score_pair(pair):
+    confusion = evaluate_pair(_worker["features"], _worker["truth"], *pair, _worker["values"])
+    return scores(confusion)[3].astype(np.float32)
+
+def search(features, truth, grid, workers):
+    """Macro F1 of every grid combination, as (angle pairs, scores (pairs, M))."""
+    pairs = [(ext, curl) for ext in grid["EXT_ANGLE_DEG"] for curl in grid["CURL_ANGLE_DEG"] if curl < ext]
+    values = {name: np.asarray(grid[name], dtype=np.float64) for name in BROADCAST_THRESHOLDS}
+    combos = int(np.prod([len(v) for v in values.values()]))
+    print(f"Evaluating {len(pairs) * combos} combinations ({len(pairs)} angle pairs x "
+          f"{combos}) over {len(truth)} hands on {workers} workers...")
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(features, truth, values)) as pool:
+        results = np.stack(list(pool.map(_score_pair, pairs)))
+    return pairs, results
+
+def best_thresholds(pairs, results, grid, current):
+    """The best-scoring combination; ties go to the one nearest the current thresholds, in grid steps."""
+    best = results.max()
+    tied = np.argwhere(results >= best - 1e-9)
+
+    def distance(index):
+        p, m = index
+        values = dict(zip(("EXT_ANGLE_DEG", "CURL_ANGLE_DEG"), pairs[p]))
+        index = np.unravel_index(m, [len(grid[name]) for name in BROADCAST_THRESHOLDS])
+        values.update({name: grid[name][i] for name, i in zip(BROADCAST_THRESHOLDS, index)})
+        steps = {name: (np.ptp(grid[name]) / max(len(grid[name]) - 1, 1)) or 1.0 for name in grid}
+        return sum(((values[name] - current[name]) / steps[name]) ** 2 for name in values), values
+
+    _, values = min((distance(index) for index in tied), key=lambda item: item[0])
+    return {name: float(value) for name, value in values.items()}, float(best)
+
+def print_report(baseline, tuned):
+    b_precision, b_recall, support, b_macro = scores(baseline)
+    t_precision, t_recall, _, t_macro = scores(tuned)
+    print(f"\n{'Gesture':<11}{'Support':>8}  {'Precision':>17}  {'Recall':>17}")
+    for code in np.flatnonzero(support + baseline.sum(axis=0) + tuned.sum(axis=0)):
+        print(f"{GESTURE_LABELS[code]:<11}{int(support[code]):>8}  "
+              f"{b_precision[code]:>7.3f} -> {t_precision[code]:<6.3f}  {b_recall[code]:>7.3f} -> {t_recall[code]:<6.3f}")
+    total = max(int(baseline.sum()), 1)
+    print(f"\nMacro F1 {b_macro:.3f} -> {t_macro:.3f}, accuracy "
+          f"{np.trace(baseline) / total:.3f} -> {np.trace(tuned) / total:.3f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune gestures.py thresholds on labelled landmark recordings.")
+    parser.add_argument('sources', nargs='+', metavar='PATH[=LABEL]',
+                        help='Labelled .npz, or a recording of one held gesture as PATH=LABEL.')
+    parser.add_argument('--grid', action='append', metavar='NAME=START:STOP:STEP',
+                        help='Override the searched values of one threshold (or NAME=VALUE to fix it).')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes.')
+    parser.add_argument('--output', metavar='PATH', help='Write the tuned threshold profile to this JSON file.')
+    args = parser.parse_args()
+
+    grid = parse_grid(args.grid)
+    print("Loading labelled hands:")
+    landmarks, truth = load_corpus(args.sources)
+    if not len(truth):
+        print("No labelled hands found.")
+        return
+    features = gestures.tuning_features(landmarks)
+    current = gestures.current_thresholds()
+
+    start = time.perf_counter()
+    pairs, results = search(features, truth, grid, max(args.workers, 1))
+    tuned, macro = best_thresholds(pairs, results, grid, current)
+    elapsed = time.perf_counter() - start
+    print(f"Searched {results.size} combinations in {elapsed:.1f}s ({results.size / elapsed:.0f}/s).")
+
+    print("\nThreshold           current    tuned")
+    for name in TUNABLE_THRESHOLDS:
+        print(f"{name:<18}{current[name]:>9.3f}{tuned[name]:>9.3f}")
+    print_report(evaluate(features, truth, current), evaluate(features, truth, tuned))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"thresholds": tuned, "macro_f1": round(macro, 4), "hands": int(len(truth)),
+                       "sources": args.sources}, f, indent=2)
+        print(f"\nProfile saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,174 @@
 # video_stream_server.py
+import argparse
 import socket
+import threading
 import time
-from picamera2 import Picamera2
-from libcamera import controls
-import simplejpeg
-import cv2
+
+from frame_sources import Picamera2Source, VideoFileSource, SyntheticSource, SENSOR_MODE_SIZE, encode_yuv420
+from landmark_packets import hands_from_result, encode_landmark_packet, encode_preview_packet, encode_frame_packet
+from pipeline import LatestSlot
+
+STATS_INTERVAL = 10.0  # seconds between stream statistics printouts
+
+def capture_loop(source, frame_slot, client_connected, stop, quality=80, timestamps=False):
+    """
+    Captures and encodes frames continuously in its own thread, so a slow
+    network never stalls the camera. Frames are only encoded while a client
+    is connected; each one replaces any frame the sender has not shipped yet.
+    With `timestamps`, each JPEG goes out as a frame packet carrying the time
+    it was captured, for end-to-end latency tracing.
+    """
+    width, height = source.size
+    try:
+        while not stop.is_set():
+            frame_yuv = source.read()
+            capture_ns = time.time_ns()
+            if not client_connected.is_set():
+                continue
+            # Encode straight from the YUV420 planes: no BGR frame in between.
+            jpeg_buffer = encode_yuv420(frame_yuv, width, height, quality)
+            if timestamps:
+                jpeg_buffer = encode_frame_packet(capture_ns, jpeg_buffer)
+            frame_slot.put(jpeg_buffer)
+    except Exception as e:
+        print(f"Capture error: {e}")
+    finally:
+        stop.set()
+        frame_slot.close()
+
+def landmark_loop(source, frame_slot, preview_slot, client_connected, stop, args):
+    """
+    Landmark-only mode: runs hand tracking here on the Pi and queues compact
+    landmark packets instead of JPEGs, plus a small JPEG preview a few times a
+    second, cutting the stream from tens of KB per frame to ~150 bytes.
+    """
+    import cv2
+    import simplejpeg
+    import mediapipe as mp
+
+    hands = mp.solutions.hands.Hands(
+        static_image_mode=False, max_num_hands=args.max_hands,
+        min_detection_confidence=0.6, min_tracking_confidence=0.6
+    )
+    width, height = source.size
+    preview_interval = 1.0 / args.preview_fps if args.preview_fps > 0 else None
+    last_preview = 0.0
+    try:
+        while not stop.is_set():
+            frame_yuv = source.read()
+            capture_time = time.time()
+            if not client_connected.is_set():
+                continue
+            frame_rgb = cv2.cvtColor(frame_yuv, cv2.COLOR_YUV2RGB_I420)
+            res = hands.process(frame_rgb)
+            frame_slot.put(encode_landmark_packet(capture_time, width, height, hands_from_result(res),
+                                                  float16=not args.float32))
+
+            if preview_interval and capture_time - last_preview >= preview_interval:
+                thumb = cv2.resize(frame_rgb, args.preview_size, interpolation=cv2.INTER_AREA)
+                preview_slot.put(encode_preview_packet(
+                    simplejpeg.encode_jpeg(thumb, quality=60, colorspace='RGB', fastdct=True)))
+                last_preview = capture_time
+    except Exception as e:
+        print(f"Hand tracking error: {e}")
+    finally:
+        hands.close()
+        stop.set()
+        frame_slot.close()
+
+def send_frames(conn, frame_slot, preview_slot=None):
+    """Ships the most recent encoded frame until the client disconnects or capture stops."""
+    sent = 0
+    dropped_at_start = frame_slot.dropped
+    last_report = time.monotonic()
+    sent_at_report = 0
+    while True:
+        jpeg_buffer = frame_slot.get(timeout=1.0)
+        if jpeg_buffer is None:
+            if frame_slot.closed: return
+            continue
+        size_bytes = len(jpeg_buffer).to_bytes(4, 'big')
+        conn.sendall(size_bytes)
+        conn.sendall(jpeg_buffer)
+        sent += 1
+
+        preview = preview_slot.get(timeout=0) if preview_slot else None
+        if preview is not None:
+            conn.sendall(len(preview).to_bytes(4, 'big'))
+            conn.sendall(preview)
+
+        now = time.monotonic()
+        if now - last_report >= STATS_INTERVAL:
+            fps = (sent - sent_at_report) / (now - last_report)
+            print(f"Streaming at {fps:.1f} fps, {frame_slot.dropped - dropped_at_start} frames dropped so far.")
+            last_report, sent_at_report = now, sent
+
+def parse_size(text):
+    if text.lower() == 'none':
+        return None
+    width, height = (int(v) for v in text.lower().split('x'))
+    return width, height
+
+def open_source(args):
+    if args.source == 'file':
+        return VideoFileSource(args.video, size=args.size)
+    if args.source == 'synthetic':
+        return SyntheticSource(size=args.size)
+    return Picamera2Source(size=args.size, main_size=args.main_size)
 
 def main():
     """
     This server captures video from the Pi's camera, applies corrections,
     and streams it over the network to the gesture recognition client.
+    Capture/encode and sending run in separate threads so that a congested
+    link drops stale frames instead of delaying every following one.
     """
+    parser = argparse.ArgumentParser(description="Soyle video stream server.")
+    parser.add_argument('--source', choices=['picamera', 'file', 'synthetic'], default='picamera',
+                        help='Where frames come from. Use file or synthetic to run without a Pi camera.')
+    parser.add_argument('--video', default='video.mov', help='Video file for --source file.')
+    parser.add_argument('--size', type=parse_size, default=(640, 480), help='Streamed frame size, WxH.')
+    parser.add_argument('--main-size', type=parse_size, default=SENSOR_MODE_SIZE,
+                        help="Size of the camera's unused full-resolution stream, or 'none' to stream "
+                             "from the main stream and skip it (saves ISP and memory bandwidth).")
+    parser.add_argument('--quality', type=int, default=80, help='JPEG quality.')
+    parser.add_argument('--landmarks', action='store_true',
+                        help='Run hand tracking on the Pi and stream landmark packets instead of JPEG frames.')
+    parser.add_argument('--max-hands', type=int, default=1, help='Hands to track in --landmarks mode.')
+    parser.add_argument('--float32', action='store_true',
+                        help='Send landmarks as float32 instead of float16 in --landmarks mode.')
+    parser.add_argument('--preview-fps', type=float, default=2.0,
+                        help='Thumbnail rate in --landmarks mode (0 disables previews).')
+    parser.add_argument('--preview-size', type=parse_size, default=(160, 120), help='Thumbnail size, WxH.')
+    parser.add_argument('--port', type=int, default=8486,
+                        help='Port to listen on; give each server on one host its own.')
+    parser.add_argument('--timestamps', action='store_true',
+                        help='Tag each JPEG frame with its capture time, for latency tracing '
+                             '(landmark packets always carry it).')
+    args = parser.parse_args()
+
     print("Initializing camera...")
-    picam2 = Picamera2()
-    
-    # Configure for a wide field of view
-    config = picam2.create_video_configuration(
-        main={"size": (1640, 1232)},
-        lores={"size": (640, 480), "format": "YUV420"}
-    )
-    picam2.configure(config)
-    picam2.set_controls({"AwbEnable": 1, "AwbMode": controls.AwbModeEnum.Auto})
-    picam2.start()
-    time.sleep(2.0)
+    source = open_source(args)
     print("Camera initialized.")
 
+    frame_slot = LatestSlot()
+    preview_slot = LatestSlot() if args.landmarks else None
+    client_connected = threading.Event()
+    stop = threading.Event()
+    if args.landmarks:
+        print("Landmark-only mode: hand tracking runs on the Pi.")
+        capture_thread = threading.Thread(target=landmark_loop,
+                                          args=(source, frame_slot, preview_slot, client_connected, stop, args),
+                                          name="landmarks", daemon=True)
+    else:
+        capture_thread = threading.Thread(target=capture_loop,
+                                          args=(source, frame_slot, client_connected, stop,
+                                                args.quality, args.timestamps),
+                                          name="capture", daemon=True)
+    capture_thread.start()
+
     HOST = '0.0.0.0'
-    PORT = 8486 # Using a different port to not conflict with the audio server
+    PORT = args.port # 8486 by default, to not conflict with the audio server
     
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
         server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -35,30 +177,30 @@ def main():
         print(f"Video Stream Server started on {HOST}:{PORT}. Waiting for connection...")
 
         try:
-            while True:
+            while not stop.is_set():
                 conn, addr = server_socket.accept()
                 with conn:
                     print(f"Video connection from: {addr}")
+                    frame_slot.get(timeout=0)  # Discard a frame left over from the last client.
+                    if preview_slot:
+                        preview_slot.get(timeout=0)
+                    dropped_at_start = frame_slot.dropped
+                    client_connected.set()
                     try:
-                        while True:
-                            frame_bgra = picam2.capture_array("lores")
-                            frame_bgr = cv2.cvtColor(frame_bgra, cv2.COLOR_BGRA2BGR)
-                            
-                            jpeg_buffer = simplejpeg.encode_jpeg(frame_bgr, quality=80, colorspace='BGR', fastdct=True)
-                            
-                            size_bytes = len(jpeg_buffer).to_bytes(4, 'big')
-                            conn.sendall(size_bytes)
-                            conn.sendall(jpeg_buffer)
-                    
+                        send_frames(conn, frame_slot, preview_slot)
                     except (BrokenPipeError, ConnectionResetError):
                         print(f"Client {addr} disconnected.")
                     finally:
+                        client_connected.clear()
+                        print(f"Dropped {frame_slot.dropped - dropped_at_start} stale frames during this connection.")
                         print("Waiting for a new video connection...")
 
         except KeyboardInterrupt:
             print("\nShutting down video server.")
         finally:
-            picam2.stop()
+            stop.set()
+            capture_thread.join(timeout=2.0)
+            source.stop()
             print("Video server has been shut down.")
 
 if __name__ == "__main__":